@@ -56,6 +56,7 @@ INSTALLED_APPS = [
     'rest_framework_simplejwt.token_blacklist',
     'corsheaders',
     'django_filters',
+    'channels',
     
     # Local apps
     'users.apps.UsersConfig',
@@ -71,6 +72,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.replicas.ReplicaStickinessMiddleware',
 ]
 
 ROOT_URLCONF = 'config.urls'
@@ -91,6 +93,53 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'config.wsgi.application'
+ASGI_APPLICATION = 'config.asgi.application'
+
+# Channel layer used to fan live bus positions out to WebSocket clients.
+# The in-memory layer only reaches clients of the same process; set
+# CHANNEL_REDIS_URL to share positions between workers.
+if os.getenv('CHANNEL_REDIS_URL'):
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {'hosts': [os.getenv('CHANNEL_REDIS_URL')]},
+        },
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer',
+        },
+    }
+
+# Cache shared by the features that keep state between requests (token
+# versions, access scopes, rosters, model versions, ETA estimates, replica
+# stickiness). The local-memory cache is per process, so it only works with a
+# single worker; set CACHE_REDIS_URL when running several, or CACHE_DIR for a
+# file-based cache when they all run on one host, and WEB_CONCURRENCY to the
+# number of worker processes so `manage.py check` can tell. Read replicas
+# always need a shared cache.
+WEB_CONCURRENCY = int(os.getenv('WEB_CONCURRENCY', '1'))
+if os.getenv('CACHE_REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('CACHE_REDIS_URL'),
+        },
+    }
+elif os.getenv('CACHE_DIR'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv('CACHE_DIR'),
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+    }
 
 
 # Database
@@ -103,6 +152,39 @@ DATABASES = {
     }
 }
 
+# Read replicas, e.g. DATABASE_REPLICAS=replica1.sqlite3,replica2.sqlite3 (kept
+# up to date with `manage.py sync_replicas`); see core/replicas.py
+for index, name in enumerate(filter(None, os.getenv('DATABASE_REPLICAS', '').split(',')), start=1):
+    DATABASES[f'replica{index}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': name if os.path.isabs(name) else os.path.join(BASE_DIR, name),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['core.replicas.ReplicaRouter']
+
+# SQLite write concurrency; see core/writer.py and `manage.py bench_writes`
+SQLITE_WRITES = {
+    'PRAGMAS': {  # applied to every new SQLite connection
+        'journal_mode': 'WAL',  # readers do not block the writer and vice versa
+        'synchronous': 'NORMAL',  # no fsync per commit; safe in WAL mode
+        'busy_timeout': 5000,  # ms to wait for the write lock before "database is locked"
+    },
+    # Run ping batches and attendance bulk posts through one writer thread per process
+    'SINGLE_WRITER': os.getenv('SQLITE_SINGLE_WRITER', 'True') == 'True',
+    'MAX_BATCH': 64,  # writes committed together
+    'MAX_WAIT': 0,  # seconds to wait for more writes to join a batch (they also queue up during a commit)
+    'TIMEOUT': 30,  # seconds a request waits for its write before getting 503
+    'RETRY_AFTER': 5,  # Retry-After seconds sent with that 503
+}
+
+READ_REPLICAS = {
+    'DATABASES': [alias for alias in DATABASES if alias != 'default'],
+    'STICKY_SECONDS': int(os.getenv('REPLICA_STICKY_SECONDS', '10')),  # read from the primary after a write
+    'CACHE': 'default',  # must be shared by every worker
+    'PRIMARY_ENDPOINTS': [],  # e.g. ['attendancerecord', 'route-students']
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -146,7 +228,7 @@ AUTH_USER_MODEL = 'users.User'
 # Rest Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.ClaimsJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -156,7 +238,7 @@ REST_FRAMEWORK = {
         'rest_framework.filters.SearchFilter',
         'rest_framework.filters.OrderingFilter',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'core.pagination.OptionalCountPagination',
     'PAGE_SIZE': 20,
 }
 
@@ -179,6 +261,117 @@ SIMPLE_JWT = {
     'JTI_CLAIM': 'jti',
 }
 
+# Request users are built from token claims; see users/authentication.py
+TOKEN_AUTH = {
+    'CACHE': 'default',  # must be shared by every worker, or revocations stay local
+    'VERSION_TIMEOUT': 300,  # seconds a cached token version is trusted
+    'USER_CACHE_SIZE': 1024,  # user rows kept per process
+    'USER_CACHE_TTL': 60,  # seconds
+}
+
+# Blacklisted refresh tokens are checked in memory, then in the database; see users/revocation.py
+TOKEN_REVOCATION = {
+    'CACHE': 'default',
+    'PRUNE_INTERVAL': 300,  # seconds between dropping expired ids from memory
+    'PRUNE_BATCH_SIZE': 1000,  # rows deleted per batch by prune_tokens
+}
+
+# Full-text search for students, routes and buses; see core/search.py
+SEARCH_INDEX = {
+    'BACKEND': 'core.search.FTS5SearchBackend',  # None falls back to LIKE searches
+    'OPTIONS': {},
+    'BATCH_SIZE': 2000,  # rows written per statement when rebuilding
+    'RANK_LIMIT': 1000,  # searches with more matches are ordered by id instead of relevance
+}
+
+# Conditional-GET response cache of the bus, route and assignment endpoints;
+# see core/caching.py
+RESPONSE_CACHE = {
+    'ENABLED': True,
+    'CACHE': 'default',  # shared cache holding the model versions behind the ETags
+    'VERSION_TIMEOUT': 60,  # seconds a model version is trusted before it is recomputed
+    'MAX_ENTRIES': 256,  # cached responses per endpoint and process
+    'MAX_BYTES': 4 * 1024 * 1024,  # serialized size per endpoint and process
+    # Per endpoint overrides, keyed '<basename>-list' or '<basename>-detail'
+    'ENDPOINTS': {
+        'bus-list': {'MAX_ENTRIES': 64},
+        'route-list': {'MAX_ENTRIES': 64},
+        'studentrouteassignment-list': {'MAX_ENTRIES': 512, 'MAX_BYTES': 16 * 1024 * 1024},
+    },
+}
+
+# GPS ping ingestion: pings are queued in memory and written in batches
+LOCATION_BUFFER = {
+    'WRITE_BEHIND': os.getenv('LOCATION_WRITE_BEHIND', 'True') == 'True',
+    'MAX_PENDING': 1000,  # flush as soon as this many pings are queued
+    'FLUSH_INTERVAL': 1.0,  # seconds between background flushes
+    'BATCH_SIZE': 500,
+}
+
+# Raw ping retention; older pings are rolled up by `manage.py compact_locations`
+LOCATION_RETENTION = {
+    'RAW_DAYS': 7,
+    'WINDOW_MINUTES': 60,  # pings compacted per transaction
+    'BATCH_SIZE': 1000,  # rows per DELETE statement
+    'TRIP_GAP_MINUTES': 15,  # a longer gap between pings starts a new trip
+}
+
+# Last known bus positions, served to the bus and route endpoints without
+# database reads. Use 'core.positions.CachePositionBackend' with
+# OPTIONS {'cache': '<alias>'} to share positions between workers.
+POSITION_STORE = {
+    'BACKEND': 'core.positions.LocalPositionBackend',
+    'OPTIONS': {},
+    'STALE_AFTER': 60,  # seconds before a position is flagged as stale
+    'EVICT_AFTER': 3600,  # seconds without a fix before a bus is dropped
+}
+
+# Arrival time estimates per route stop, recomputed from incoming pings
+ETA_ENGINE = {
+    'DEFAULT_SPEED_KMH': 20.0,  # used when a route has no distance/duration
+    'MIN_MOVING_SPEED_KMH': 5.0,  # below this the route's average speed is used
+    'SMOOTHING': 0.3,  # weight of each observed segment travel time
+    'TICK_INTERVAL': 0.0,  # minimum seconds between recomputations
+    'HISTORY_DAYS': 14,  # stop events used to seed segment travel times
+    'CACHE': 'default',  # estimates are published here for the other workers
+    'RESULT_TIMEOUT': 600,  # seconds a published estimate is kept
+}
+
+# In-memory index of route stops for nearest-stop and nearby-bus queries,
+# reloaded from the database every MAX_AGE seconds in each process
+STOP_INDEX = {
+    'CELL_DEGREES': 0.01,
+    'MAX_AGE': 60,
+}
+
+# Radius of the geofence around each route stop used to detect arrivals
+GEOFENCE = {
+    'RADIUS_M': 50,
+}
+
+# Route rosters (`/api/v1/routes/<id>/students/`) cached per route and
+# invalidated when assignments, students or their users change
+ROUTE_ROSTER = {
+    'CACHE': 'default',
+    'TIMEOUT': 3600,
+}
+
+# Per-user access scopes (the students, routes and buses parents and bus
+# staff may see), cached and dropped whenever the underlying links change
+ACCESS_SCOPE = {
+    'CACHE': 'default',
+    'TIMEOUT': 900,
+}
+
+# Bulk student import (`POST /api/v1/students/import/`, `manage.py import_students`)
+STUDENT_IMPORT = {
+    'WORKERS': None,  # password hashing processes of import_students, defaults to the CPU count
+    'UPLOAD_WORKERS': 2,  # password hashing threads of an upload through the API
+    'BATCH_SIZE': 1000,  # rows inserted per transaction
+    'MAX_UPLOAD_ROWS': 50000,  # larger files go through the management command
+    'MAX_UPLOAD_PASSWORDS': 100,  # as do uploads with more passwords to hash
+}
+
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = True  # For development only
 CORS_ALLOW_CREDENTIALS = True
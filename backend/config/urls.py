@@ -3,11 +3,11 @@ URL configuration for config project.
 """
 from django.contrib import admin
 from django.urls import path, include
-from rest_framework_simplejwt.views import (
-    TokenRefreshView,
-    TokenVerifyView,
+from rest_framework_simplejwt.views import TokenVerifyView
+from users.views import (
+    CustomTokenObtainPairView, CustomTokenRefreshView, UserRegistrationView, UserProfileView, LogoutView,
+    ChangePasswordView
 )
-from users.views import CustomTokenObtainPairView, UserRegistrationView, UserProfileView, LogoutView, ChangePasswordView
 
 urlpatterns = [
     # Admin site
@@ -16,7 +16,7 @@ urlpatterns = [
     # Authentication
     path('api/auth/register/', UserRegistrationView.as_view(), name='register'),
     path('api/auth/login/', CustomTokenObtainPairView.as_view(), name='token_obtain_pair'),
-    path('api/auth/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('api/auth/refresh/', CustomTokenRefreshView.as_view(), name='token_refresh'),
     path('api/auth/verify/', TokenVerifyView.as_view(), name='token_verify'),
     path('api/auth/logout/', LogoutView.as_view(), name='logout'),
     path('api/auth/change-password/', ChangePasswordView.as_view(), name='change_password'),
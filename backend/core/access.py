@@ -0,0 +1,223 @@
+"""
+Per-user access scopes.
+
+Administrators and teachers see everything. Parents only see their children
+and the routes and buses that carry them, students only themselves and their
+own routes and buses; bus staff only see the buses and routes of their
+current ``StaffAssignment`` rows and the students assigned to those routes.
+Any other role sees nothing. A user's scope (sets of
+student, route and bus ids) is computed once per day and cached, so scoping
+a list is a plain ``IN`` filter on an indexed column and costs no extra
+query. Cached scopes are dropped by bumping a generation number whenever
+parent links, staff or student assignments, or routes change. A user's own
+role is part of the cache key instead, so saving a user never drops the
+scopes of everyone else.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Route, StaffAssignment, Student, StudentRouteAssignment
+from .replicas import use_primary
+
+DEFAULTS = {
+    'CACHE': 'default',
+    'TIMEOUT': 900,
+}
+
+DIMENSIONS = ('student', 'route', 'bus')
+# Roles that see every record; any role not listed here or given a scope
+# below sees nothing.
+UNRESTRICTED_ROLES = ('admin', 'teacher')
+GENERATION_KEY = 'access-scope-generation'
+
+
+def get_access_settings():
+    return {**DEFAULTS, **getattr(settings, 'ACCESS_SCOPE', {})}
+
+
+def get_cache():
+    return caches[get_access_settings()['CACHE']]
+
+
+class AccessScope:
+    """
+    The student, route and bus ids a user may see, or no restriction at all.
+
+    ``preference`` orders the dimensions used to filter a queryset that can
+    be restricted several ways: parents are scoped by student first, staff
+    by route first.
+    """
+
+    def __init__(self, students=None, routes=None, buses=None, preference=DIMENSIONS):
+        self.ids = {'student': students, 'route': routes, 'bus': buses}
+        self.preference = preference
+
+    @classmethod
+    def unrestricted(cls):
+        return cls()
+
+    @property
+    def is_unrestricted(self):
+        return all(ids is None for ids in self.ids.values())
+
+    def allows(self, dimension, pk):
+        ids = self.ids[dimension]
+        return ids is None or pk in ids
+
+    def allows_object(self, **pks):
+        """
+        Whether an object linked to the given ``student``/``route``/``bus``
+        ids is in scope: every restricted dimension given must allow its id,
+        and at least one must be given.
+        """
+        if self.is_unrestricted:
+            return True
+        restricted = [
+            dimension for dimension in DIMENSIONS
+            if pks.get(dimension) is not None and self.ids[dimension] is not None
+        ]
+        return bool(restricted) and all(pks[dimension] in self.ids[dimension] for dimension in restricted)
+
+    def apply(self, queryset, fields):
+        """
+        Restrict ``queryset`` through the first dimension in ``fields``
+        (a dict of dimension to lookup) that this scope restricts.
+        Querysets that cannot be restricted are emptied.
+        """
+        if self.is_unrestricted or fields is None:
+            return queryset
+        for dimension in self.preference:
+            if dimension in fields and self.ids[dimension] is not None:
+                return queryset.filter(**{f'{fields[dimension]}__in': self.ids[dimension]})
+        return queryset.none()
+
+    def to_cache(self):
+        return {
+            'ids': {dimension: None if ids is None else sorted(ids) for dimension, ids in self.ids.items()},
+            'preference': self.preference,
+        }
+
+    @classmethod
+    def from_cache(cls, value):
+        ids = {dimension: None if pks is None else frozenset(pks) for dimension, pks in value['ids'].items()}
+        return cls(ids['student'], ids['route'], ids['bus'], preference=tuple(value['preference']))
+
+
+def rider_scope(students):
+    """
+    Scope over the given students and the routes and buses that carry them.
+    """
+    rides = StudentRouteAssignment.objects.filter(student_id__in=students, is_active=True)
+    routes, buses = set(), set()
+    for route_id, bus_id in rides.values_list('route_id', 'route__bus_id'):
+        routes.add(route_id)
+        if bus_id is not None:
+            buses.add(bus_id)
+    return AccessScope(students, frozenset(routes), frozenset(buses), preference=('student', 'route', 'bus'))
+
+
+def parent_scope(user):
+    return rider_scope(frozenset(Student.objects.filter(parents=user).values_list('pk', flat=True)))
+
+
+def student_scope(user):
+    return rider_scope(frozenset(Student.objects.filter(user=user).values_list('pk', flat=True)))
+
+
+def active_staff_assignments(user, day):
+    return StaffAssignment.objects.filter(staff=user, valid_from__lte=day).filter(
+        Q(valid_until__isnull=True) | Q(valid_until__gte=day)
+    )
+
+
+def staff_scope(user, day):
+    buses, routes, whole_buses = set(), set(), set()
+    for bus_id, route_id in active_staff_assignments(user, day).values_list('bus_id', 'route_id'):
+        buses.add(bus_id)
+        if route_id is None:
+            whole_buses.add(bus_id)
+        else:
+            routes.add(route_id)
+    if whole_buses:
+        routes.update(Route.objects.filter(bus_id__in=whole_buses).values_list('pk', flat=True))
+    students = set()
+    if routes:
+        students.update(
+            StudentRouteAssignment.objects.filter(route_id__in=routes, is_active=True)
+            .values_list('student_id', flat=True)
+        )
+    return AccessScope(
+        frozenset(students), frozenset(routes), frozenset(buses), preference=('route', 'bus', 'student')
+    )
+
+
+def compute_access_scope(user, day=None):
+    if not (user and user.is_authenticated):
+        return AccessScope(frozenset(), frozenset(), frozenset())
+    if user.is_staff or user.role in UNRESTRICTED_ROLES:
+        return AccessScope.unrestricted()
+    if user.role == 'parent':
+        return parent_scope(user)
+    if user.role == 'student':
+        return student_scope(user)
+    if user.role == 'bus_staff':
+        return staff_scope(user, day or timezone.localdate())
+    return AccessScope(frozenset(), frozenset(), frozenset())
+
+
+def new_generation():
+    # Time based, so a generation lost from the cache is never reused.
+    return int(time.time() * 1000)
+
+
+def get_access_scope(user):
+    """
+    Return the cached ``AccessScope`` of a user for today; staff
+    assignments are dated, so scopes are cached per day.
+    """
+    if not (user and user.is_authenticated) or user.is_staff or user.role == 'admin':
+        return compute_access_scope(user)
+    cache = get_cache()
+    day = timezone.localdate()
+    generation = cache.get_or_set(GENERATION_KEY, new_generation, None)
+    key = f'access-scope:{generation}:{day.isoformat()}:{user.pk}:{user.role}'
+    cached = cache.get(key)
+    if cached is not None:
+        return AccessScope.from_cache(cached)
+    with use_primary():
+        scope = compute_access_scope(user, day)
+    cache.set(key, scope.to_cache(), get_access_settings()['TIMEOUT'])
+    return scope
+
+
+def invalidate_access_scopes():
+    """
+    Drop every cached scope by moving to a new generation.
+    """
+    cache = get_cache()
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, new_generation(), None)
+
+
+class ScopedQuerysetMixin:
+    """
+    Restricts a viewset's queryset to the requesting user's access scope.
+
+    ``scope_fields`` maps the dimensions 'student', 'route' and 'bus' to
+    lookups on the viewset's model; ``None`` leaves the viewset unscoped.
+    """
+    scope_fields = None
+
+    def get_access_scope(self):
+        if not hasattr(self.request, '_access_scope'):
+            self.request._access_scope = get_access_scope(self.request.user)
+        return self.request._access_scope
+
+    def get_queryset(self):
+        return self.get_access_scope().apply(super().get_queryset(), self.scope_fields)
@@ -1,12 +1,12 @@
 from django.contrib import admin
-from .models import Student, Bus, Route, StudentRouteAssignment, AttendanceRecord
+from .models import Student, Bus, BusLocation, Route, StudentRouteAssignment, StaffAssignment, AttendanceRecord
 
 @admin.register(Student)
 class StudentAdmin(admin.ModelAdmin):
     list_display = ('student_id', 'user', 'grade', 'emergency_contact')
     list_filter = ('grade', 'created_at')
     search_fields = ('student_id', 'user__first_name', 'user__last_name', 'user__email')
-    raw_id_fields = ('user',)
+    raw_id_fields = ('user', 'parents')
     date_hierarchy = 'created_at'
 
 @admin.register(Bus)
@@ -16,6 +16,13 @@ class BusAdmin(admin.ModelAdmin):
     search_fields = ('bus_number', 'driver_name', 'driver_contact')
     date_hierarchy = 'created_at'
 
+@admin.register(BusLocation)
+class BusLocationAdmin(admin.ModelAdmin):
+    list_display = ('bus', 'latitude', 'longitude', 'speed', 'recorded_at')
+    list_filter = ('bus',)
+    raw_id_fields = ('bus',)
+    date_hierarchy = 'recorded_at'
+
 class StudentRouteAssignmentInline(admin.TabularInline):
     model = StudentRouteAssignment
     extra = 1
@@ -38,6 +45,14 @@ class StudentRouteAssignmentAdmin(admin.ModelAdmin):
     raw_id_fields = ('student', 'route')
     date_hierarchy = 'assigned_date'
 
+@admin.register(StaffAssignment)
+class StaffAssignmentAdmin(admin.ModelAdmin):
+    list_display = ('staff', 'bus', 'route', 'valid_from', 'valid_until')
+    list_filter = ('valid_from', 'bus')
+    search_fields = ('staff__first_name', 'staff__last_name', 'staff__email', 'bus__bus_number', 'route__name')
+    raw_id_fields = ('staff', 'bus', 'route')
+    date_hierarchy = 'valid_from'
+
 @admin.register(AttendanceRecord)
 class AttendanceRecordAdmin(admin.ModelAdmin):
     list_display = ('student', 'date', 'status', 'route', 'recorded_by')
@@ -0,0 +1,111 @@
+"""
+Bulk recording of attendance.
+
+A roll call is validated row by row without touching the database, every
+referenced student and route is then checked with one query per table, and
+the valid rows are written with a single batched INSERT ... ON CONFLICT on
+(student, date), so resubmitting a roll call updates the day's records
+instead of failing on the unique constraint. The upsert bypasses model
+signals, so the attendance summaries are refreshed here for the batch.
+"""
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from .models import AttendanceRecord, Route, Student
+from .serializers import AttendanceEntrySerializer
+from .summaries import refresh_summaries
+
+CREATED = 'created'
+UPDATED = 'updated'
+FAILED = 'failed'
+
+UPDATE_FIELDS = ['status', 'route', 'notes', 'recorded_by', 'updated_at']
+
+
+def upsert_attendance(rows, recorded_by=None, batch_size=500, scope=None):
+    """
+    Create or update one attendance record per row and return an outcome
+    per row, in order: ``{'index', 'status', 'id'}`` for written rows and
+    ``{'index', 'status': 'failed', 'errors'}`` for rejected ones. Rows
+    outside ``scope`` (an ``AccessScope``), if given, are rejected.
+    """
+    outcomes = [None] * len(rows)
+    entries = {}
+    serializer = AttendanceEntrySerializer()
+    for index, row in enumerate(rows):
+        try:
+            entry = serializer.run_validation(row)
+        except ValidationError as error:
+            outcomes[index] = failure(index, error.detail)
+            continue
+        key = (entry['student'], entry['date'])
+        if key in entries:
+            outcomes[index] = failure(index, {"non_field_errors": [
+                f"Duplicate of row {entries[key][0]} for the same student and date"
+            ]})
+            continue
+        entries[key] = (index, entry)
+
+    student_ids = {student_id for student_id, _ in entries}
+    route_ids = {entry['route'] for _, entry in entries.values() if entry.get('route') is not None}
+    grades = dict(Student.objects.filter(pk__in=student_ids).values_list('pk', 'grade'))
+    known_routes = set(Route.objects.filter(pk__in=route_ids).values_list('pk', flat=True)) if route_ids else set()
+    for key, (index, entry) in list(entries.items()):
+        errors = {}
+        if entry['student'] not in grades:
+            errors['student'] = [f"Invalid pk \"{entry['student']}\" - object does not exist."]
+        if entry.get('route') is not None and entry['route'] not in known_routes:
+            errors['route'] = [f"Invalid pk \"{entry['route']}\" - object does not exist."]
+        if not errors and scope is not None and not scope.allows_object(
+            student=entry['student'], route=entry.get('route')
+        ):
+            errors['non_field_errors'] = ["You are not assigned to this student or route."]
+        if errors:
+            outcomes[index] = failure(index, errors)
+            del entries[key]
+
+    if entries:
+        student_ids = {student_id for student_id, _ in entries}
+        dates = {day for _, day in entries}
+        existing = AttendanceRecord.objects.filter(student_id__in=student_ids, date__in=dates)
+        with transaction.atomic():
+            before = {
+                (student_id, day): route_id
+                for student_id, day, route_id in existing.values_list('student_id', 'date', 'route_id')
+                if (student_id, day) in entries
+            }
+            AttendanceRecord.objects.bulk_create(
+                [
+                    AttendanceRecord(
+                        student_id=entry['student'],
+                        date=entry['date'],
+                        status=entry['status'],
+                        route_id=entry.get('route'),
+                        notes=entry.get('notes'),
+                        recorded_by=recorded_by,
+                    )
+                    for _, entry in entries.values()
+                ],
+                batch_size=batch_size,
+                update_conflicts=True,
+                unique_fields=['student', 'date'],
+                update_fields=UPDATE_FIELDS,
+            )
+            # SQLite does not return primary keys from an upsert; read them back.
+            ids = {(student_id, day): pk for pk, student_id, day in existing.values_list('pk', 'student_id', 'date')}
+            touched = [
+                {'student_id': student_id, 'grade': grades[student_id], 'route_id': route_id, 'date': day}
+                for (student_id, day), route_id in before.items()
+            ]
+            touched.extend(
+                {'student_id': student_id, 'grade': grades[student_id], 'route_id': entry.get('route'), 'date': day}
+                for (student_id, day), (_, entry) in entries.items()
+            )
+            refresh_summaries(touched, batch_size=batch_size)
+        for key, (index, _) in entries.items():
+            outcomes[index] = {'index': index, 'status': UPDATED if key in before else CREATED, 'id': ids.get(key)}
+    return outcomes
+
+
+def failure(index, errors):
+    return {'index': index, 'status': FAILED, 'errors': errors}
@@ -0,0 +1,240 @@
+"""
+Conditional-GET response cache for list and detail endpoints.
+
+A cached response is keyed on the endpoint, its query string and the
+requester's access scope, and validated by the versions of the models it is
+built from. A model's version is its ``updated_at`` high-water mark and row
+count, kept in the Django cache and recomputed with one aggregate query
+after a save or delete, so ETags agree across processes and restarts. The
+cache has to be shared between worker processes for a save in one to
+invalidate the others (see ``core.checks``); versions also expire after
+``VERSION_TIMEOUT`` seconds, which bounds how stale a response can get when
+it is not, or when rows change without signals.
+
+A request whose ``If-None-Match`` matches is answered with 304 before any
+queryset is evaluated or anything serialized; other hits reuse the cached
+data. Each endpoint keeps its entries in its own in-process LRU, capped by
+entry count and size (see ``RESPONSE_CACHE``). Views can overlay live data
+(bus positions) on cached data with ``overlay_cached_data``.
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Count, Max
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from .positions import get_position_store
+from .replicas import use_primary
+
+DEFAULTS = {
+    'ENABLED': True,
+    'CACHE': 'default',  # holds model versions
+    'VERSION_TIMEOUT': 60,
+    'MAX_ENTRIES': 256,
+    'MAX_BYTES': 4 * 1024 * 1024,
+    'ENDPOINTS': {},  # per endpoint overrides of MAX_ENTRIES and MAX_BYTES
+}
+
+
+def get_response_cache_settings():
+    return {**DEFAULTS, **getattr(settings, 'RESPONSE_CACHE', {})}
+
+
+def get_cache():
+    return caches[get_response_cache_settings()['CACHE']]
+
+
+def version_key(model):
+    return f'response-version:{model._meta.label_lower}'
+
+
+def model_versions(models):
+    """
+    Return ``{label: version}`` for ``models``, computing missing versions
+    from the database.
+    """
+    cache = get_cache()
+    keys = {version_key(model): model for model in models}
+    versions = cache.get_many(list(keys))
+    missing = {}
+    for key, model in keys.items():
+        if key not in versions:
+            mark = model._default_manager.using(DEFAULT_DB_ALIAS).aggregate(
+                updated=Max('updated_at'), rows=Count('pk')
+            )
+            updated = mark['updated'].isoformat() if mark['updated'] else '-'
+            missing[key] = versions[key] = f"{updated}/{mark['rows']}"
+    if missing:
+        cache.set_many(missing, get_response_cache_settings()['VERSION_TIMEOUT'])
+    return {keys[key]._meta.label_lower: version for key, version in versions.items()}
+
+
+def invalidate_model_version(model):
+    """
+    Drop a model's version once the current transaction commits, so the
+    next request recomputes it from committed data.
+    """
+    transaction.on_commit(lambda: get_cache().delete(version_key(model)))
+
+
+class LRUStore:
+    """
+    Entries of one endpoint, evicted least recently used first once there
+    are more than ``max_entries`` or they take more than ``max_bytes``.
+    """
+
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        if entry['size'] > self.max_bytes:
+            return
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.size -= previous['size']
+            self.entries[key] = entry
+            self.size += entry['size']
+            while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= evicted['size']
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(endpoint):
+    store = _stores.get(endpoint)
+    if store is None:
+        with _stores_lock:
+            store = _stores.get(endpoint)
+            if store is None:
+                config = get_response_cache_settings()
+                limits = {**config, **config['ENDPOINTS'].get(endpoint, {})}
+                store = _stores[endpoint] = LRUStore(limits['MAX_ENTRIES'], limits['MAX_BYTES'])
+    return store
+
+
+def clear_response_caches():
+    with _stores_lock:
+        for store in _stores.values():
+            store.clear()
+
+
+def fingerprint(*parts):
+    return hashlib.sha1(json.dumps(parts, sort_keys=True, cls=DjangoJSONEncoder).encode()).hexdigest()
+
+
+def overlay_positions(data, bus_id_of, with_position):
+    """
+    Refill the bus positions of cached response data (a page, a list or a
+    single object) from the position store.
+
+    ``bus_id_of(item)`` names an item's bus and ``with_position(item,
+    position)`` returns a copy of the item showing that position. The token
+    changes whenever one of the positions is replaced by a newer fix.
+    """
+    if isinstance(data, dict) and isinstance(data.get('results'), list):
+        items = data['results']
+    elif isinstance(data, list):
+        items = data
+    else:
+        items = [data]
+    bus_ids = [bus_id_of(item) for item in items]
+    positions = get_position_store().get_many([bus_id for bus_id in bus_ids if bus_id is not None])
+    overlaid = [with_position(item, positions.get(bus_id)) for item, bus_id in zip(items, bus_ids)]
+    token = fingerprint(sorted((bus_id, position['recorded_at']) for bus_id, position in positions.items()))
+    if isinstance(data, dict) and isinstance(data.get('results'), list):
+        return {**data, 'results': overlaid}, token
+    if isinstance(data, list):
+        return overlaid, token
+    return overlaid[0], token
+
+
+class CachedResponseMixin:
+    """
+    Serves ``list`` and ``retrieve`` from the response cache.
+
+    ``cache_models`` lists every model whose rows appear in the responses;
+    saving or deleting any of them invalidates the endpoint.
+    """
+    cache_models = ()
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response('list', super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response('detail', super().retrieve, request, *args, **kwargs)
+
+    def cache_scope_key(self):
+        """
+        Identify what the requester may see: their access scope if the view
+        is scoped, otherwise the user (or everything, for administrators).
+        """
+        if hasattr(self, 'get_access_scope'):
+            scope = self.get_access_scope()
+            return 'all' if scope.is_unrestricted else fingerprint(scope.to_cache())
+        user = self.request.user
+        return 'all' if user.is_staff or user.role == 'admin' else f'user:{user.pk}'
+
+    def overlay_cached_data(self, data):
+        """
+        Return ``(data, token)``: the response data with live values filled
+        in, and a string identifying those values for the ETag.
+        """
+        return data, ''
+
+    def cached_response(self, kind, handler, request, *args, **kwargs):
+        if not get_response_cache_settings()['ENABLED']:
+            return handler(request, *args, **kwargs)
+        endpoint = f'{self.basename}-{kind}'
+        query = sorted(request.query_params.lists())
+        key = fingerprint(request.get_host(), request.path, query, self.cache_scope_key())
+        validator = fingerprint(key, model_versions(self.cache_models))
+        store = get_store(endpoint)
+        entry = store.get(key)
+        if entry is None or entry['validator'] != validator:
+            # Entries outlive replica lag, so they are built from the primary.
+            with use_primary():
+                response = handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            data = json.loads(json.dumps(response.data, cls=DjangoJSONEncoder))
+            entry = {'validator': validator, 'data': data, 'size': len(json.dumps(data))}
+            store.set(key, entry)
+
+        data, token = self.overlay_cached_data(entry['data'])
+        etag = f'W/"{fingerprint(validator, token)}"'
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(data)
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
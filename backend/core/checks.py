@@ -0,0 +1,67 @@
+"""
+System checks for deployments running several worker processes.
+
+Token versions, access scopes, rosters, response cache model versions and
+ETA estimates are kept in a Django cache so that a change made by one worker
+reaches the others. A local-memory (or dummy) cache is private to its
+process, which is only correct with a single worker; ``WEB_CONCURRENCY``
+says how many there are. Replica stickiness always needs a shared cache:
+the write and the reads that follow it can reach different workers, and a
+replica setup is a multi-worker deployment in all but local tests.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Error, Tags, register
+
+from users.authentication import get_token_auth_settings
+
+from .access import get_access_settings
+from .caching import get_response_cache_settings
+from .eta import get_eta_settings
+from .replicas import get_replica_settings, get_replicas
+from .rosters import get_roster_settings
+
+# Settings whose 'CACHE' has to be shared between worker processes.
+SHARED_CACHES = (
+    ('TOKEN_AUTH', get_token_auth_settings),
+    ('ACCESS_SCOPE', get_access_settings),
+    ('ROUTE_ROSTER', get_roster_settings),
+    ('RESPONSE_CACHE', get_response_cache_settings),
+    ('ETA_ENGINE', get_eta_settings),
+)
+
+
+def is_process_local(alias):
+    return isinstance(caches[alias], (LocMemCache, DummyCache))
+
+
+@register(Tags.caches)
+def check_shared_caches(app_configs, **kwargs):
+    workers = getattr(settings, 'WEB_CONCURRENCY', 1)
+    if workers <= 1:
+        return []
+    errors = []
+    for name, get_settings in SHARED_CACHES:
+        alias = get_settings()['CACHE']
+        if is_process_local(alias):
+            errors.append(Error(
+                f"{name}['CACHE'] ('{alias}') is local to each process, but WEB_CONCURRENCY is {workers}.",
+                hint="Point it at a cache shared by every worker, e.g. set CACHE_REDIS_URL or CACHE_DIR.",
+                id='core.E001',
+            ))
+    return errors
+
+
+@register(Tags.caches, Tags.database)
+def check_replica_cache(app_configs, **kwargs):
+    alias = get_replica_settings()['CACHE']
+    if get_replicas() and is_process_local(alias):
+        return [Error(
+            f"READ_REPLICAS['CACHE'] ('{alias}') is local to each process, so a write on one worker does not "
+            "keep the user's reads on the primary on the others.",
+            hint="Point it at a cache shared by every worker, e.g. set CACHE_REDIS_URL or CACHE_DIR.",
+            id='core.E002',
+        )]
+    return []
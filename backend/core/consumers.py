@@ -0,0 +1,46 @@
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncWebsocketConsumer
+
+from .access import get_access_scope
+from .live import bus_group, route_group
+
+
+class PositionConsumer(AsyncWebsocketConsumer):
+    """
+    Streams live positions for a single route or bus.
+
+    Connect to ``ws/routes/<route_id>/positions/`` or
+    ``ws/buses/<bus_id>/positions/`` with ``?token=<access token>``. Each
+    message is a JSON object with bus, latitude, longitude, speed, heading
+    and recorded_at.
+    """
+
+    async def connect(self):
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated:
+            await self.close(code=4401)
+            return
+        kwargs = self.scope['url_route']['kwargs']
+        if 'route_id' in kwargs:
+            dimension, pk, self.group_name = 'route', kwargs['route_id'], route_group(kwargs['route_id'])
+        else:
+            dimension, pk, self.group_name = 'bus', kwargs['bus_id'], bus_group(kwargs['bus_id'])
+        access = await database_sync_to_async(get_access_scope)(user)
+        if not access.allows(dimension, int(pk)):
+            self.group_name = None
+            await self.close(code=4403)
+            return
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, code):
+        group_name = getattr(self, 'group_name', None)
+        if group_name:
+            await self.channel_layer.group_discard(group_name, self.channel_name)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        # The channel is push-only; client messages are ignored.
+        pass
+
+    async def position_update(self, event):
+        await self.send(text_data=event['text'])
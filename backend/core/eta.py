@@ -0,0 +1,366 @@
+"""
+Arrival time estimates for every remaining stop of every active route.
+
+The stops of all active routes are packed into flat NumPy arrays, grouped
+route by route. Each tick takes the latest position of every bus whose
+route has changed since the previous tick and computes, in one vectorised
+pass, the next stop of each route and the arrival time at each remaining
+stop: the distance to the next stop at the bus's current speed plus the
+learned travel times of the following segments. Results are cached per
+route, so the API only ever reads them.
+
+Segment travel times start from the average arrival-to-arrival times in
+recent ``StopEvent`` history, falling back to the route's nominal speed
+(``Route.distance`` / ``Route.estimated_duration``), and are refined with an
+exponentially weighted average every time the geofence engine sees a bus
+arrive at consecutive stops.
+
+Each process computes estimates from the pings it ingests and publishes
+them to the ``CACHE`` alias, so with several workers (and a shared cache)
+every worker answers with the newest estimate of a route. Learned segment
+times stay per process: every worker starts from the same history and only
+the refinements since then differ.
+"""
+import threading
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+EARTH_RADIUS_KM = 6371.0088
+
+DEFAULTS = {
+    'DEFAULT_SPEED_KMH': 20.0,
+    'MIN_MOVING_SPEED_KMH': 5.0,
+    'SMOOTHING': 0.3,
+    'TICK_INTERVAL': 0.0,
+    'HISTORY_DAYS': 14,
+    'CACHE': 'default',
+    'RESULT_TIMEOUT': 600,
+}
+
+
+def get_eta_settings():
+    return {**DEFAULTS, **getattr(settings, 'ETA_ENGINE', {})}
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """
+    Vectorised great-circle distance; all arguments are arrays in degrees.
+    """
+    lat1, lon1, lat2, lon2 = (np.radians(value) for value in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+class RouteTopology:
+    """
+    Flat arrays describing the geocoded stops of all active routes.
+    """
+
+    def __init__(self, routes, stops, learned, default_speed_kmh):
+        self.route_ids = np.array([route['id'] for route in routes], dtype=np.int64)
+        self.route_bus = np.array([route['bus_id'] for route in routes], dtype=np.int64)
+        self.route_index = {route['id']: index for index, route in enumerate(routes)}
+        self.routes_by_bus = {}
+        for index, route in enumerate(routes):
+            self.routes_by_bus.setdefault(route['bus_id'], []).append(index)
+
+        speeds = []
+        for route in routes:
+            hours = route['estimated_duration'].total_seconds() / 3600 if route['estimated_duration'] else 0
+            speeds.append(route['distance'] / hours if hours > 0 and route['distance'] > 0 else default_speed_kmh)
+        self.route_speed = np.array(speeds, dtype=float)
+
+        stops = [stop for stop in stops if stop['route_id'] in self.route_index]
+        stops.sort(key=lambda stop: (self.route_index[stop['route_id']], stop['sequence']))
+        self.stop_route = np.array([self.route_index[stop['route_id']] for stop in stops], dtype=np.int64)
+        self.stop_sequence = np.array([stop['sequence'] for stop in stops], dtype=np.int64)
+        self.stop_names = [stop['name'] for stop in stops]
+        self.stop_lat = np.array([stop['latitude'] for stop in stops], dtype=float)
+        self.stop_lon = np.array([stop['longitude'] for stop in stops], dtype=float)
+
+        count = len(stops)
+        self.route_start = np.searchsorted(self.stop_route, np.arange(len(routes)), side='left')
+        self.route_end = np.searchsorted(self.stop_route, np.arange(len(routes)), side='right')
+        is_first = np.ones(count, dtype=bool)
+        is_first[1:] = self.stop_route[1:] != self.stop_route[:-1]
+        self.is_first = is_first
+        self.is_last = np.ones(count, dtype=bool)
+        self.is_last[:-1] = is_first[1:]
+
+        # Length of and travel time along the segment ending at each stop.
+        segment_km = np.zeros(count)
+        if count > 1:
+            segment_km[1:] = haversine_km(
+                self.stop_lat[:-1], self.stop_lon[:-1], self.stop_lat[1:], self.stop_lon[1:]
+            )
+        segment_km[is_first] = 0.0
+        self.segment_km = segment_km
+        self.segment_seconds = segment_km / self.route_speed[self.stop_route] * 3600
+        for index in range(count):
+            key = (int(self.route_ids[self.stop_route[index]]), int(self.stop_sequence[index]))
+            if key in learned and not is_first[index]:
+                self.segment_seconds[index] = learned[key]
+
+    def __len__(self):
+        return len(self.stop_lat)
+
+
+class ETAEngine:
+    """
+    Keeps the latest bus positions and the cached ETAs derived from them.
+    """
+
+    def __init__(self, default_speed_kmh=20.0, min_moving_speed_kmh=5.0, smoothing=0.3, tick_interval=0.0,
+                 history_days=14, cache=None, result_timeout=600):
+        self.default_speed_kmh = default_speed_kmh
+        self.min_moving_speed_kmh = min_moving_speed_kmh
+        self.smoothing = smoothing
+        self.tick_interval = tick_interval
+        self.history_days = history_days
+        self.cache = cache
+        self.result_timeout = result_timeout
+        self._lock = threading.RLock()
+        self._topology = None
+        self._positions = {}
+        self._dirty = set()
+        self._results = {}
+        self._learned = None
+        self._last_tick = 0.0
+
+    def invalidate(self):
+        """
+        Forget the route topology; it is rebuilt on the next tick.
+        """
+        with self._lock:
+            self._topology = None
+
+    def topology(self):
+        with self._lock:
+            if self._topology is None:
+                self._topology = self._build_topology()
+                self._results = {
+                    route_id: result for route_id, result in self._results.items()
+                    if route_id in self._topology.route_index
+                }
+                self._dirty = set(self._positions)
+            return self._topology
+
+    def _build_topology(self):
+        from .models import Route, RouteStop
+
+        routes = list(
+            Route.objects.filter(is_active=True, bus__isnull=False)
+            .values('id', 'bus_id', 'distance', 'estimated_duration')
+            .order_by('id')
+        )
+        stops = list(
+            RouteStop.objects.filter(
+                route__is_active=True, route__bus__isnull=False,
+                latitude__isnull=False, longitude__isnull=False,
+            ).values('route_id', 'sequence', 'name', 'latitude', 'longitude')
+        )
+        if self._learned is None:
+            self._learned = self._load_history()
+        return RouteTopology(routes, stops, self._learned, self.default_speed_kmh)
+
+    def _load_history(self):
+        """
+        Average arrival-to-arrival time of every segment over the last
+        ``history_days`` days of stop events.
+        """
+        from .models import StopEvent
+
+        if not self.history_days:
+            return {}
+        arrivals = (
+            StopEvent.objects.filter(
+                event_type=StopEvent.ARRIVAL,
+                date__gte=timezone.localdate() - timedelta(days=self.history_days),
+            )
+            .order_by('bus_id', 'occurred_at')
+            .values_list('bus_id', 'route_id', 'stop_sequence', 'occurred_at')
+        )
+        totals = {}
+        previous = None
+        for arrival in arrivals.iterator(chunk_size=5000):
+            bus_id, route_id, sequence, occurred_at = arrival
+            if previous is not None and previous[:3] == (bus_id, route_id, sequence - 1):
+                seconds = (occurred_at - previous[3]).total_seconds()
+                total = totals.setdefault((route_id, sequence), [0.0, 0])
+                total[0] += seconds
+                total[1] += 1
+            previous = arrival
+        return {key: total / count for key, (total, count) in totals.items()}
+
+    def observe(self, locations):
+        """
+        Record the newest position of each bus and tick if due.
+        """
+        with self._lock:
+            for location in locations:
+                current = self._positions.get(location.bus_id)
+                if current is None or location.recorded_at >= current[3]:
+                    self._positions[location.bus_id] = (
+                        location.latitude, location.longitude, location.speed, location.recorded_at
+                    )
+                    self._dirty.add(location.bus_id)
+            if time.monotonic() - self._last_tick >= self.tick_interval:
+                self.tick()
+
+    def observe_segment(self, route_id, sequence, seconds):
+        """
+        Blend an observed travel time for the segment ending at stop
+        ``sequence`` of ``route_id`` into the learned segment times.
+        """
+        if seconds <= 0:
+            return
+        with self._lock:
+            if self._learned is None:
+                self._learned = self._load_history()
+            key = (route_id, sequence)
+            previous = self._learned.get(key)
+            if previous is None and self._topology is not None:
+                index = self._stop_index(route_id, sequence)
+                if index is not None:
+                    previous = float(self._topology.segment_seconds[index])
+            value = seconds if previous is None else (1 - self.smoothing) * previous + self.smoothing * seconds
+            self._learned[key] = value
+            if self._topology is not None:
+                index = self._stop_index(route_id, sequence)
+                if index is not None:
+                    self._topology.segment_seconds[index] = value
+
+    def _stop_index(self, route_id, sequence):
+        topology = self._topology
+        route = topology.route_index.get(route_id)
+        if route is None:
+            return None
+        start, end = topology.route_start[route], topology.route_end[route]
+        matches = np.nonzero(topology.stop_sequence[start:end] == sequence)[0]
+        return int(start + matches[0]) if len(matches) else None
+
+    def tick(self):
+        """
+        Recompute the ETAs of every route whose bus moved since the last tick.
+        """
+        with self._lock:
+            self._last_tick = time.monotonic()
+            topology = self.topology()
+            dirty, self._dirty = self._dirty, set()
+            route_indexes = sorted({
+                route for bus_id in dirty for route in topology.routes_by_bus.get(bus_id, ())
+                if topology.route_end[route] > topology.route_start[route]
+            })
+            if not route_indexes:
+                return 0
+            self._compute(topology, np.array(route_indexes, dtype=np.int64))
+            return len(route_indexes)
+
+    def _compute(self, topology, routes):
+        count = len(routes)
+        bus_ids = topology.route_bus[routes]
+        positions = [self._positions[int(bus_id)] for bus_id in bus_ids]
+        bus_lat = np.array([position[0] for position in positions], dtype=float)
+        bus_lon = np.array([position[1] for position in positions], dtype=float)
+        bus_speed = np.array(
+            [np.nan if position[2] is None else position[2] for position in positions], dtype=float
+        )
+        speed = np.where(
+            np.nan_to_num(bus_speed) >= self.min_moving_speed_kmh, bus_speed, topology.route_speed[routes]
+        )
+
+        # Every stop of the selected routes, and which selected route it belongs to.
+        starts = topology.route_start[routes]
+        lengths = topology.route_end[routes] - starts
+        owner = np.repeat(np.arange(count), lengths)
+        stops = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        distance = haversine_km(bus_lat[owner], bus_lon[owner], topology.stop_lat[stops], topology.stop_lon[stops])
+
+        # Nearest stop per route; stops are grouped by route so the first
+        # entry of each group after sorting by distance is the nearest.
+        order = np.lexsort((distance, owner))
+        first = np.searchsorted(owner[order], np.arange(count), side='left')
+        nearest = order[first]
+
+        # If the bus is already between the nearest stop and the following
+        # one, the following stop is the next one it will reach.
+        has_following = ~topology.is_last[stops[nearest]]
+        following = np.minimum(nearest + 1, len(stops) - 1)
+        passed = has_following & (distance[following] < topology.segment_km[stops[following]])
+        upcoming = np.where(passed, following, nearest)
+
+        cumulative = np.cumsum(topology.segment_seconds[stops])
+        first_leg = distance[upcoming] / speed * 3600
+        seconds = first_leg[owner] + cumulative - cumulative[upcoming][owner]
+        remaining = np.arange(len(stops)) >= upcoming[owner]
+
+        self._store_results(topology, routes, stops, owner, seconds, remaining, positions, bus_ids)
+
+    def _store_results(self, topology, routes, stops, owner, seconds, remaining, positions, bus_ids):
+        shared = {}
+        for offset, route in enumerate(routes.tolist()):
+            route_id = int(topology.route_ids[route])
+            recorded_at = positions[offset][3]
+            # A position or speed that is not a finite number gives no usable ETA.
+            selected = np.nonzero((owner == offset) & remaining & np.isfinite(seconds))[0]
+            self._results[route_id] = {
+                'route': route_id,
+                'bus': int(bus_ids[offset]),
+                'position_recorded_at': recorded_at,
+                'stops': [
+                    {
+                        'sequence': int(topology.stop_sequence[stops[index]]),
+                        'name': topology.stop_names[stops[index]],
+                        'eta_seconds': round(float(seconds[index]), 1),
+                        'eta': recorded_at + timedelta(seconds=float(seconds[index])),
+                    }
+                    for index in selected
+                ],
+            }
+            shared[result_key(route_id)] = self._results[route_id]
+        if self.cache is not None:
+            caches[self.cache].set_many(shared, self.result_timeout)
+
+    def get(self, route_id):
+        """
+        Return the newest estimate of a route computed by this or, through
+        the cache, any other process.
+        """
+        result = self._results.get(route_id)
+        if self.cache is None:
+            return result
+        shared = caches[self.cache].get(result_key(route_id))
+        if result is None or (shared is not None and shared['position_recorded_at'] > result['position_recorded_at']):
+            return shared
+        return result
+
+
+def result_key(route_id):
+    return f'route-eta:{route_id}'
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_eta_engine():
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                config = get_eta_settings()
+                _engine = ETAEngine(
+                    default_speed_kmh=config['DEFAULT_SPEED_KMH'],
+                    min_moving_speed_kmh=config['MIN_MOVING_SPEED_KMH'],
+                    smoothing=config['SMOOTHING'],
+                    tick_interval=config['TICK_INTERVAL'],
+                    history_days=config['HISTORY_DAYS'],
+                    cache=config['CACHE'],
+                    result_timeout=config['RESULT_TIMEOUT'],
+                )
+    return _engine
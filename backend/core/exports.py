@@ -0,0 +1,111 @@
+"""
+Streaming exports of attendance records.
+
+Rows are read as plain tuples through a chunked cursor with the student,
+route and recorder names joined in the same query, and written out one
+chunk at a time, so memory use stays flat whatever the size of the export.
+"""
+import csv
+import io
+import json
+
+from .models import AttendanceRecord
+
+CHUNK_SIZE = 5000
+
+# (column name, lookup on AttendanceRecord)
+COLUMNS = [
+    ('id', 'id'),
+    ('date', 'date'),
+    ('status', 'status'),
+    ('student', 'student_id'),
+    ('student_id', 'student__student_id'),
+    ('first_name', 'student__user__first_name'),
+    ('last_name', 'student__user__last_name'),
+    ('grade', 'student__grade'),
+    ('route', 'route_id'),
+    ('route_name', 'route__name'),
+    ('bus_number', 'route__bus__bus_number'),
+    ('notes', 'notes'),
+    ('recorded_by', 'recorded_by__email'),
+]
+HEADER = [name for name, _ in COLUMNS]
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def filter_attendance(records=None, start=None, end=None, route=None, grade=None, student=None):
+    """
+    Narrow attendance records to a date range (inclusive) and optionally a
+    route, grade or student.
+    """
+    records = AttendanceRecord.objects.all() if records is None else records
+    if start:
+        records = records.filter(date__gte=start)
+    if end:
+        records = records.filter(date__lte=end)
+    if route:
+        records = records.filter(route_id=route)
+    if grade:
+        records = records.filter(student__grade=grade)
+    if student:
+        records = records.filter(student_id=student)
+    return records
+
+
+def attendance_rows(records, chunk_size=CHUNK_SIZE):
+    """
+    Yield one tuple per record, in ``COLUMNS`` order, oldest day first.
+    """
+    rows = records.order_by('date', 'id').values_list(*[lookup for _, lookup in COLUMNS])
+    return rows.iterator(chunk_size=chunk_size)
+
+
+def chunked(rows, chunk_size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def csv_chunks(rows, chunk_size=CHUNK_SIZE):
+    """
+    Yield the CSV text of ``rows`` (header first), one string per chunk.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(HEADER)
+    yield buffer.getvalue()
+    for chunk in chunked(rows, chunk_size):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(chunk)
+        yield buffer.getvalue()
+
+
+def ndjson_chunks(rows, chunk_size=CHUNK_SIZE):
+    """
+    Yield one JSON object per row, one string per chunk of lines.
+    """
+    for chunk in chunked(rows, chunk_size):
+        yield ''.join(
+            json.dumps(dict(zip(HEADER, row)), default=str) + '\n'
+            for row in chunk
+        )
+
+
+def export_attendance(records, output='csv', chunk_size=CHUNK_SIZE):
+    """
+    Stream ``records`` as ``output`` ('csv' or 'ndjson') text chunks.
+    """
+    rows = attendance_rows(records, chunk_size=chunk_size)
+    if output == 'ndjson':
+        return ndjson_chunks(rows, chunk_size=chunk_size)
+    return csv_chunks(rows, chunk_size=chunk_size)
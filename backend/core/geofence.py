@@ -0,0 +1,168 @@
+"""
+Stop arrival and departure detection.
+
+Every geocoded stop of an active route is a circular geofence. For each bus
+the engine remembers which fence (if any) it was last inside; a batch of
+pings is resolved against all of the bus's fences at once with NumPy and
+only the transitions are turned into ``StopEvent`` rows, so history never
+has to be rescanned. The same code path backfills a whole day of pings.
+"""
+import threading
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+from .eta import get_eta_engine, haversine_km
+from .models import RouteStop, StopEvent
+
+DEFAULTS = {
+    'RADIUS_M': 50,
+}
+
+
+def get_geofence_settings():
+    return {**DEFAULTS, **getattr(settings, 'GEOFENCE', {})}
+
+
+class BusFences:
+    """
+    Geofences of every stop on the active routes served by one bus.
+    """
+
+    def __init__(self, stops):
+        self.keys = [(stop['route_id'], stop['sequence']) for stop in stops]
+        self.names = [stop['name'] for stop in stops]
+        self.latitude = np.array([stop['latitude'] for stop in stops], dtype=float)
+        self.longitude = np.array([stop['longitude'] for stop in stops], dtype=float)
+        self.index = {key: position for position, key in enumerate(self.keys)}
+
+
+class GeofenceEngine:
+    """
+    Incremental per-bus state machine emitting stop arrival/departure events.
+    """
+
+    def __init__(self, radius_m=50, feed_eta=True):
+        self.radius_km = radius_m / 1000
+        self.feed_eta = feed_eta
+        self._lock = threading.RLock()
+        self._fences = None
+        self._inside = {}
+        self._last_seen = {}
+        self._last_arrival = {}
+
+    def invalidate(self):
+        with self._lock:
+            self._fences = None
+
+    def fences(self):
+        with self._lock:
+            if self._fences is None:
+                stops = (
+                    RouteStop.objects.filter(
+                        route__is_active=True, route__bus__isnull=False,
+                        latitude__isnull=False, longitude__isnull=False,
+                    )
+                    .order_by('route_id', 'sequence')
+                    .values('route__bus_id', 'route_id', 'sequence', 'name', 'latitude', 'longitude')
+                )
+                by_bus = {}
+                for stop in stops:
+                    by_bus.setdefault(stop['route__bus_id'], []).append(stop)
+                self._fences = {bus_id: BusFences(bus_stops) for bus_id, bus_stops in by_bus.items()}
+            return self._fences
+
+    def process(self, locations):
+        """
+        Return the unsaved ``StopEvent`` rows caused by a batch of
+        ``BusLocation`` instances.
+        """
+        by_bus = {}
+        for location in locations:
+            by_bus.setdefault(location.bus_id, []).append(location)
+        events = []
+        for bus_id, pings in by_bus.items():
+            pings.sort(key=lambda location: location.recorded_at)
+            events.extend(self.process_track(
+                bus_id,
+                [location.recorded_at for location in pings],
+                np.array([location.latitude for location in pings], dtype=float),
+                np.array([location.longitude for location in pings], dtype=float),
+            ))
+        return events
+
+    def process_track(self, bus_id, times, latitude, longitude):
+        """
+        Advance one bus's state machine over pings sorted by time. Pings no
+        newer than the last one processed for the bus are ignored.
+        """
+        with self._lock:
+            fences = self.fences().get(bus_id)
+            last_seen = self._last_seen.get(bus_id)
+            if last_seen is not None:
+                fresh = [position for position, moment in enumerate(times) if moment > last_seen]
+                if len(fresh) < len(times):
+                    times = [times[position] for position in fresh]
+                    latitude, longitude = latitude[fresh], longitude[fresh]
+            if fences is None or not times:
+                return []
+            self._last_seen[bus_id] = times[-1]
+
+            distance = haversine_km(
+                latitude[:, None], longitude[:, None], fences.latitude[None, :], fences.longitude[None, :]
+            )
+            nearest = distance.argmin(axis=1)
+            within = distance[np.arange(len(times)), nearest] <= self.radius_km
+            inside = np.where(within, nearest, -1)
+
+            current = fences.index.get(self._inside.get(bus_id), -1)
+            states = np.concatenate(([current], inside))
+            changes = np.nonzero(states[1:] != states[:-1])[0]
+
+            events = []
+            for position in changes.tolist():
+                moment = times[position]
+                before, after = int(states[position]), int(states[position + 1])
+                if before >= 0:
+                    events.append(self._event(bus_id, fences, before, StopEvent.DEPARTURE, moment))
+                if after >= 0:
+                    events.append(self._event(bus_id, fences, after, StopEvent.ARRIVAL, moment))
+                    self._record_arrival(bus_id, fences.keys[after], moment)
+            final = int(states[-1])
+            self._inside[bus_id] = fences.keys[final] if final >= 0 else None
+            return events
+
+    def _event(self, bus_id, fences, position, event_type, moment):
+        route_id, sequence = fences.keys[position]
+        return StopEvent(
+            bus_id=bus_id,
+            route_id=route_id,
+            stop_sequence=sequence,
+            stop_name=fences.names[position],
+            event_type=event_type,
+            occurred_at=moment,
+            date=timezone.localdate(moment),
+        )
+
+    def _record_arrival(self, bus_id, key, moment):
+        previous = self._last_arrival.get(bus_id)
+        self._last_arrival[bus_id] = (key, moment)
+        if not self.feed_eta or previous is None:
+            return
+        (route_id, sequence), arrived_at = previous
+        if key == (route_id, sequence + 1):
+            get_eta_engine().observe_segment(route_id, key[1], (moment - arrived_at).total_seconds())
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_geofence_engine():
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = GeofenceEngine(radius_m=get_geofence_settings()['RADIUS_M'])
+    return _engine
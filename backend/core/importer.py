@@ -0,0 +1,243 @@
+"""
+Bulk import of students.
+
+Rows are validated up front, with email, student id and route uniqueness
+checked in one query per table for the whole file. Passwords are hashed in
+parallel, since a single PBKDF2 hash takes a sizeable fraction of a second:
+across a process pool by the ``import_students`` command, and on a few
+threads for uploads, which must not start processes from a web worker
+(PBKDF2 releases the GIL). ``User``, ``Student`` and
+``StudentRouteAssignment`` rows are inserted with ``bulk_create`` one batch
+per transaction. The bulk inserts do not send ``post_save``, so the profile
+signal of ``users`` is not involved: the student rows are created here.
+"""
+import csv
+import io
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from .access import invalidate_access_scopes
+from .caching import invalidate_model_version
+from .models import Route, Student, StudentRouteAssignment
+from .rosters import invalidate_rosters
+from .search import update_index
+from .serializers import StudentImportRowSerializer
+
+User = get_user_model()
+
+DEFAULTS = {
+    'WORKERS': None,  # os.cpu_count()
+    'UPLOAD_WORKERS': 2,
+    'BATCH_SIZE': 1000,
+    'MAX_UPLOAD_ROWS': 50000,
+    'MAX_UPLOAD_PASSWORDS': 100,
+}
+
+STUDENT_FIELDS = ('student_id', 'grade', 'date_of_birth', 'address', 'emergency_contact')
+ASSIGNMENT_FIELDS = ('pickup_point', 'pickup_time', 'drop_point', 'drop_time')
+
+
+def get_import_settings():
+    return {**DEFAULTS, **getattr(settings, 'STUDENT_IMPORT', {})}
+
+
+def setup_worker():
+    # Spawned (rather than forked) workers start without Django configured.
+    django.setup()
+
+
+def hash_password(password):
+    return make_password(password)
+
+
+def hash_passwords(passwords, workers=None, threads=False):
+    """
+    Hash ``passwords`` in order, spreading the work over ``workers``
+    processes, or threads with ``threads``. Missing passwords become
+    unusable ones without a pool trip.
+    """
+    hashes = [make_password(None) if not password else None for password in passwords]
+    pending = [index for index, password in enumerate(passwords) if password]
+    workers = workers or os.cpu_count() or 1
+    if len(pending) < 2 or workers == 1:
+        for index in pending:
+            hashes[index] = hash_password(passwords[index])
+        return hashes
+    if threads:
+        pool = ThreadPoolExecutor(max_workers=workers)
+    else:
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=setup_worker)
+    chunksize = max(1, len(pending) // (workers * 4))
+    with pool:
+        results = pool.map(hash_password, [passwords[index] for index in pending], chunksize=chunksize)
+        for index, hashed in zip(pending, results):
+            hashes[index] = hashed
+    return hashes
+
+
+def read_csv(data):
+    """
+    Yield the rows of a CSV file (bytes, text or a file object) as dicts
+    with blank cells dropped.
+    """
+    if isinstance(data, bytes):
+        data = io.StringIO(data.decode('utf-8-sig'))
+    elif isinstance(data, str):
+        data = io.StringIO(data)
+    for row in csv.DictReader(data):
+        yield {
+            key.strip(): value.strip()
+            for key, value in row.items()
+            if key and value is not None and value.strip()
+        }
+
+
+def existing_values(queryset, field, values, batch_size=5000):
+    """
+    Return the subset of ``values`` present in ``field``, querying in
+    batches to stay under the database's bound parameter limit.
+    """
+    found = set()
+    for offset in range(0, len(values), batch_size):
+        batch = values[offset:offset + batch_size]
+        found.update(queryset.filter(**{f'{field}__in': batch}).values_list(field, flat=True))
+    return found
+
+
+def validate_rows(rows):
+    """
+    Return ``(entries, errors)``: validated rows as ``(row_number, data)``
+    and ``{'row', 'errors'}`` for rejected ones. Row numbers start at 1.
+    """
+    entries = []
+    errors = []
+    emails = {}
+    student_ids = {}
+    # One serializer validates every row, as ListSerializer does with its
+    # child, instead of deep-copying its fields once per row.
+    serializer = StudentImportRowSerializer()
+    for number, row in enumerate(rows, start=1):
+        try:
+            data = serializer.run_validation(row)
+        except ValidationError as error:
+            errors.append({'row': number, 'errors': error.detail})
+            continue
+        data['email'] = User.objects.normalize_email(data['email'])
+        duplicate = {}
+        if data['email'] in emails:
+            duplicate['email'] = [f"Duplicate of row {emails[data['email']]}"]
+        if data['student_id'] in student_ids:
+            duplicate['student_id'] = [f"Duplicate of row {student_ids[data['student_id']]}"]
+        if duplicate:
+            errors.append({'row': number, 'errors': duplicate})
+            continue
+        emails[data['email']] = number
+        student_ids[data['student_id']] = number
+        entries.append((number, data))
+
+    taken_emails = existing_values(User.objects.all(), 'email', list(emails))
+    taken_ids = existing_values(Student.objects.all(), 'student_id', list(student_ids))
+    route_ids = {data['route'] for _, data in entries if data.get('route')}
+    known_routes = set(Route.objects.filter(pk__in=route_ids).values_list('pk', flat=True)) if route_ids else set()
+    valid = []
+    for number, data in entries:
+        problems = {}
+        if data['email'] in taken_emails:
+            problems['email'] = ["A user with this email already exists."]
+        if data['student_id'] in taken_ids:
+            problems['student_id'] = ["A student with this student id already exists."]
+        if data.get('route') and data['route'] not in known_routes:
+            problems['route'] = [f"Invalid pk \"{data['route']}\" - object does not exist."]
+        if problems:
+            errors.append({'row': number, 'errors': problems})
+        else:
+            valid.append((number, data))
+    errors.sort(key=lambda error: error['row'])
+    return valid, errors
+
+
+def insert_batch(batch, hashes):
+    """
+    Insert the users, students and route assignments of one batch.
+    """
+    with transaction.atomic():
+        User.objects.bulk_create([
+            User(
+                email=data['email'], first_name=data['first_name'], last_name=data['last_name'],
+                phone_number=data.get('phone_number'), role='student', password=hashed,
+            )
+            for (_, data), hashed in zip(batch, hashes)
+        ])
+        user_ids = dict(
+            User.objects.filter(email__in=[data['email'] for _, data in batch]).values_list('email', 'pk')
+        )
+        Student.objects.bulk_create([
+            Student(user_id=user_ids[data['email']], **{field: data[field] for field in STUDENT_FIELDS})
+            for _, data in batch
+        ])
+        student_pks = dict(
+            Student.objects.filter(student_id__in=[data['student_id'] for _, data in batch])
+            .values_list('student_id', 'pk')
+        )
+        update_index('student', list(student_pks.values()))
+        assigned = [data for _, data in batch if data.get('route')]
+        if assigned:
+            StudentRouteAssignment.objects.bulk_create([
+                StudentRouteAssignment(
+                    student_id=student_pks[data['student_id']], route_id=data['route'],
+                    **{field: data[field] for field in ASSIGNMENT_FIELDS},
+                )
+                for data in assigned
+            ])
+    # Bulk inserts send no signals, so the search index is updated above and
+    # the affected rosters, scopes and cached responses are dropped here.
+    for model in (User, Student, StudentRouteAssignment):
+        invalidate_model_version(model)
+    routes = {data['route'] for _, data in batch if data.get('route')}
+    if routes:
+        invalidate_rosters(routes)
+        invalidate_access_scopes()
+
+
+def import_students(rows, batch_size=None, workers=None, threads=False, dry_run=False):
+    """
+    Validate and import student rows (dicts, see ``StudentImportRowSerializer``).
+    Invalid rows are skipped and reported; valid rows are imported even if
+    others fail. Passwords are hashed as by ``hash_passwords``. Returns
+    counts, per-row errors and timings.
+    """
+    config = get_import_settings()
+    batch_size = batch_size or config['BATCH_SIZE']
+    workers = workers or config['WORKERS']
+
+    started = time.monotonic()
+    valid, errors = validate_rows(rows)
+    validated = time.monotonic()
+    imported = 0
+    hashing = 0.0
+    if not dry_run and valid:
+        hashes = hash_passwords([data.get('password') for _, data in valid], workers=workers, threads=threads)
+        hashing = time.monotonic() - validated
+        for offset in range(0, len(valid), batch_size):
+            insert_batch(valid[offset:offset + batch_size], hashes[offset:offset + batch_size])
+            imported += len(valid[offset:offset + batch_size])
+    elapsed = time.monotonic() - started
+    return {
+        'rows': len(valid) + len(errors),
+        'imported': imported,
+        'failed': len(errors),
+        'dry_run': dry_run,
+        'seconds': round(elapsed, 2),
+        'validate_seconds': round(validated - started, 2),
+        'hash_seconds': round(hashing, 2),
+        'rows_per_second': round(imported / elapsed, 1) if elapsed and imported else 0.0,
+        'errors': errors,
+    }
@@ -0,0 +1,181 @@
+"""
+Write-behind ingestion of GPS pings.
+
+Pings are validated by the API, queued in memory and persisted in batches
+with ``bulk_create`` so that a burst of fixes from the whole fleet costs a
+handful of INSERT statements instead of one transaction per ping.
+"""
+import atexit
+import logging
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from .models import Bus, BusLocation
+from .signals import pings_received
+from .writer import WriteTimeout, write
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'WRITE_BEHIND': True,
+    'MAX_PENDING': 1000,
+    'FLUSH_INTERVAL': 1.0,
+    'BATCH_SIZE': 500,
+}
+
+
+def get_buffer_settings():
+    return {**DEFAULTS, **getattr(settings, 'LOCATION_BUFFER', {})}
+
+
+class LocationBuffer:
+    """
+    Thread-safe queue of unsaved ``BusLocation`` rows.
+
+    The buffer is flushed when it holds ``max_pending`` rows or every
+    ``flush_interval`` seconds by a daemon thread, whichever comes first.
+    """
+
+    def __init__(self, max_pending=1000, flush_interval=1.0, batch_size=500):
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._pending = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, locations):
+        """
+        Queue locations for persistence and return the number queued.
+        """
+        with self._lock:
+            self._pending.extend(locations)
+            full = len(self._pending) >= self.max_pending
+        if full:
+            self.flush()
+        else:
+            self._ensure_worker()
+        return len(locations)
+
+    def flush(self):
+        """
+        Persist everything queued so far and return the number of rows written.
+        """
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return 0
+            try:
+                return self._write(batch)
+            except WriteTimeout as error:
+                if error.cancelled:
+                    logger.error("Dropped %d bus locations after a flush timed out", len(batch))
+                else:
+                    logger.warning("Flush of %d bus locations timed out; they may still be written", len(batch))
+                return 0
+
+    def _write(self, batch):
+        """
+        Write a batch and return the number of rows written. A batch that
+        fails is split in halves, oldest first so each bus still ends on its
+        newest fix, until the rows that cannot be written are isolated and
+        dropped on their own.
+        """
+        try:
+            write(write_locations, batch, batch_size=self.batch_size)
+            return len(batch)
+        except WriteTimeout:
+            raise
+        except Exception:
+            if len(batch) == 1:
+                logger.exception("Dropped a bus location of bus %s that could not be written", batch[0].bus_id)
+                return 0
+        batch = sorted(batch, key=lambda location: location.recorded_at)
+        middle = len(batch) // 2
+        return self._write(batch[:middle]) + self._write(batch[middle:])
+
+    def _ensure_worker(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(
+                target=self._run, name='location-buffer', daemon=True
+            )
+            self._thread.start()
+
+    def _run(self):
+        while not self._wakeup.wait(self.flush_interval):
+            if not self._pending:
+                continue
+            close_old_connections()
+            self.flush()
+
+    def stop(self):
+        self._wakeup.set()
+        self.flush()
+
+
+def write_locations(locations, batch_size=500):
+    """
+    Insert locations in bulk and mirror each bus's newest fix onto
+    ``Bus.current_location`` with a single UPDATE, all or nothing.
+    """
+    latest = {}
+    for location in locations:
+        current = latest.get(location.bus_id)
+        if current is None or location.recorded_at >= current.recorded_at:
+            latest[location.bus_id] = location
+    buses = [
+        Bus(pk=bus_id, current_location=f"{loc.latitude:.6f},{loc.longitude:.6f}")
+        for bus_id, loc in latest.items()
+    ]
+    with transaction.atomic():
+        BusLocation.objects.bulk_create(locations, batch_size=batch_size)
+        Bus.objects.bulk_update(buses, ['current_location'], batch_size=batch_size)
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                config = get_buffer_settings()
+                _buffer = LocationBuffer(
+                    max_pending=config['MAX_PENDING'],
+                    flush_interval=config['FLUSH_INTERVAL'],
+                    batch_size=config['BATCH_SIZE'],
+                )
+                atexit.register(_buffer.stop)
+    return _buffer
+
+
+def ingest(locations, sender=None):
+    """
+    Accept a batch of unsaved ``BusLocation`` instances.
+
+    Listeners of ``pings_received`` are notified immediately; the rows
+    themselves are written behind unless write-behind is disabled.
+    """
+    if not locations:
+        return 0
+    config = get_buffer_settings()
+    if config['WRITE_BEHIND']:
+        get_buffer().add(locations)
+    else:
+        write(write_locations, locations, batch_size=config['BATCH_SIZE'])
+    pings_received.send(sender=sender or BusLocation, locations=locations)
+    return len(locations)
@@ -0,0 +1,77 @@
+"""
+Fan-out of live bus positions to WebSocket subscribers.
+
+Each accepted batch of pings is reduced to the newest fix per bus, that fix
+is serialized to JSON exactly once and the same text frame is pushed to the
+bus group and to the group of every active route the bus serves.
+"""
+import json
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Route
+
+
+def route_group(route_id):
+    return f'route_{route_id}'
+
+
+def bus_group(bus_id):
+    return f'bus_{bus_id}'
+
+
+def latest_per_bus(locations):
+    latest = {}
+    for location in locations:
+        current = latest.get(location.bus_id)
+        if current is None or location.recorded_at >= current.recorded_at:
+            latest[location.bus_id] = location
+    return latest
+
+
+def position_payload(location):
+    return {
+        'bus': location.bus_id,
+        'latitude': location.latitude,
+        'longitude': location.longitude,
+        'speed': location.speed,
+        'heading': location.heading,
+        'recorded_at': location.recorded_at,
+    }
+
+
+def routes_by_bus(bus_ids):
+    mapping = {}
+    routes = Route.objects.filter(bus_id__in=bus_ids, is_active=True).values_list('pk', 'bus_id')
+    for route_id, bus_id in routes:
+        mapping.setdefault(bus_id, []).append(route_id)
+    return mapping
+
+
+def publish_locations(locations):
+    """
+    Push the newest position of every bus in ``locations`` to its subscribers.
+    """
+    channel_layer = get_channel_layer()
+    if channel_layer is None or not locations:
+        return 0
+    latest = latest_per_bus(locations)
+    route_ids = routes_by_bus(latest.keys())
+
+    messages = []
+    for bus_id, location in latest.items():
+        text = json.dumps(position_payload(location), cls=DjangoJSONEncoder)
+        event = {'type': 'position.update', 'text': text}
+        messages.append((bus_group(bus_id), event))
+        for route_id in route_ids.get(bus_id, ()):
+            messages.append((route_group(route_id), event))
+
+    async_to_sync(_group_send_all)(channel_layer, messages)
+    return len(messages)
+
+
+async def _group_send_all(channel_layer, messages):
+    for group, event in messages:
+        await channel_layer.group_send(group, event)
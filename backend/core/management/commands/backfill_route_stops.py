@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.eta import get_eta_engine
+from core.geofence import get_geofence_engine
+from core.models import Route
+from core.spatial import get_stop_index
+
+
+class Command(BaseCommand):
+    help = (
+        "Create or correct the RouteStop rows of every route from Route.stops, for "
+        "routes saved before stops were mirrored or changed without sending signals."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--route', type=int, action='append', help="Only process this route id (repeatable)")
+
+    def handle(self, *args, **options):
+        routes = Route.objects.order_by('pk')
+        if options['route']:
+            routes = routes.filter(pk__in=options['route'])
+        changed = 0
+        total = 0
+        for route in routes.iterator():
+            with transaction.atomic():
+                _, updated = route.sync_route_stops()
+            changed += updated
+            total += 1
+        if changed:
+            # Other processes pick the rows up when their stop index expires.
+            get_stop_index().load()
+            get_eta_engine().invalidate()
+            get_geofence_engine().invalidate()
+        self.stdout.write(self.style.SUCCESS(f"Updated the stops of {changed} of {total} routes"))
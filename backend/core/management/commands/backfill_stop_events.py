@@ -0,0 +1,75 @@
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from core.geofence import GeofenceEngine, get_geofence_settings
+from core.models import BusLocation, StopEvent
+
+
+class Command(BaseCommand):
+    help = "Detect stop arrival and departure events from a day of stored pings."
+
+    def add_arguments(self, parser):
+        parser.add_argument('date', help="Service day to process (YYYY-MM-DD)")
+        parser.add_argument('--bus', type=int, action='append', help="Only process this bus id (repeatable)")
+        parser.add_argument(
+            '--replace', action='store_true',
+            help="Delete the day's existing events for the processed buses first",
+        )
+        parser.add_argument('--batch-size', type=int, default=5000, help="Pings fetched per chunk")
+
+    def handle(self, *args, **options):
+        day = parse_date(options['date'])
+        if day is None:
+            raise CommandError("date must be in YYYY-MM-DD format")
+        start = timezone.make_aware(datetime.combine(day, datetime.min.time()))
+        end = start + timedelta(days=1)
+
+        pings = BusLocation.objects.filter(recorded_at__gte=start, recorded_at__lt=end)
+        events = StopEvent.objects.filter(date=day)
+        if options['bus']:
+            pings = pings.filter(bus_id__in=options['bus'])
+            events = events.filter(bus_id__in=options['bus'])
+
+        engine = GeofenceEngine(radius_m=get_geofence_settings()['RADIUS_M'], feed_eta=False)
+        started = time.monotonic()
+        processed = 0
+        detected = []
+        track = []
+        bus_id = None
+        rows = pings.order_by('bus_id', 'recorded_at').values_list('bus_id', 'latitude', 'longitude', 'recorded_at')
+        for row in rows.iterator(chunk_size=options['batch_size']):
+            if row[0] != bus_id or len(track) >= options['batch_size']:
+                detected.extend(self._process(engine, bus_id, track))
+                track = []
+                bus_id = row[0]
+            track.append(row)
+            processed += 1
+        detected.extend(self._process(engine, bus_id, track))
+
+        with transaction.atomic():
+            if options['replace']:
+                events.delete()
+            StopEvent.objects.bulk_create(detected, batch_size=1000, ignore_conflicts=True)
+
+        elapsed = time.monotonic() - started
+        rate = processed / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {processed} pings into {len(detected)} stop events "
+            f"in {elapsed:.1f}s ({rate:,.0f} pings/s)"
+        ))
+
+    def _process(self, engine, bus_id, track):
+        if not track:
+            return []
+        return engine.process_track(
+            bus_id,
+            [row[3] for row in track],
+            np.array([row[1] for row in track], dtype=float),
+            np.array([row[2] for row in track], dtype=float),
+        )
@@ -0,0 +1,145 @@
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, transaction
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from core.attendance import upsert_attendance
+from core.ingestion import write_locations
+from core.models import Bus, BusLocation, Student
+from core.perfcheck import seed_fixture, test_database
+from core.writer import SingleWriter, get_writer_settings
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure write throughput with N concurrent writers in a throwaway SQLite "
+        "file database, each writer committing its own transactions ('direct') "
+        "versus all writes going through the single writer ('queued')."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--writers', type=int, nargs='+', default=[1, 4, 16],
+            help="Numbers of concurrent writers to measure (default: 1 4 16)",
+        )
+        parser.add_argument('--writes', type=int, default=50, help="Writes per writer (default: 50)")
+        parser.add_argument('--rows', type=int, default=10, help="Rows per write (default: 10)")
+        parser.add_argument(
+            '--workload', choices=['pings', 'attendance'], default='pings',
+            help="Write ping batches or attendance roll calls (default: pings)",
+        )
+        parser.add_argument(
+            '--pragma', action='append', default=[], metavar='NAME=VALUE',
+            help="Override a pragma of SQLITE_WRITES, e.g. --pragma synchronous=FULL (repeatable)",
+        )
+        parser.add_argument(
+            '--max-wait', type=float, default=get_writer_settings()['MAX_WAIT'],
+            help="Seconds the single writer waits for more writes to join a batch",
+        )
+        parser.add_argument(
+            '--mode', choices=['direct', 'queued'], action='append',
+            help="Only measure this mode (repeatable, default: both)",
+        )
+
+    def handle(self, *args, **options):
+        config = get_writer_settings()
+        pragmas = dict(config['PRAGMAS'])
+        for pragma in options['pragma']:
+            pragma_name, _, value = pragma.partition('=')
+            pragmas[pragma_name.strip()] = value.strip()
+        name = os.path.join(tempfile.mkdtemp(prefix='bench-writes-'), 'bench.sqlite3')
+        with override_settings(SQLITE_WRITES={**config, 'PRAGMAS': pragmas}), test_database(name=name):
+            if connection.vendor != 'sqlite':
+                self.stdout.write(self.style.WARNING("The default database is not SQLite"))
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA journal_mode')
+                journal_mode = cursor.fetchone()[0]
+            self.stdout.write(
+                f"{options['workload']}, {options['rows']} rows per write, journal_mode={journal_mode}, "
+                f"pragmas={pragmas}"
+            )
+            admin = seed_fixture(students=max(options['rows'] * 4, 20), buses=8, days=0)
+            self.bus_ids = list(Bus.objects.values_list('pk', flat=True))
+            self.student_ids = list(Student.objects.values_list('pk', flat=True))
+            self.admin = admin
+            self.stdout.write(
+                f"{'mode':<8} {'writers':>7} {'writes/s':>9} {'rows/s':>9} {'p50 ms':>8} {'p95 ms':>8} "
+                f"{'errors':>6} {'commits':>7}"
+            )
+            for mode in options['mode'] or ['direct', 'queued']:
+                for writers in options['writers']:
+                    self.measure(mode, writers, options)
+
+    def payload(self, workload, writer, number, rows):
+        if workload == 'pings':
+            now = timezone.now()
+            return write_locations, [
+                BusLocation(
+                    bus_id=random.choice(self.bus_ids), latitude=12.9 + random.random() / 100,
+                    longitude=77.6 + random.random() / 100, recorded_at=now,
+                )
+                for _ in range(rows)
+            ], {}
+        # A different day per write, so every roll call inserts new rows.
+        day = timezone.localdate() - timedelta(days=writer * 10000 + number + 1)
+        students = random.sample(self.student_ids, rows)
+        return upsert_attendance, [
+            {'student': student, 'date': day.isoformat(), 'status': 'present'} for student in students
+        ], {'recorded_by': self.admin}
+
+    def measure(self, mode, writers, options):
+        writer = None
+        if mode == 'queued':
+            writer = SingleWriter(max_batch=get_writer_settings()['MAX_BATCH'], max_wait=options['max_wait'])
+        latencies = []
+        errors = []
+        barrier = threading.Barrier(writers)
+
+        def work(index):
+            try:
+                barrier.wait()
+                for number in range(options['writes']):
+                    function, rows, kwargs = self.payload(options['workload'], index, number, options['rows'])
+                    started = time.perf_counter()
+                    try:
+                        if writer is None:
+                            with transaction.atomic():
+                                function(rows, **kwargs)
+                        else:
+                            writer.submit(function, rows, **kwargs).result()
+                    except OperationalError as error:
+                        errors.append(error)
+                        continue
+                    latencies.append(time.perf_counter() - started)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=work, args=(index,)) for index in range(writers)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        if writer is not None:
+            writer.stop()
+        commits = writer.batches if writer is not None else len(latencies)
+
+        latencies.sort()
+        p50 = statistics.median(latencies) * 1000 if latencies else 0
+        p95 = latencies[int(len(latencies) * 0.95) - 1] * 1000 if latencies else 0
+        self.stdout.write(
+            f"{mode:<8} {writers:>7} {len(latencies) / elapsed:>9.0f} "
+            f"{len(latencies) * options['rows'] / elapsed:>9.0f} {p50:>8.1f} {p95:>8.1f} "
+            f"{len(errors):>6} {commits:>7}"
+        )
+        if errors:
+            self.stdout.write(self.style.WARNING(f"    first error: {errors[0]}"))
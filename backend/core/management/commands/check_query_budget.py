@@ -0,0 +1,100 @@
+import logging
+from contextlib import nullcontext
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from core.caching import get_response_cache_settings
+from core.perfcheck import (
+    api_client, endpoint_url, fixture_users, get_endpoints, rolled_back, seed_fixture, test_database
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Request every list, detail and extra GET endpoint of the core API as an admin, "
+        "a parent and a bus staff member against a small and a large fixture in a "
+        "throwaway database, and fail if any request does not succeed, runs more "
+        "queries than its budget or more queries as data grows."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--budget', type=int, default=3,
+            help="Queries allowed per request unless the viewset sets query_budget (default: 3)",
+        )
+        parser.add_argument('--small', type=int, default=5, help="Students in the small fixture")
+        parser.add_argument('--large', type=int, default=40, help="Students in the large fixture")
+        parser.add_argument('--show-sql', action='store_true', help="Print the queries of failing endpoints")
+        parser.add_argument(
+            '--current-database', action='store_true',
+            help="Seed the current database in a rolled back transaction instead of a throwaway one (for tests)",
+        )
+
+    def handle(self, *args, **options):
+        with nullcontext() if options['current_database'] else test_database():
+            small = self.measure(options['small'])
+            large = self.measure(options['large'])
+
+        failures = []
+        large = {(role, name): result for role, name, *result in large}
+        for role, name, viewset, status_code, small_queries in small:
+            if (role, name) not in large:
+                continue
+            large_status, large_queries = large[role, name][1:]
+            budget = getattr(viewset, 'query_budget', options['budget'])
+            problems = []
+            if not (200 <= status_code < 300 and 200 <= large_status < 300):
+                problems.append(f"status {status_code}/{large_status}")
+            if len(large_queries) > budget:
+                problems.append(f"{len(large_queries)} queries > budget {budget}")
+            if len(large_queries) != len(small_queries):
+                problems.append(f"grows from {len(small_queries)} to {len(large_queries)} queries")
+            line = (
+                f"{name:<35} {role:<10} {large_status:>4} {len(small_queries):>4} {len(large_queries):>4} {budget:>4}"
+            )
+            if problems:
+                failures.append(f"{name} ({role})")
+                self.stdout.write(self.style.ERROR(f"{line}  {'; '.join(problems)}"))
+                if options['show_sql']:
+                    for query in large_queries:
+                        self.stdout.write(f"    {query['sql']}")
+            else:
+                self.stdout.write(line)
+
+        if failures:
+            raise CommandError(f"{len(failures)} request(s) failed or over their query budget: {', '.join(failures)}")
+        self.stdout.write(self.style.SUCCESS(f"All {len(small)} requests are within their query budget"))
+
+    def measure(self, students):
+        """
+        Seed a fixture with ``students`` students and return
+        ``(role, name, viewset, status, queries)`` per endpoint and user.
+        """
+        results = []
+        # Failing requests are reported by the check; keep them out of the log.
+        request_logger = logging.getLogger('django.request')
+        level = request_logger.level
+        request_logger.setLevel(logging.CRITICAL)
+        # Budgets are for building a response, not for replaying a cached one.
+        no_response_cache = override_settings(RESPONSE_CACHE={**get_response_cache_settings(), 'ENABLED': False})
+        try:
+            with no_response_cache, rolled_back():
+                admin = seed_fixture(students=students)
+                for role, user in fixture_users(admin).items():
+                    client = api_client(user)
+                    for name, viewset, kind, _ in get_endpoints():
+                        url = endpoint_url(name, viewset, kind, client)
+                        if url is None:
+                            continue
+                        # Warm per-process caches so only per-request queries are counted.
+                        client.get(url)
+                        with CaptureQueriesContext(connection) as context:
+                            response = client.get(url)
+                            if getattr(response, 'streaming', False):
+                                b''.join(response.streaming_content)
+                        results.append((role, name, viewset, response.status_code, context.captured_queries))
+        finally:
+            request_logger.setLevel(level)
+        return results
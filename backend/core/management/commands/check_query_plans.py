@@ -0,0 +1,150 @@
+import logging
+import re
+from contextlib import nullcontext
+from urllib.parse import urlencode
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from core.caching import get_response_cache_settings
+from core.perfcheck import (
+    api_client, endpoint_url, filter_params, fixture_users, get_endpoints, rolled_back, seed_fixture,
+    test_database,
+)
+
+# "SEARCH ..." looks rows up through an index and "SCAN ..." reads a table in
+# full, unless it walks an index ("USING INDEX") or the rowid in the order of a
+# LIMITed query without sorting. Such a walk is fine for an unfiltered page, but
+# with a selective filter it reads rows until enough match, which is every row
+# for a rare value.
+SCAN = re.compile(r'^SCAN (\w+)( USING (?:COVERING )?INDEX \w+)?$')
+TABLE_ALIAS = re.compile(r'"(\w+)" (T\d+)\b')
+LIMIT = re.compile(r'\bLIMIT \d+$')
+
+
+class Command(BaseCommand):
+    help = (
+        "Request every GET endpoint of the core API, and every list endpoint once per "
+        "filter, as an admin, a parent and a bus staff member against a seeded throwaway "
+        "database, run EXPLAIN QUERY PLAN on each SELECT they issue and fail if any "
+        "request does not succeed or reads a large table in full."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=300, help="Students in the fixture (default: 300)")
+        parser.add_argument('--days', type=int, default=5, help="Days of attendance in the fixture (default: 5)")
+        parser.add_argument(
+            '--min-rows', type=int, default=250,
+            help="Tables with at least this many rows in the fixture count as large (default: 250)",
+        )
+        parser.add_argument('--verbose-plans', action='store_true', help="Print every plan, not just failing ones")
+        parser.add_argument(
+            '--current-database', action='store_true',
+            help="Seed the current database in a rolled back transaction instead of a throwaway one (for tests)",
+        )
+
+    def handle(self, *args, **options):
+        request_logger = logging.getLogger('django.request')
+        level = request_logger.level
+        request_logger.setLevel(logging.CRITICAL)
+        try:
+            # Cached responses run no queries, so explain the ones behind them.
+            no_response_cache = override_settings(RESPONSE_CACHE={**get_response_cache_settings(), 'ENABLED': False})
+            database = nullcontext() if options['current_database'] else test_database()
+            with no_response_cache, database, rolled_back():
+                admin = seed_fixture(students=options['students'], days=options['days'])
+                with connection.cursor() as cursor:
+                    cursor.execute('ANALYZE')
+                large = self.large_tables(options['min_rows'])
+                self.stdout.write(f"Large tables: {', '.join(sorted(large))}")
+                failures = []
+                for role, user in fixture_users(admin).items():
+                    failures += self.check_plans(role, api_client(user), large, options['verbose_plans'])
+        finally:
+            request_logger.setLevel(level)
+
+        if failures:
+            raise CommandError(f"{len(failures)} request(s) failed or scan a large table: {', '.join(failures)}")
+        self.stdout.write(self.style.SUCCESS("Every request succeeded and none scans a large table"))
+
+    def large_tables(self, min_rows):
+        large = set()
+        with connection.cursor() as cursor:
+            for table in connection.introspection.table_names(cursor):
+                cursor.execute(f'SELECT COUNT(*) FROM (SELECT 1 FROM "{table}" LIMIT %s)', [min_rows])
+                if cursor.fetchone()[0] >= min_rows:
+                    large.add(table)
+        return large
+
+    def requests(self, client):
+        for name, viewset, kind, _ in get_endpoints():
+            url = endpoint_url(name, viewset, kind, client)
+            if url is None:
+                continue
+            yield name, url, False
+            if kind == 'list' and name.endswith('-list'):
+                rows = viewset.queryset.model._default_manager.all()
+                total = rows.count()
+                for params in filter_params(viewset):
+                    # A boolean, or any value matching most rows of the
+                    # fixture, does not narrow the scan, so walking the order
+                    # until the page is full is the right plan for it.
+                    selective = (
+                        all(value not in ('true', 'false') for value in params.values())
+                        and rows.filter(**params).count() * 2 < total
+                    )
+                    yield f"{name}?{urlencode(params)}", f"{url}?{urlencode(params)}", selective
+
+    def check_plans(self, role, client, large, verbose):
+        failures = []
+        for name, url, selective in self.requests(client):
+            # Warm per-process caches so only per-request queries are explained.
+            client.get(url)
+            statements = []
+
+            def record(execute, sql, params, many, context):
+                statements.append((sql, params))
+                return execute(sql, params, many, context)
+
+            with connection.execute_wrapper(record):
+                response = client.get(url)
+                if getattr(response, 'streaming', False):
+                    b''.join(response.streaming_content)
+
+            scans = []
+            for sql, params in statements:
+                if not sql.lstrip().upper().startswith('SELECT'):
+                    continue
+                aliases = dict((alias, table) for table, alias in TABLE_ALIAS.findall(sql))
+                with connection.cursor() as cursor:
+                    cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+                    plan = [row[3] for row in cursor.fetchall()]
+                sorts = any(step.startswith('USE TEMP B-TREE FOR') and 'ORDER BY' in step for step in plan)
+                for step in plan:
+                    match = SCAN.match(step)
+                    if not match or aliases.get(match.group(1), match.group(1)) not in large:
+                        continue
+                    walk = match.group(2) or (LIMIT.search(sql.rstrip()) and not sorts)
+                    if selective or not walk:
+                        scans.append((sql, plan))
+                        break
+                if verbose:
+                    self.stdout.write(f"{name}: {sql[:160]}")
+                    for step in plan:
+                        self.stdout.write(f"    {step}")
+
+            line = f"{name:<70} {role:<10} {response.status_code:>4} {len(statements):>3} statements"
+            if not 200 <= response.status_code < 300:
+                failures.append(f"{name} ({role})")
+                self.stdout.write(self.style.ERROR(f"{line}  failed"))
+            elif scans:
+                failures.append(f"{name} ({role})")
+                self.stdout.write(self.style.ERROR(f"{line}  full scan"))
+                for sql, plan in scans:
+                    self.stdout.write(f"    {sql}")
+                    for step in plan:
+                        self.stdout.write(f"        {step}")
+            else:
+                self.stdout.write(line)
+        return failures
@@ -0,0 +1,54 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.retention import compact_locations, get_retention_settings
+
+
+class Command(BaseCommand):
+    help = (
+        "Roll raw bus pings older than the retention window up into per-minute "
+        "and per-trip summaries, then delete them in bounded batches."
+    )
+
+    def add_arguments(self, parser):
+        config = get_retention_settings()
+        parser.add_argument(
+            '--keep-days', type=int, default=config['RAW_DAYS'],
+            help=f"Days of raw pings to keep (default: {config['RAW_DAYS']})",
+        )
+        parser.add_argument(
+            '--window-minutes', type=int, default=config['WINDOW_MINUTES'],
+            help=f"Minutes of pings compacted per transaction (default: {config['WINDOW_MINUTES']})",
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=config['BATCH_SIZE'],
+            help=f"Rows per DELETE statement and per fetch (default: {config['BATCH_SIZE']})",
+        )
+        parser.add_argument(
+            '--trip-gap-minutes', type=int, default=config['TRIP_GAP_MINUTES'],
+            help=f"Gap between pings that starts a new trip (default: {config['TRIP_GAP_MINUTES']})",
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        total = 0
+        windows = compact_locations(
+            keep_days=options['keep_days'],
+            window_minutes=options['window_minutes'],
+            batch_size=options['batch_size'],
+            trip_gap_minutes=options['trip_gap_minutes'],
+        )
+        for stats in windows:
+            total += stats['deleted']
+            rate = stats['deleted'] / stats['seconds'] if stats['seconds'] else 0
+            self.stdout.write(
+                f"{stats['start']:%Y-%m-%d %H:%M} - {stats['end']:%H:%M}: "
+                f"{stats['deleted']} pings -> {stats['minutes']} minute rollups "
+                f"({rate:,.0f} rows/s)"
+            )
+        elapsed = time.monotonic() - started
+        rate = total / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Compacted {total} pings in {elapsed:.1f}s ({rate:,.0f} rows/s)"
+        ))
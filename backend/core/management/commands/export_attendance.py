@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from core.exports import CHUNK_SIZE, FORMATS, export_attendance, filter_attendance
+
+
+class Command(BaseCommand):
+    help = "Stream attendance records for a date range as CSV or NDJSON to a file or stdout."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='start', help="First day to export (YYYY-MM-DD)")
+        parser.add_argument('--to', dest='end', help="Last day to export (YYYY-MM-DD)")
+        parser.add_argument('--route', type=int, help="Only export this route id")
+        parser.add_argument('--grade', help="Only export students of this grade")
+        parser.add_argument('--student', type=int, help="Only export this student id")
+        parser.add_argument('--output', choices=sorted(FORMATS), default='csv', help="Export format (default: csv)")
+        parser.add_argument('--file', help="Write to this path instead of stdout")
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="Rows fetched per chunk")
+
+    def handle(self, *args, **options):
+        start = self._date(options['start'], '--from')
+        end = self._date(options['end'], '--to')
+        records = filter_attendance(
+            start=start, end=end, route=options['route'], grade=options['grade'], student=options['student'],
+        )
+        chunks = export_attendance(records, output=options['output'], chunk_size=options['chunk_size'])
+
+        started = time.monotonic()
+        size = 0
+        if options['file']:
+            with open(options['file'], 'w', newline='', encoding='utf-8') as handle:
+                for chunk in chunks:
+                    handle.write(chunk)
+                    size += len(chunk)
+            elapsed = time.monotonic() - started
+            self.stderr.write(self.style.SUCCESS(f"Wrote {size:,} characters to {options['file']} in {elapsed:.1f}s"))
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+
+    def _date(self, value, option):
+        if value is None:
+            return None
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f"{option} must be in YYYY-MM-DD format")
+        return day
@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from core.summaries import SUMMARIES, rebuild_summaries
+
+
+class Command(BaseCommand):
+    help = "Regenerate the attendance summary tables from the raw attendance records."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--summary', action='append', choices=sorted(SUMMARIES),
+            help="Only rebuild this summary (repeatable, default: all)",
+        )
+        parser.add_argument('--from', dest='start', help="First day to rebuild (YYYY-MM-DD)")
+        parser.add_argument('--to', dest='end', help="Last day to rebuild (YYYY-MM-DD)")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Summary rows inserted per statement")
+
+    def handle(self, *args, **options):
+        start = self._date(options['start'], '--from')
+        end = self._date(options['end'], '--to')
+        if start and end and start > end:
+            raise CommandError("--from must not be after --to")
+
+        started = time.monotonic()
+        summaries = rebuild_summaries(
+            names=options['summary'], start=start, end=end, batch_size=options['batch_size'],
+        )
+        for name, written in summaries:
+            now = time.monotonic()
+            self.stdout.write(f"{name}: {written} rows in {now - started:.1f}s")
+            started = now
+        self.stdout.write(self.style.SUCCESS("Attendance summaries rebuilt"))
+
+    def _date(self, value, option):
+        if value is None:
+            return None
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f"{option} must be in YYYY-MM-DD format")
+        return day
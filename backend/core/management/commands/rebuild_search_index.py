@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core.search import DOCUMENTS, get_search_backend, get_search_settings, rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Refill the full-text search indexes of students, routes and buses from the database."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--index', action='append', choices=sorted(DOCUMENTS),
+            help="Only rebuild this index (repeatable, default: all)",
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=get_search_settings()['BATCH_SIZE'],
+            help="Rows written per statement",
+        )
+
+    def handle(self, *args, **options):
+        if get_search_backend() is None:
+            raise CommandError("Search indexing is disabled or not supported by this database")
+        for name in options['index'] or sorted(DOCUMENTS):
+            started = time.monotonic()
+            with transaction.atomic():
+                rebuild_index([name], batch_size=options['batch_size'])
+            self.stdout.write(f"{name}: rebuilt in {time.monotonic() - started:.1f}s")
+        self.stdout.write(self.style.SUCCESS("Search indexes rebuilt"))
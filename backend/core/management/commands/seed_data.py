@@ -0,0 +1,65 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from core.seeding import EMAIL_DOMAIN, YEAR_DAYS, Seeder
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the database with a deterministic synthetic data set (schools, buses, "
+        "routes with stops, staff, students, parents, route assignments, attendance, "
+        "pings and stop events) using bulk inserts. The defaults create about a "
+        "million rows."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--schools', type=int, default=4, help="Schools (default: 4)")
+        parser.add_argument('--buses', type=int, default=20, help="Buses per school (default: 20)")
+        parser.add_argument('--routes-per-bus', type=int, default=1, help="Routes per bus (default: 1)")
+        parser.add_argument('--stops', type=int, default=12, help="Stops per route, the school included (default: 12)")
+        parser.add_argument('--students', type=int, default=1200, help="Students per school (default: 1200)")
+        parser.add_argument(
+            '--assigned', type=float, default=0.9,
+            help="Share of students assigned to a route, who get attendance (default: 0.9)",
+        )
+        parser.add_argument(
+            '--years', type=float, default=1,
+            help=f"Years of attendance, {YEAR_DAYS} school days each (default: 1)",
+        )
+        parser.add_argument('--ping-days', type=int, default=5, help="School days of ping history (default: 5)")
+        parser.add_argument('--ping-interval', type=int, default=5, help="Seconds between pings (default: 5)")
+        parser.add_argument('--end', help="Last day of data, YYYY-MM-DD (default: yesterday)")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed (default: 0)")
+        parser.add_argument('--password', help="Password of every generated user (default: none, no login)")
+        parser.add_argument('--batch-size', type=int, default=5000, help="Rows per bulk insert (default: 5000)")
+
+    def handle(self, *args, **options):
+        end = None
+        if options['end']:
+            end = parse_date(options['end'])
+            if end is None:
+                raise CommandError("--end must be in YYYY-MM-DD format")
+        if get_user_model().objects.filter(email__endswith=f'@{EMAIL_DOMAIN}').exists():
+            raise CommandError("The database already holds generated data; run 'python manage.py flush' first")
+
+        seeder = Seeder(
+            schools=options['schools'], buses=options['buses'], routes_per_bus=options['routes_per_bus'],
+            stops=options['stops'], students=options['students'], assigned=options['assigned'],
+            days=round(options['years'] * YEAR_DAYS), ping_days=options['ping_days'],
+            ping_interval=options['ping_interval'], seed=options['seed'], end=end, password=options['password'],
+            batch_size=options['batch_size'], log=self.stdout.write,
+        )
+        started = time.monotonic()
+        counts = seeder.run()
+        elapsed = time.monotonic() - started
+
+        for label, count in counts.items():
+            self.stdout.write(f"{label:<35} {count:>10,}")
+        total = sum(counts.values())
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {total:,} rows in {elapsed:.1f}s ({total / elapsed:,.0f} rows/s)"
+            + (f", attendance from {seeder.days[0]} to {seeder.days[-1]}" if seeder.days else "")
+        ))
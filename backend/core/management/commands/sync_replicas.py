@@ -0,0 +1,55 @@
+import sqlite3
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from core.replicas import get_replica_settings
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy the primary SQLite database into the SQLite read replicas listed in "
+        "READ_REPLICAS, for running with replicas locally. Other databases "
+        "replicate on their own."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help="Keep copying every this many seconds instead of once",
+        )
+
+    def handle(self, *args, **options):
+        primary = connections[DEFAULT_DB_ALIAS]
+        if primary.vendor != 'sqlite':
+            raise CommandError("sync_replicas only copies SQLite databases")
+        aliases = get_replica_settings()['DATABASES']
+        if not aliases:
+            raise CommandError("No replicas are configured; set DATABASE_REPLICAS")
+        for alias in aliases:
+            if connections[alias].vendor != 'sqlite':
+                raise CommandError(f"Replica {alias!r} is not an SQLite database")
+
+        while True:
+            started = time.monotonic()
+            for alias in aliases:
+                self.copy(primary.settings_dict['NAME'], connections[alias].settings_dict['NAME'])
+            self.stdout.write(f"Synced {', '.join(aliases)} in {time.monotonic() - started:.2f}s")
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+
+    def copy(self, source_name, target_name):
+        """
+        Copy a consistent snapshot of the primary with SQLite's backup API,
+        which holds the replica's write lock while it copies, so readers see
+        either the old or the new contents.
+        """
+        source = sqlite3.connect(source_name)
+        target = sqlite3.connect(target_name, timeout=30)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
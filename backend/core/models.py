@@ -10,9 +10,15 @@ class Student(models.Model):
     date_of_birth = models.DateField()
     address = models.TextField()
     emergency_contact = models.CharField(max_length=15)
+    parents = models.ManyToManyField(
+        User, related_name='children', blank=True, limit_choices_to={'role': 'parent'}
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [models.Index(fields=['grade', 'student_id'])]
+
     def __str__(self):
         return f"{self.user.get_full_name()} ({self.student_id})"
 
@@ -29,12 +35,89 @@ class Bus(models.Model):
     def __str__(self):
         return f"Bus {self.bus_number}"
 
+class BusLocation(models.Model):
+    """
+    A single GPS fix reported by a bus.
+    """
+    bus = models.ForeignKey(Bus, on_delete=models.CASCADE, related_name='locations')
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    speed = models.FloatField(null=True, blank=True, help_text="Speed in km/h")
+    heading = models.FloatField(null=True, blank=True, help_text="Heading in degrees clockwise from north")
+    recorded_at = models.DateTimeField()
+    received_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['bus', 'recorded_at']),
+            models.Index(fields=['recorded_at']),
+        ]
+
+    def __str__(self):
+        return f"Bus {self.bus_id} @ {self.latitude},{self.longitude} ({self.recorded_at})"
+
+class BusLocationMinute(models.Model):
+    """
+    Per-minute rollup of a bus's pings, kept after raw pings expire.
+    """
+    bus = models.ForeignKey(Bus, on_delete=models.CASCADE, related_name='location_minutes')
+    minute = models.DateTimeField()
+    ping_count = models.PositiveIntegerField()
+    latitude = models.FloatField(help_text="Average latitude over the minute")
+    longitude = models.FloatField(help_text="Average longitude over the minute")
+    avg_speed = models.FloatField(null=True, blank=True)
+    max_speed = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ('bus', 'minute')
+
+    def __str__(self):
+        return f"Bus {self.bus_id} @ {self.minute} ({self.ping_count} pings)"
+
+class BusTrip(models.Model):
+    """
+    A continuous run of pings from one bus, separated from the next run by
+    a gap of more than ``LOCATION_RETENTION['TRIP_GAP_MINUTES']``.
+    """
+    bus = models.ForeignKey(Bus, on_delete=models.CASCADE, related_name='trips')
+    started_at = models.DateTimeField()
+    ended_at = models.DateTimeField()
+    ping_count = models.PositiveIntegerField()
+    distance_km = models.FloatField()
+    max_speed = models.FloatField(null=True, blank=True)
+    start_latitude = models.FloatField()
+    start_longitude = models.FloatField()
+    end_latitude = models.FloatField()
+    end_longitude = models.FloatField()
+
+    class Meta:
+        indexes = [models.Index(fields=['bus', 'started_at'])]
+
+    def __str__(self):
+        return f"Bus {self.bus_id} trip {self.started_at} - {self.ended_at}"
+
+def parse_coordinates(latitude, longitude):
+    """
+    Return ``(latitude, longitude)`` as floats, or None unless both are
+    numbers within range.
+    """
+    if isinstance(latitude, bool) or isinstance(longitude, bool):
+        return None
+    try:
+        latitude, longitude = float(latitude), float(longitude)
+    except (TypeError, ValueError):
+        return None
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return None
+    return latitude, longitude
+
 class Route(models.Model):
     name = models.CharField(max_length=100)
     bus = models.ForeignKey(Bus, on_delete=models.SET_NULL, null=True, related_name='routes')
     start_point = models.CharField(max_length=255)
     end_point = models.CharField(max_length=255)
-    stops = models.JSONField()  # Store list of stops as JSON
+    # List of stops in order, either names or {"name", "latitude", "longitude"} objects
+    stops = models.JSONField()
     distance = models.FloatField(help_text="Distance in kilometers")
     estimated_duration = models.DurationField(help_text="Estimated duration of the route")
     is_active = models.BooleanField(default=True)
@@ -44,6 +127,96 @@ class Route(models.Model):
     def __str__(self):
         return f"{self.name} (Bus: {self.bus.bus_number if self.bus else 'Unassigned'})"
 
+    def parsed_stops(self):
+        """
+        Normalise ``stops`` into dicts with route_id, sequence, name, latitude
+        and longitude. Stops given as plain names, or with missing or invalid
+        coordinates, have no coordinates.
+        """
+        parsed = []
+        for sequence, stop in enumerate(self.stops or []):
+            coordinates = None
+            if isinstance(stop, dict):
+                name = stop.get('name') or f"Stop {sequence + 1}"
+                coordinates = parse_coordinates(
+                    stop.get('latitude', stop.get('lat')), stop.get('longitude', stop.get('lon', stop.get('lng')))
+                )
+            else:
+                name = str(stop)
+            latitude, longitude = coordinates or (None, None)
+            parsed.append({
+                'route_id': self.pk,
+                'sequence': sequence,
+                'name': name,
+                'latitude': latitude,
+                'longitude': longitude,
+            })
+        return parsed
+
+    def sync_route_stops(self):
+        """
+        Make the ``RouteStop`` rows match ``stops``. Returns the parsed stops
+        and whether the rows changed.
+        """
+        stops = self.parsed_stops()
+        existing = list(
+            RouteStop.objects.filter(route=self)
+            .order_by('sequence')
+            .values('route_id', 'sequence', 'name', 'latitude', 'longitude')
+        )
+        if existing == stops:
+            return stops, False
+        RouteStop.objects.filter(route=self).delete()
+        RouteStop.objects.bulk_create([RouteStop(**stop) for stop in stops])
+        return stops, True
+
+class RouteStop(models.Model):
+    """
+    A stop of a route with its coordinates, kept in sync with ``Route.stops``.
+    """
+    route = models.ForeignKey(Route, on_delete=models.CASCADE, related_name='route_stops')
+    sequence = models.PositiveIntegerField()
+    name = models.CharField(max_length=255)
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ('route', 'sequence')
+        ordering = ['route', 'sequence']
+
+    def __str__(self):
+        return f"{self.route_id}.{self.sequence} {self.name}"
+
+class StopEvent(models.Model):
+    """
+    A bus entering (arrival) or leaving (departure) the geofence of a route stop.
+    """
+    ARRIVAL = 'arrival'
+    DEPARTURE = 'departure'
+    EVENT_CHOICES = [
+        (ARRIVAL, 'Arrival'),
+        (DEPARTURE, 'Departure'),
+    ]
+
+    bus = models.ForeignKey(Bus, on_delete=models.CASCADE, related_name='stop_events')
+    route = models.ForeignKey(Route, on_delete=models.CASCADE, related_name='stop_events')
+    stop_sequence = models.PositiveIntegerField()
+    stop_name = models.CharField(max_length=255)
+    event_type = models.CharField(max_length=10, choices=EVENT_CHOICES)
+    occurred_at = models.DateTimeField()
+    date = models.DateField(help_text="Local service day of the event")
+
+    class Meta:
+        unique_together = ('route', 'bus', 'stop_sequence', 'event_type', 'occurred_at')
+        indexes = [
+            models.Index(fields=['route', 'date', 'occurred_at']),
+            models.Index(fields=['occurred_at', 'id']),
+        ]
+        ordering = ['occurred_at']
+
+    def __str__(self):
+        return f"Bus {self.bus_id} {self.event_type} at {self.stop_name} ({self.occurred_at})"
+
 class StudentRouteAssignment(models.Model):
     student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='route_assignments')
     route = models.ForeignKey(Route, on_delete=models.CASCADE, related_name='student_assignments')
@@ -57,10 +230,35 @@ class StudentRouteAssignment(models.Model):
 
     class Meta:
         unique_together = ('student', 'route')
+        indexes = [models.Index(fields=['route', 'is_active', 'id'])]
 
     def __str__(self):
         return f"{self.student} - {self.route}"
 
+class StaffAssignment(models.Model):
+    """
+    Puts a bus staff member on a bus, or on one route of it, for a period.
+    """
+    staff = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='staff_assignments', limit_choices_to={'role': 'bus_staff'}
+    )
+    bus = models.ForeignKey(Bus, on_delete=models.CASCADE, related_name='staff_assignments')
+    route = models.ForeignKey(
+        Route, on_delete=models.CASCADE, null=True, blank=True, related_name='staff_assignments',
+        help_text="Leave empty to cover every route of the bus"
+    )
+    valid_from = models.DateField()
+    valid_until = models.DateField(null=True, blank=True, help_text="Last day of the assignment, empty if open-ended")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['staff', 'valid_from'])]
+        ordering = ['-valid_from', '-id']
+
+    def __str__(self):
+        return f"{self.staff} on {self.route or self.bus} from {self.valid_from}"
+
 class AttendanceRecord(models.Model):
     ATTENDANCE_CHOICES = [
         ('present', 'Present'),
@@ -80,7 +278,73 @@ class AttendanceRecord(models.Model):
 
     class Meta:
         unique_together = ('student', 'date')
-        ordering = ['-date', 'student__user__first_name']
+        # Each filter of AttendanceRecordViewSet, followed by its keyset order.
+        indexes = [
+            models.Index(fields=['date', 'id']),
+            models.Index(fields=['route', 'date', 'id']),
+            models.Index(fields=['status', 'date', 'id']),
+        ]
+        ordering = ['-date', '-id']
 
     def __str__(self):
         return f"{self.student} - {self.date} - {self.get_status_display()}"
+
+class AttendanceCounts(models.Model):
+    """
+    Per-status attendance counts shared by the summary tables.
+    """
+    present = models.PositiveIntegerField(default=0)
+    absent = models.PositiveIntegerField(default=0)
+    late = models.PositiveIntegerField(default=0)
+    excused = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+    @property
+    def present_rate(self):
+        return round(self.present / self.total, 4) if self.total else None
+
+class RouteAttendanceDaily(AttendanceCounts):
+    """
+    Attendance of one route on one day, maintained from ``AttendanceRecord``.
+    """
+    route = models.ForeignKey(Route, on_delete=models.CASCADE, related_name='attendance_days')
+    date = models.DateField()
+
+    class Meta:
+        unique_together = ('route', 'date')
+        ordering = ['-date', '-id']
+
+    def __str__(self):
+        return f"{self.route_id} - {self.date}"
+
+class GradeAttendanceDaily(AttendanceCounts):
+    """
+    Attendance of one grade on one day, by the students' current grade.
+    """
+    grade = models.CharField(max_length=10)
+    date = models.DateField()
+
+    class Meta:
+        unique_together = ('grade', 'date')
+        ordering = ['-date', '-id']
+
+    def __str__(self):
+        return f"Grade {self.grade} - {self.date}"
+
+class StudentAttendanceMonthly(AttendanceCounts):
+    """
+    Attendance of one student in one month; ``month`` is its first day.
+    """
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='attendance_months')
+    month = models.DateField()
+
+    class Meta:
+        unique_together = ('student', 'month')
+        indexes = [models.Index(fields=['month', 'id'])]
+        ordering = ['-month', '-id']
+
+    def __str__(self):
+        return f"{self.student_id} - {self.month:%Y-%m}"
@@ -0,0 +1,190 @@
+"""
+Pagination classes for the API.
+
+``OptionalCountPagination`` is the default page-number pagination; clients
+can pass ``?count=false`` to skip the ``COUNT(*)`` query. Views over large,
+append-heavy collections set ``pagination_class = KeysetPagination``: each
+page is fetched with a ``WHERE`` on the last row's sort key instead of an
+``OFFSET``, so page 10 000 costs the same as page 1.
+"""
+import base64
+import json
+from collections import OrderedDict
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+FALSE_VALUES = ('0', 'false', 'no', 'off')
+
+
+def count_requested(request, default):
+    value = request.query_params.get('count')
+    if value is None:
+        return default
+    return value.lower() not in FALSE_VALUES
+
+
+class OptionalCountPagination(PageNumberPagination):
+    """
+    Page-number pagination whose total count can be turned off with
+    ``?count=false``; the next link is then found by fetching one extra row.
+    """
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.counted = count_requested(request, default=True)
+        if self.counted:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+        try:
+            self.page_number = int(request.query_params.get(self.page_query_param, 1))
+        except ValueError:
+            raise NotFound("Invalid page.")
+        if self.page_number < 1:
+            raise NotFound("Invalid page.")
+        offset = (self.page_number - 1) * page_size
+        rows = list(queryset[offset:offset + page_size + 1])
+        if not rows and self.page_number > 1:
+            raise NotFound("Invalid page.")
+        self.has_next = len(rows) > page_size
+        return rows[:page_size]
+
+    def get_paginated_response(self, data):
+        if self.counted:
+            return super().get_paginated_response(data)
+        url = self.request.build_absolute_uri()
+        next_link = (
+            replace_query_param(url, self.page_query_param, self.page_number + 1) if self.has_next else None
+        )
+        previous_link = None
+        if self.page_number == 2:
+            previous_link = remove_query_param(url, self.page_query_param)
+        elif self.page_number > 2:
+            previous_link = replace_query_param(url, self.page_query_param, self.page_number - 1)
+        return Response(OrderedDict([
+            ('next', next_link),
+            ('previous', previous_link),
+            ('results', data),
+        ]))
+
+
+class KeysetPagination(OptionalCountPagination):
+    """
+    Cursor pagination over the view's ``keyset_ordering``, a tuple of
+    non-null model field names (prefixed with ``-`` for descending order)
+    whose last entry is unique, e.g. ``('-date', '-id')``.
+
+    Responses contain ``count`` (unless ``?count=false`` is passed),
+    ``next``/``previous`` cursor links and ``results``. ``?page=`` is rejected
+    rather than silently answered with the first page. If the client asks for
+    a different order with ``?ordering=``, or its results are ranked by a
+    full-text search (see ``core.search``), the view falls back to
+    page-number pagination.
+    """
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = "Invalid cursor."
+    page_number_message = "This list is paginated with cursors; follow the next and previous links instead."
+
+    def paginate_queryset(self, queryset, request, view=None):
+        ordering = getattr(view, 'keyset_ordering', None)
+        if (
+            not ordering or request.query_params.get(api_settings.ORDERING_PARAM)
+            or getattr(view, 'search_ranked', False)
+        ):
+            self.keyset = False
+            return super().paginate_queryset(queryset, request, view)
+
+        if self.page_query_param in request.query_params:
+            raise ValidationError({self.page_query_param: [self.page_number_message]})
+        self.keyset = True
+        self.request = request
+        self.ordering = ordering
+        self.fields = [queryset.model._meta.get_field(name.lstrip('-')) for name in ordering]
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        self.count = queryset.count() if count_requested(request, default=True) else None
+        cursor = self.decode_cursor(request)
+        backwards = cursor is not None and cursor['reverse']
+        page = queryset.order_by(*self.effective_ordering(backwards))
+        if cursor is not None:
+            page = page.filter(self.after(cursor['values'], backwards))
+        rows = list(page[:page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if backwards:
+            rows.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+        self.page_rows = rows
+        return rows
+
+    def effective_ordering(self, backwards):
+        if not backwards:
+            return list(self.ordering)
+        return [name[1:] if name.startswith('-') else f'-{name}' for name in self.ordering]
+
+    def after(self, values, backwards):
+        """
+        Lexicographic "comes after ``values``" condition over the ordering
+        fields, led by a plain range on the first field so an index on the
+        ordering can drive the scan.
+        """
+        names = [name.lstrip('-') for name in self.ordering]
+        descending = [name.startswith('-') != backwards for name in self.ordering]
+        condition = Q()
+        equal = Q()
+        for name, value, desc in zip(names, values, descending):
+            condition |= equal & Q(**{f'{name}__{"lt" if desc else "gt"}': value})
+            equal &= Q(**{name: value})
+        leading = Q(**{f'{names[0]}__{"lte" if descending[0] else "gte"}': values[0]})
+        return leading & condition
+
+    def key_of(self, row):
+        return [getattr(row, field.attname) for field in self.fields]
+
+    def encode_cursor(self, values, reverse):
+        payload = json.dumps({'v': values, 'r': reverse}, cls=DjangoJSONEncoder)
+        token = base64.urlsafe_b64encode(payload.encode()).decode()
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, token)
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(token.encode()).decode())
+            values = [field.to_python(value) for field, value in zip(self.fields, payload['v'])]
+            if len(values) != len(self.fields):
+                raise ValueError
+            return {'values': values, 'reverse': bool(payload['r'])}
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return super().get_paginated_response(data)
+        next_link = previous_link = None
+        if self.page_rows and self.has_next:
+            next_link = self.encode_cursor(self.key_of(self.page_rows[-1]), reverse=False)
+        if self.page_rows and self.has_previous:
+            previous_link = self.encode_cursor(self.key_of(self.page_rows[0]), reverse=True)
+        response = OrderedDict()
+        if self.count is not None:
+            response['count'] = self.count
+        response['next'] = next_link
+        response['previous'] = previous_link
+        response['results'] = data
+        return Response(response)
@@ -0,0 +1,182 @@
+"""
+Helpers for the performance checks run by management commands.
+
+They build a throwaway test database, seed it with a small fixture and
+enumerate the GET endpoints of every viewset registered on the core router,
+so checks such as ``check_query_budget`` cover new endpoints automatically.
+Endpoints are requested as an admin, a parent and a bus staff member, since
+scoped users take different code paths, and with the parameters they
+require, so every request is expected to succeed.
+"""
+from contextlib import contextmanager
+from urllib.parse import urlencode
+
+from django.db import connection, connections, transaction
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from users.authentication import ClaimsRefreshToken
+from users.models import User
+from .models import Bus, BusLocation, RouteStop
+from .replicas import get_replica_settings
+from .seeding import Seeder
+from .signals import pings_received
+
+
+@contextmanager
+def test_database(name=None):
+    """
+    Create a fresh test database for the default connection (named
+    ``name``, for SQLite a file instead of memory) and remove it afterwards.
+    """
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    old_test_name = connection.settings_dict['TEST']['NAME']
+    if name is not None:
+        connection.settings_dict['TEST']['NAME'] = name
+    replica_names = {alias: connections[alias].settings_dict['NAME'] for alias in get_replica_settings()['DATABASES']}
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    # Replicas mirror the test database, like in the test runner.
+    for alias in replica_names:
+        connections[alias].creation.set_as_test_mirror(connection.settings_dict)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        connection.settings_dict['TEST']['NAME'] = old_test_name
+        for alias, replica_name in replica_names.items():
+            connections[alias].settings_dict['NAME'] = replica_name
+        teardown_test_environment()
+
+
+@contextmanager
+def rolled_back():
+    """
+    Run a block inside a transaction that is always rolled back.
+    """
+    with transaction.atomic():
+        yield
+        transaction.set_rollback(True)
+
+
+def seed_fixture(students=20, buses=2, days=3):
+    """
+    Create a small, fully related data set with ``seeding.Seeder``: buses
+    with geocoded routes, students assigned to them, attendance for ``days``
+    school days up to today, a day of pings and stop events, with their
+    attendance summaries. The newest ping of each bus is then received like
+    a live one, so positions and ETAs are available. Returns an admin user.
+    """
+    admin = User.objects.create_user(
+        email='perf-admin@tracko.com', password=None, first_name='Perf', last_name='Admin',
+        role='admin', is_staff=True,
+    )
+    Seeder(
+        buses=buses, stops=5, students=students, assigned=1, days=days, ping_days=min(days, 1),
+        end=timezone.localdate(),
+    ).run()
+    latest = [bus.locations.order_by('-recorded_at').first() for bus in Bus.objects.order_by('pk')]
+    pings_received.send(sender=BusLocation, locations=[location for location in latest if location is not None])
+    return admin
+
+
+def fixture_users(admin):
+    """
+    Return ``{role: user}`` for the users the checks request as: the
+    fixture's admin, a parent whose child rides a route and a bus staff
+    member with a current assignment.
+    """
+    parent = (
+        User.objects.filter(role='parent', children__route_assignments__is_active=True).order_by('pk').first()
+    )
+    staff = User.objects.filter(role='bus_staff', staff_assignments__isnull=False).order_by('pk').first()
+    return {'admin': admin, 'parent': parent, 'bus_staff': staff}
+
+
+def get_endpoints():
+    """
+    Return ``(name, viewset, kind, action)`` for the list, detail and extra
+    GET actions of every viewset registered on the core router. ``kind`` is
+    ``'list'`` or ``'detail'``.
+    """
+    from .urls import router
+
+    endpoints = []
+    for prefix, viewset, basename in router.registry:
+        endpoints.append((f'{basename}-list', viewset, 'list', None))
+        if hasattr(viewset, 'retrieve'):
+            endpoints.append((f'{basename}-detail', viewset, 'detail', None))
+        for extra in viewset.get_extra_actions():
+            if 'get' in extra.mapping:
+                kind = 'detail' if extra.detail else 'list'
+                endpoints.append((f'{basename}-{extra.url_name}', viewset, kind, extra))
+    return endpoints
+
+
+def endpoint_params(name):
+    """
+    Return the query parameters an endpoint requires, taken from the
+    fixture.
+    """
+    stop = RouteStop.objects.order_by('pk').first()
+    latest = BusLocation.objects.order_by('-recorded_at').first()
+    params = {}
+    if stop is not None:
+        params['bus-nearby'] = {'lat': stop.latitude, 'lon': stop.longitude, 'radius_km': 50}
+        params['routestop-nearest'] = {'lat': stop.latitude, 'lon': stop.longitude}
+    if latest is not None:
+        params['bus-replay'] = {'date': timezone.localdate(latest.recorded_at).isoformat()}
+    return params.get(name, {})
+
+
+def endpoint_url(name, viewset, kind, client):
+    """
+    Reverse an endpoint with the parameters it requires, using the first
+    object the client's user can list for detail routes. Returns None if
+    there is no object to address.
+    """
+    from .urls import router
+
+    if kind == 'list':
+        url = reverse(name)
+    else:
+        basename = next(basename for _, registered, basename in router.registry if registered is viewset)
+        response = client.get(reverse(f'{basename}-list'), {'page_size': 1})
+        results = response.data['results'] if response.status_code == 200 else []
+        if not results:
+            return None
+        url = reverse(name, kwargs={'pk': results[0]['id']})
+    params = endpoint_params(name)
+    return f'{url}?{urlencode(params)}' if params else url
+
+
+def filter_params(viewset):
+    """
+    Return one ``{field: value}`` query per ``filterset_fields`` entry of a
+    viewset, with the value of the first object that has one.
+    """
+    fields = getattr(viewset, 'filterset_fields', None) or []
+    queryset = viewset.queryset.model._default_manager.order_by('pk')
+    params = []
+    for field in fields:
+        value = queryset.exclude(**{f'{field}__isnull': True}).values_list(field, flat=True).first()
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            value = 'true' if value else 'false'
+        elif hasattr(value, 'isoformat'):
+            value = value.isoformat()
+        params.append({field: value})
+    return params
+
+
+def api_client(user):
+    """
+    Return a client sending a real access token for ``user``, so checks
+    count what authentication costs too.
+    """
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {ClaimsRefreshToken.for_user(user).access_token}')
+    return client
@@ -0,0 +1,13 @@
+from rest_framework.permissions import BasePermission
+
+
+class IsBusStaffOrAdmin(BasePermission):
+    """
+    Allows access only to bus staff and administrators.
+    """
+
+    def has_permission(self, request, view):
+        user = request.user
+        if not (user and user.is_authenticated):
+            return False
+        return user.is_staff or user.role in ('admin', 'bus_staff')
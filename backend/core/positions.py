@@ -0,0 +1,230 @@
+"""
+Last-known-position store for buses.
+
+The ingestion path writes the newest fix of every bus here and the bus and
+route endpoints read positions from here instead of the database. The
+default backend keeps positions in process memory; ``CachePositionBackend``
+shares them between workers through a Django cache.
+"""
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .replicas import use_primary
+
+DEFAULTS = {
+    'BACKEND': 'core.positions.LocalPositionBackend',
+    'OPTIONS': {},
+    'STALE_AFTER': 60,
+    'EVICT_AFTER': 3600,
+}
+
+
+def get_store_settings():
+    return {**DEFAULTS, **getattr(settings, 'POSITION_STORE', {})}
+
+
+class LocalPositionBackend:
+    """
+    Keeps positions in a dict guarded by a lock.
+    """
+
+    def __init__(self, evict_after=3600, **options):
+        self.evict_after = evict_after
+        self._positions = {}
+        self._lock = threading.Lock()
+        self._next_sweep = time.monotonic() + evict_after
+
+    def get_many(self, bus_ids):
+        positions = self._positions
+        return {bus_id: positions[bus_id] for bus_id in bus_ids if bus_id in positions}
+
+    def all(self):
+        return dict(self._positions)
+
+    def set_newer(self, positions):
+        with self._lock:
+            for bus_id, position in positions.items():
+                current = self._positions.get(bus_id)
+                if current is None or position['recorded_at'] >= current['recorded_at']:
+                    self._positions[bus_id] = position
+            if time.monotonic() >= self._next_sweep:
+                self._sweep()
+
+    def delete_many(self, bus_ids):
+        with self._lock:
+            for bus_id in bus_ids:
+                self._positions.pop(bus_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._positions.clear()
+
+    def _sweep(self):
+        cutoff = timezone.now() - timedelta(seconds=self.evict_after)
+        expired = [
+            bus_id for bus_id, position in self._positions.items()
+            if position['recorded_at'] < cutoff
+        ]
+        for bus_id in expired:
+            del self._positions[bus_id]
+        self._next_sweep = time.monotonic() + self.evict_after
+
+
+class CachePositionBackend:
+    """
+    Stores positions in a Django cache so that every worker sees the same
+    data. Entries expire after ``evict_after`` seconds without a new fix.
+    """
+    key_prefix = 'bus-position'
+    index_key = 'bus-position:index'
+
+    def __init__(self, evict_after=3600, cache='default', **options):
+        self.evict_after = evict_after
+        self.cache = caches[cache]
+
+    def _key(self, bus_id):
+        return f'{self.key_prefix}:{bus_id}'
+
+    def get_many(self, bus_ids):
+        keys = {self._key(bus_id): bus_id for bus_id in bus_ids}
+        found = self.cache.get_many(list(keys))
+        return {keys[key]: position for key, position in found.items()}
+
+    def all(self):
+        return self.get_many(self.cache.get(self.index_key, set()))
+
+    def set_newer(self, positions):
+        current = self.get_many(positions.keys())
+        updates = {
+            self._key(bus_id): position
+            for bus_id, position in positions.items()
+            if bus_id not in current or position['recorded_at'] >= current[bus_id]['recorded_at']
+        }
+        if updates:
+            self.cache.set_many(updates, timeout=self.evict_after)
+            index = self.cache.get(self.index_key, set())
+            if not index.issuperset(positions):
+                self.cache.set(self.index_key, index | set(positions), timeout=None)
+
+    def delete_many(self, bus_ids):
+        self.cache.delete_many([self._key(bus_id) for bus_id in bus_ids])
+        index = self.cache.get(self.index_key)
+        if index:
+            self.cache.set(self.index_key, index - set(bus_ids), timeout=None)
+
+    def clear(self):
+        self.delete_many(self.cache.get(self.index_key, set()))
+
+
+class PositionStore:
+    """
+    Last known position of every active bus, with staleness flags.
+    """
+
+    def __init__(self, backend, stale_after=60):
+        self.backend = backend
+        self.stale_after = stale_after
+        self._warmed = False
+        self._warm_lock = threading.Lock()
+
+    def update(self, locations):
+        """
+        Record the newest fix per bus from a batch of BusLocation instances.
+        """
+        latest = {}
+        for location in locations:
+            current = latest.get(location.bus_id)
+            if current is None or location.recorded_at >= current['recorded_at']:
+                latest[location.bus_id] = {
+                    'bus': location.bus_id,
+                    'latitude': location.latitude,
+                    'longitude': location.longitude,
+                    'speed': location.speed,
+                    'heading': location.heading,
+                    'recorded_at': location.recorded_at,
+                }
+        if latest:
+            self.backend.set_newer(latest)
+
+    def get(self, bus_id):
+        return self.get_many([bus_id]).get(bus_id)
+
+    def get_many(self, bus_ids):
+        """
+        Return ``{bus_id: position}`` for the buses that have a known position.
+        Each position carries ``stale`` and ``age_seconds`` computed now.
+        """
+        self.warm()
+        now = timezone.now()
+        return {
+            bus_id: self._annotate(position, now)
+            for bus_id, position in self.backend.get_many(bus_ids).items()
+        }
+
+    def all(self):
+        self.warm()
+        now = timezone.now()
+        return {
+            bus_id: self._annotate(position, now)
+            for bus_id, position in self.backend.all().items()
+        }
+
+    def evict(self, bus_ids):
+        self.backend.delete_many(list(bus_ids))
+
+    def clear(self):
+        self.backend.clear()
+        self._warmed = True
+
+    def warm(self):
+        """
+        Load the newest stored location of every active bus, once per process.
+        """
+        if self._warmed:
+            return
+        with self._warm_lock:
+            if self._warmed:
+                return
+            self._warmed = True
+            with use_primary():
+                self.update(latest_locations())
+
+    def _annotate(self, position, now):
+        age = (now - position['recorded_at']).total_seconds()
+        return {**position, 'age_seconds': round(age, 1), 'stale': age > self.stale_after}
+
+
+def latest_locations():
+    from .models import Bus, BusLocation
+
+    newest = BusLocation.objects.filter(bus=OuterRef('pk')).order_by('-recorded_at').values('pk')[:1]
+    location_ids = (
+        Bus.objects.filter(is_active=True)
+        .annotate(location_id=Subquery(newest))
+        .exclude(location_id=None)
+        .values_list('location_id', flat=True)
+    )
+    return list(BusLocation.objects.filter(pk__in=list(location_ids)))
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_position_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                config = get_store_settings()
+                backend_class = import_string(config['BACKEND'])
+                backend = backend_class(evict_after=config['EVICT_AFTER'], **config['OPTIONS'])
+                _store = PositionStore(backend, stale_after=config['STALE_AFTER'])
+    return _store
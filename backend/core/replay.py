@@ -0,0 +1,64 @@
+"""
+Streaming replay of a bus's stored pings as NDJSON.
+"""
+import json
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import BusLocation
+
+CHUNK_SIZE = 2000
+MAX_RANGE = timedelta(days=31)
+
+
+def parse_moment(value, end_of_day=False):
+    """
+    Parse an ISO datetime, or an ISO date meaning the start (or the end) of
+    that day in the current time zone. Returns None if ``value`` is invalid.
+    """
+    try:
+        day = parse_date(value)
+        moment = None if day is not None else parse_datetime(value)
+    except ValueError:
+        return None
+    if moment is not None:
+        return moment if timezone.is_aware(moment) else timezone.make_aware(moment)
+    if day is None:
+        return None
+    if end_of_day:
+        day += timedelta(days=1)
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def replay_lines(bus_id, start, end, every=None, chunk_size=CHUNK_SIZE):
+    """
+    Yield NDJSON lines for the pings of ``bus_id`` recorded in [start, end),
+    oldest first, reading them through a chunked cursor. With ``every`` (a
+    timedelta) a ping is only emitted if it is at least that long after the
+    previously emitted one. Lines are batched into one string per chunk.
+    """
+    pings = (
+        BusLocation.objects.filter(bus_id=bus_id, recorded_at__gte=start, recorded_at__lt=end)
+        .order_by('recorded_at')
+        .values_list('latitude', 'longitude', 'speed', 'heading', 'recorded_at')
+    )
+    last_emitted = None
+    lines = []
+    for latitude, longitude, speed, heading, recorded_at in pings.iterator(chunk_size=chunk_size):
+        if every is not None and last_emitted is not None and recorded_at - last_emitted < every:
+            continue
+        last_emitted = recorded_at
+        lines.append(json.dumps({
+            'latitude': latitude,
+            'longitude': longitude,
+            'speed': speed,
+            'heading': heading,
+            'recorded_at': recorded_at.isoformat(),
+        }))
+        if len(lines) >= chunk_size:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
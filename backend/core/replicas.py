@@ -0,0 +1,158 @@
+"""
+Read-replica routing.
+
+Viewsets with ``ReplicaReadMixin`` run the queries of safe-method requests
+against a read replica (one of ``READ_REPLICAS['DATABASES']``, picked at
+random); everything else, including all writes, uses ``default``. The choice
+is held in a context variable for the duration of the request, so code
+outside a viewset (management commands, background threads) always reads
+from the primary.
+
+Replicas lag behind the primary, so:
+
+- a user whose write succeeded reads from the primary for
+  ``STICKY_SECONDS`` afterwards (read-your-writes);
+- endpoints can be pinned to the primary with ``PRIMARY_ENDPOINTS`` or a
+  viewset's ``primary_actions``;
+- data cached across requests (access scopes, rosters, cached responses) is
+  built inside ``use_primary()`` so a stale read cannot outlive the lag.
+
+A replica configured with the primary's database (as test mirrors are) is
+ignored. ``sync_replicas`` copies the primary into SQLite replica files for
+local testing.
+"""
+import contextvars
+import random
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework.permissions import SAFE_METHODS
+
+DEFAULTS = {
+    'DATABASES': [],
+    'STICKY_SECONDS': 10,
+    'CACHE': 'default',  # remembers who wrote recently
+    'PRIMARY_ENDPOINTS': [],  # basenames ('attendance') or '<basename>-<action>'
+}
+
+_read_alias = contextvars.ContextVar('read_alias', default=None)
+
+
+def get_replica_settings():
+    return {**DEFAULTS, **getattr(settings, 'READ_REPLICAS', {})}
+
+
+def get_replicas():
+    """
+    Return the aliases of the configured replicas that are not the primary
+    database under another name.
+    """
+    primary = connections[DEFAULT_DB_ALIAS].settings_dict['NAME']
+    return [
+        alias for alias in get_replica_settings()['DATABASES']
+        if connections[alias].settings_dict['NAME'] != primary
+    ]
+
+
+@contextmanager
+def use_replica(alias):
+    token = _read_alias.set(alias)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+def use_primary():
+    """
+    Read from the primary inside the block, even during a replica request.
+    """
+    return use_replica(None)
+
+
+def sticky_key(user):
+    return f'replica-sticky:{user.pk}'
+
+
+def mark_written(user):
+    config = get_replica_settings()
+    if config['DATABASES'] and config['STICKY_SECONDS'] and user is not None and user.is_authenticated:
+        caches[config['CACHE']].set(sticky_key(user), True, config['STICKY_SECONDS'])
+
+
+def is_sticky(user):
+    if user is None or not user.is_authenticated:
+        return False
+    return caches[get_replica_settings()['CACHE']].get(sticky_key(user), False)
+
+
+class ReplicaRouter:
+    """
+    Sends reads to the replica chosen for the current request, if any, and
+    writes and migrations to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        databases = {DEFAULT_DB_ALIAS, *get_replica_settings()['DATABASES']}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in get_replica_settings()['DATABASES']:
+            return False
+        return None
+
+
+class ReplicaReadMixin:
+    """
+    Serves a viewset's safe-method requests from a read replica unless the
+    endpoint is pinned to the primary or the user wrote recently.
+    """
+    primary_actions = ()
+
+    def reads_from_replica(self, request):
+        if request.method not in SAFE_METHODS or self.action in self.primary_actions:
+            return False
+        pinned = get_replica_settings()['PRIMARY_ENDPOINTS']
+        if self.basename in pinned or f'{self.basename}-{self.action}' in pinned:
+            return False
+        return not is_sticky(request.user)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        replicas = get_replicas()
+        if replicas and self.reads_from_replica(request):
+            self._read_alias_token = _read_alias.set(random.choice(replicas))
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, '_read_alias_token', None)
+        if token is not None:
+            _read_alias.reset(token)
+            self._read_alias_token = None
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+class ReplicaStickinessMiddleware:
+    """
+    Sends a user's reads to the primary for a while after any successful
+    write, through a viewset or not.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            mark_written(getattr(request, 'user', None))
+        return response
@@ -0,0 +1,239 @@
+"""
+Retention of bus location history.
+
+Raw ``BusLocation`` rows older than the retention window are compacted
+into ``BusLocationMinute`` and ``BusTrip`` rollups and then deleted. Work is
+done one time window at a time, oldest first; each window is a single
+transaction whose DELETE statements are bounded by ``batch_size``, so a run
+can be interrupted at any point without double counting or losing pings.
+"""
+import time
+from datetime import timedelta
+from itertools import groupby
+from operator import attrgetter, itemgetter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Avg, Count, Max, Min
+from django.db.models.functions import TruncMinute
+from django.utils import timezone
+
+from .models import BusLocation, BusLocationMinute, BusTrip
+from .spatial import haversine_km
+
+DEFAULTS = {
+    'RAW_DAYS': 7,
+    'WINDOW_MINUTES': 60,
+    'BATCH_SIZE': 1000,
+    'TRIP_GAP_MINUTES': 15,
+}
+
+
+def get_retention_settings():
+    return {**DEFAULTS, **getattr(settings, 'LOCATION_RETENTION', {})}
+
+
+def floor_time(moment, minutes):
+    epoch = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    elapsed = int((moment - epoch).total_seconds() // 60)
+    return epoch + timedelta(minutes=elapsed - elapsed % minutes)
+
+
+def compact_minutes(start, end):
+    """
+    Write per-minute rollups for every ping recorded in [start, end),
+    merged into the rollups already written for those minutes by pings that
+    arrived late.
+    """
+    rollups = (
+        BusLocation.objects.filter(recorded_at__gte=start, recorded_at__lt=end)
+        .annotate(minute=TruncMinute('recorded_at'))
+        .values('bus_id', 'minute')
+        .annotate(
+            ping_count=Count('id'),
+            latitude=Avg('latitude'),
+            longitude=Avg('longitude'),
+            avg_speed=Avg('speed'),
+            max_speed=Max('speed'),
+        )
+        .order_by()
+    )
+    existing = {
+        (row.bus_id, row.minute): row
+        for row in BusLocationMinute.objects.filter(minute__gte=start, minute__lt=end)
+    }
+    rows = [merge_minute(existing.get((rollup['bus_id'], rollup['minute'])), rollup) for rollup in rollups]
+    BusLocationMinute.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=['bus', 'minute'],
+        update_fields=['ping_count', 'latitude', 'longitude', 'avg_speed', 'max_speed'],
+    )
+    return len(rows)
+
+
+def merge_minute(row, rollup):
+    """
+    Combine an already written minute rollup (or None) with the rollup of
+    newly compacted pings of the same minute.
+    """
+    if row is None:
+        return BusLocationMinute(**rollup)
+    old, new = row.ping_count, rollup['ping_count']
+    total = old + new
+
+    def weighted(previous, current):
+        if previous is None or current is None:
+            return current if previous is None else previous
+        return (previous * old + current * new) / total
+
+    speeds = [speed for speed in (row.max_speed, rollup['max_speed']) if speed is not None]
+    return BusLocationMinute(
+        bus_id=row.bus_id, minute=row.minute, ping_count=total,
+        latitude=weighted(row.latitude, rollup['latitude']),
+        longitude=weighted(row.longitude, rollup['longitude']),
+        avg_speed=weighted(row.avg_speed, rollup['avg_speed']),
+        max_speed=max(speeds) if speeds else None,
+    )
+
+
+def compact_trips(start, end, trip_gap, batch_size):
+    """
+    Fold the pings recorded in [start, end) into ``BusTrip`` rows. A ping
+    joins any trip of its bus it falls within ``trip_gap`` of, including
+    trips written for this window by an earlier run, so late pings extend
+    an existing trip rather than start an overlapping one; trips brought
+    within ``trip_gap`` of each other are merged. Returns the primary keys
+    of the pings read.
+    """
+    pings = (
+        BusLocation.objects.filter(recorded_at__gte=start, recorded_at__lt=end)
+        .order_by('bus_id', 'recorded_at')
+        .values_list('pk', 'bus_id', 'latitude', 'longitude', 'speed', 'recorded_at')
+    )
+    ping_ids = []
+    kept = []
+    removed = []
+    for bus_id, bus_pings in groupby(pings.iterator(chunk_size=batch_size), key=itemgetter(1)):
+        trips = list(BusTrip.objects.filter(
+            bus_id=bus_id, ended_at__gte=start - trip_gap, started_at__lt=end + trip_gap
+        ))
+        for pk, _, latitude, longitude, speed, recorded_at in bus_pings:
+            ping_ids.append(pk)
+            trip = next(
+                (trip for trip in trips if trip.started_at - trip_gap <= recorded_at <= trip.ended_at + trip_gap),
+                None,
+            )
+            if trip is None:
+                trip = BusTrip(
+                    bus_id=bus_id, started_at=recorded_at, ended_at=recorded_at, ping_count=0,
+                    distance_km=0.0, max_speed=None, start_latitude=latitude, start_longitude=longitude,
+                    end_latitude=latitude, end_longitude=longitude,
+                )
+                trips.append(trip)
+            add_ping(trip, latitude, longitude, speed, recorded_at)
+        bus_kept, bus_removed = merge_trips(trips, trip_gap)
+        kept += bus_kept
+        removed += bus_removed
+
+    BusTrip.objects.bulk_create([trip for trip in kept if trip.pk is None], batch_size=batch_size)
+    BusTrip.objects.bulk_update(
+        [trip for trip in kept if trip.pk is not None],
+        ['started_at', 'ended_at', 'ping_count', 'distance_km', 'max_speed',
+         'start_latitude', 'start_longitude', 'end_latitude', 'end_longitude'],
+        batch_size=batch_size,
+    )
+    BusTrip.objects.filter(pk__in=[trip.pk for trip in removed]).delete()
+    return ping_ids
+
+
+def add_ping(trip, latitude, longitude, speed, recorded_at):
+    """
+    Extend a trip with a ping. A ping inside the trip's span only counts;
+    the path between the pings already folded into it is not known anymore.
+    """
+    if recorded_at > trip.ended_at:
+        trip.distance_km += haversine_km(trip.end_latitude, trip.end_longitude, latitude, longitude)
+        trip.ended_at = recorded_at
+        trip.end_latitude, trip.end_longitude = latitude, longitude
+    elif recorded_at < trip.started_at:
+        trip.distance_km += haversine_km(latitude, longitude, trip.start_latitude, trip.start_longitude)
+        trip.started_at = recorded_at
+        trip.start_latitude, trip.start_longitude = latitude, longitude
+    trip.ping_count += 1
+    if speed is not None and (trip.max_speed is None or speed > trip.max_speed):
+        trip.max_speed = speed
+
+
+def merge_trips(trips, trip_gap):
+    """
+    Merge the trips of one bus that overlap or are within ``trip_gap`` of
+    each other. Returns the trips to keep and the saved trips merged away.
+    """
+    kept = []
+    removed = []
+    for trip in sorted(trips, key=attrgetter('started_at')):
+        previous = kept[-1] if kept else None
+        if previous is None or trip.started_at - previous.ended_at > trip_gap:
+            kept.append(trip)
+            continue
+        if trip.started_at >= previous.ended_at:
+            previous.distance_km += haversine_km(
+                previous.end_latitude, previous.end_longitude, trip.start_latitude, trip.start_longitude
+            )
+        previous.distance_km += trip.distance_km
+        previous.ping_count += trip.ping_count
+        if trip.ended_at > previous.ended_at:
+            previous.ended_at = trip.ended_at
+            previous.end_latitude, previous.end_longitude = trip.end_latitude, trip.end_longitude
+        speeds = [speed for speed in (previous.max_speed, trip.max_speed) if speed is not None]
+        previous.max_speed = max(speeds) if speeds else None
+        if trip.pk is not None:
+            if previous.pk is None:
+                previous.pk = trip.pk
+            else:
+                removed.append(trip)
+    return kept, removed
+
+
+def delete_pings(ping_ids, batch_size):
+    deleted = 0
+    for offset in range(0, len(ping_ids), batch_size):
+        count, _ = BusLocation.objects.filter(pk__in=ping_ids[offset:offset + batch_size]).delete()
+        deleted += count
+    return deleted
+
+
+def compact_window(start, end, trip_gap, batch_size):
+    with transaction.atomic():
+        minutes = compact_minutes(start, end)
+        ping_ids = compact_trips(start, end, trip_gap, batch_size)
+        deleted = delete_pings(ping_ids, batch_size)
+    return {'start': start, 'end': end, 'minutes': minutes, 'deleted': deleted}
+
+
+def compact_locations(keep_days=None, window_minutes=None, batch_size=None, trip_gap_minutes=None, now=None):
+    """
+    Compact and delete raw pings older than ``keep_days``, one window at a
+    time. Yields a stats dict per window that contained pings.
+    """
+    config = get_retention_settings()
+    keep_days = config['RAW_DAYS'] if keep_days is None else keep_days
+    window_minutes = window_minutes or config['WINDOW_MINUTES']
+    batch_size = batch_size or config['BATCH_SIZE']
+    trip_gap = timedelta(minutes=config['TRIP_GAP_MINUTES'] if trip_gap_minutes is None else trip_gap_minutes)
+
+    cutoff = floor_time(now or timezone.now(), window_minutes) - timedelta(days=keep_days)
+    window = timedelta(minutes=window_minutes)
+    expired = BusLocation.objects.filter(recorded_at__lt=cutoff)
+    while True:
+        # Jump straight to the next window holding pings, skipping idle periods.
+        oldest = expired.aggregate(oldest=Min('recorded_at'))['oldest']
+        if oldest is None:
+            return
+        start = floor_time(oldest, window_minutes)
+        end = min(start + window, cutoff)
+        started = time.monotonic()
+        stats = compact_window(start, end, trip_gap, batch_size)
+        stats['seconds'] = time.monotonic() - started
+        yield stats
@@ -0,0 +1,87 @@
+"""
+Cached route rosters.
+
+A roster (the serialized students actively assigned to a route) is built
+with a single joined query and stored in a Django cache together with an
+ETag of its content. Signal receivers delete a route's entry whenever one
+of its assignments, students or their users changes, so a cached roster is
+never stale for longer than a write takes to commit.
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .models import Student, StudentRouteAssignment
+from .replicas import use_primary
+from .serializers import StudentSerializer
+
+DEFAULTS = {
+    'CACHE': 'default',
+    'TIMEOUT': 3600,
+}
+
+# User fields that appear in a roster; saves touching only other fields
+# (such as ``last_login`` on every login) leave rosters alone.
+ROSTER_USER_FIELDS = {'email', 'first_name', 'last_name', 'phone_number'}
+
+
+def get_roster_settings():
+    return {**DEFAULTS, **getattr(settings, 'ROUTE_ROSTER', {})}
+
+
+def get_cache():
+    return caches[get_roster_settings()['CACHE']]
+
+
+def roster_key(route_id):
+    return f'route-roster:{route_id}'
+
+
+def build_roster(route_id):
+    """
+    Serialize the students actively assigned to a route and fingerprint
+    the result.
+    """
+    students = (
+        Student.objects.filter(route_assignments__route_id=route_id, route_assignments__is_active=True)
+        .select_related('user')
+        .prefetch_related('parents')
+        .order_by('user__last_name', 'user__first_name', 'id')
+    )
+    data = json.loads(json.dumps(StudentSerializer(students, many=True).data, default=str))
+    etag = hashlib.sha1(json.dumps(data, sort_keys=True).encode()).hexdigest()
+    return {'etag': f'"{etag}"', 'data': data}
+
+
+def get_roster(route_id):
+    """
+    Return ``{'etag', 'data'}`` for a route, building and caching it on a miss.
+    """
+    cache = get_cache()
+    roster = cache.get(roster_key(route_id))
+    if roster is None:
+        with use_primary():
+            roster = build_roster(route_id)
+        cache.set(roster_key(route_id), roster, get_roster_settings()['TIMEOUT'])
+    return roster
+
+
+def invalidate_rosters(route_ids):
+    route_ids = {route_id for route_id in route_ids if route_id is not None}
+    if route_ids:
+        get_cache().delete_many([roster_key(route_id) for route_id in route_ids])
+
+
+def invalidate_student_rosters(student_ids=None, user_ids=None):
+    """
+    Drop the rosters of every route the given students (or the students of
+    the given users) are assigned to.
+    """
+    assignments = StudentRouteAssignment.objects.all()
+    if student_ids is not None:
+        assignments = assignments.filter(student_id__in=student_ids)
+    if user_ids is not None:
+        assignments = assignments.filter(student__user_id__in=user_ids)
+    invalidate_rosters(set(assignments.values_list('route_id', flat=True)))
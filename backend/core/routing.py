@@ -0,0 +1,8 @@
+from django.urls import path
+
+from . import consumers
+
+websocket_urlpatterns = [
+    path('ws/routes/<int:route_id>/positions/', consumers.PositionConsumer.as_asgi()),
+    path('ws/buses/<int:bus_id>/positions/', consumers.PositionConsumer.as_asgi()),
+]
@@ -0,0 +1,290 @@
+"""
+Full-text search for students, routes and buses.
+
+Each searchable model has a ``SearchDocument`` listing the fields that are
+indexed. The configured backend keeps one index per document; the default
+stores them in SQLite FTS5 tables next to the data, kept in sync by the
+signal receivers of ``core.signals`` and rebuilt with
+``rebuild_search_index``. ``FullTextSearchFilter`` matches ``?search=``
+terms as prefixes against the index and orders the results by relevance,
+instead of ``SearchFilter``'s ``LIKE '%term%'`` over joined tables. Without
+a usable backend it behaves exactly like ``SearchFilter``.
+"""
+import threading
+
+from django.conf import settings
+from django.db import connections
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+from rest_framework import filters
+from rest_framework.settings import api_settings
+
+from .models import Bus, Route, Student
+
+DEFAULTS = {
+    'BACKEND': 'core.search.FTS5SearchBackend',  # None disables the index
+    'OPTIONS': {},
+    'BATCH_SIZE': 2000,
+    'RANK_LIMIT': 1000,
+}
+
+
+def get_search_settings():
+    return {**DEFAULTS, **getattr(settings, 'SEARCH_INDEX', {})}
+
+
+class SearchDocument:
+    """
+    The fields of a model (lookups, possibly across relations) that are
+    indexed for search.
+    """
+
+    def __init__(self, name, model, fields):
+        self.name = name
+        self.model = model
+        self.fields = fields
+
+    @property
+    def columns(self):
+        return [field.replace('__', '_') for field in self.fields]
+
+    def rows(self, pks=None):
+        """
+        Yield ``(pk, *field values)`` for the given objects, or all of them.
+        """
+        queryset = self.model._default_manager.order_by('pk')
+        if pks is not None:
+            queryset = queryset.filter(pk__in=pks)
+        for row in queryset.values_list('pk', *self.fields).iterator(chunk_size=2000):
+            yield (row[0], *('' if value is None else str(value) for value in row[1:]))
+
+
+DOCUMENTS = {
+    'student': SearchDocument('student', Student, ('student_id', 'user__first_name', 'user__last_name', 'grade')),
+    'route': SearchDocument('route', Route, ('name', 'start_point', 'end_point')),
+    'bus': SearchDocument('bus', Bus, ('bus_number', 'driver_name')),
+}
+
+MODEL_DOCUMENTS = {document.model: name for name, document in DOCUMENTS.items()}
+
+# User fields indexed with their student.
+STUDENT_USER_FIELDS = {'first_name', 'last_name'}
+
+
+class FTS5SearchBackend:
+    """
+    One FTS5 virtual table per document, keyed by the object's primary key
+    as its rowid, with prefix indexes so type-ahead queries stay fast.
+    """
+
+    def __init__(self, using='default', tokenize='unicode61 remove_diacritics 2', prefix='1 2 3'):
+        self.using = using
+        self.tokenize = tokenize
+        self.prefix = prefix
+
+    @property
+    def connection(self):
+        return connections[self.using]
+
+    def is_available(self):
+        return self.connection.vendor == 'sqlite'
+
+    def table(self, document):
+        return f'core_search_{document.name}'
+
+    def exists(self, document):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [self.table(document)]
+            )
+            return cursor.fetchone() is not None
+
+    def create(self, document):
+        """
+        Create the document's table unless it exists; return whether it was
+        created.
+        """
+        if self.exists(document):
+            return False
+        columns = ', '.join(document.columns)
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE {self.table(document)} USING fts5("
+                f"{columns}, tokenize = '{self.tokenize}', prefix = '{self.prefix}')"
+            )
+        return True
+
+    def write(self, document, rows):
+        placeholders = ', '.join(['%s'] * (len(document.fields) + 1))
+        with self.connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {self.table(document)} (rowid, {', '.join(document.columns)}) VALUES ({placeholders})",
+                rows,
+            )
+
+    def delete(self, document, pks):
+        pks = list(pks)
+        if pks:
+            with self.connection.cursor() as cursor:
+                cursor.execute(
+                    f"DELETE FROM {self.table(document)} WHERE rowid IN ({', '.join(['%s'] * len(pks))})", pks
+                )
+
+    def update(self, document, pks):
+        self.delete(document, pks)
+        self.write(document, list(document.rows(pks)))
+
+    def rebuild(self, document, batch_size):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table(document)}")
+        batch = []
+        for row in document.rows():
+            batch.append(row)
+            if len(batch) >= batch_size:
+                self.write(document, batch)
+                batch = []
+        if batch:
+            self.write(document, batch)
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {self.table(document)}({self.table(document)}) VALUES ('optimize')")
+
+    def query(self, terms):
+        """
+        Turn search terms into an FTS5 query that requires every term as a
+        token prefix, e.g. ``jo sm`` -> ``"jo"* AND "sm"*``.
+        """
+        return ' AND '.join('"{}"*'.format(term.replace('"', '""')) for term in terms)
+
+    def matches(self, document, terms):
+        """
+        A ``RawSQL`` subquery of the primary keys matching ``terms``, for
+        filtering through a relation.
+        """
+        table = self.table(document)
+        return RawSQL(f"SELECT rowid FROM {table} WHERE {table} MATCH %s", [self.query(terms)])
+
+    def count_matches(self, document, terms, limit):
+        """
+        Count the matches of ``terms``, stopping at ``limit``.
+        """
+        table = self.table(document)
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT COUNT(*) FROM (SELECT 1 FROM {table} WHERE {table} MATCH %s LIMIT %s)",
+                [self.query(terms), limit],
+            )
+            return cursor.fetchone()[0]
+
+    def search(self, queryset, document, terms, ranked):
+        """
+        Join ``queryset`` to the index rows matching ``terms``, ordered by
+        bm25 rank if ``ranked``, otherwise in index order (the primary key),
+        which the index returns without sorting.
+        """
+        table = self.table(document)
+        pk = f'"{document.model._meta.db_table}"."{document.model._meta.pk.column}"'
+        queryset = queryset.extra(
+            select={'search_order': f'{table}.rank' if ranked else f'{table}.rowid'},
+            tables=[table],
+            where=[f'{table}.rowid = {pk}', f'{table} MATCH %s'],
+            params=[self.query(terms)],
+        )
+        return queryset.order_by('search_order', 'pk') if ranked else queryset.order_by('search_order')
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_search_backend():
+    """
+    Return the configured search backend, or ``None`` if search indexing is
+    disabled or unsupported by the database.
+    """
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                config = get_search_settings()
+                backend = False
+                if config['BACKEND']:
+                    backend = import_string(config['BACKEND'])(**config['OPTIONS'])
+                    if not backend.is_available():
+                        backend = False
+                _backend = backend
+    return _backend or None
+
+
+def update_index(name, pks):
+    backend = get_search_backend()
+    if backend is not None and pks:
+        backend.update(DOCUMENTS[name], pks)
+
+
+def remove_from_index(name, pks):
+    backend = get_search_backend()
+    if backend is not None and pks:
+        backend.delete(DOCUMENTS[name], pks)
+
+
+def create_indexes(rebuild_new=True):
+    """
+    Create missing index tables, filling the ones just created.
+    """
+    backend = get_search_backend()
+    if backend is None:
+        return []
+    created = [name for name, document in DOCUMENTS.items() if backend.create(document)]
+    if rebuild_new:
+        for name in created:
+            backend.rebuild(DOCUMENTS[name], get_search_settings()['BATCH_SIZE'])
+    return created
+
+
+def rebuild_index(names=None, batch_size=None):
+    """
+    Refill the given indexes (all by default) from the database.
+    """
+    backend = get_search_backend()
+    if backend is None:
+        return []
+    batch_size = batch_size or get_search_settings()['BATCH_SIZE']
+    names = names or list(DOCUMENTS)
+    for name in names:
+        backend.create(DOCUMENTS[name])
+        backend.rebuild(DOCUMENTS[name], batch_size)
+    return names
+
+
+class FullTextSearchFilter(filters.SearchFilter):
+    """
+    Search backed by the full-text index named by the view's
+    ``search_index``. Falls back to ``SearchFilter`` over ``search_fields``
+    when there is no index.
+
+    Matches are found through ``search_lookup`` (the primary key by default,
+    e.g. ``'student_id'`` to search attendance by student). When a view
+    searches its own model and no ``?ordering=`` is given, results come in
+    relevance order, or in primary key order if there are more than
+    ``RANK_LIMIT`` matches: ranking every match of a one-letter prefix
+    costs far more than the type-ahead it serves.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        name = getattr(view, 'search_index', None)
+        backend = get_search_backend()
+        terms = self.get_search_terms(request)
+        if not terms or name is None or backend is None:
+            return super().filter_queryset(request, queryset, view)
+
+        document = DOCUMENTS[name]
+        lookup = getattr(view, 'search_lookup', 'pk')
+        if lookup != 'pk' or queryset.model is not document.model or request.query_params.get(
+            api_settings.ORDERING_PARAM
+        ):
+            return queryset.filter(**{f'{lookup}__in': backend.matches(document, terms)})
+
+        view.search_ranked = True
+        limit = get_search_settings()['RANK_LIMIT']
+        ranked = backend.count_matches(document, terms, limit + 1) <= limit
+        return backend.search(queryset, document, terms, ranked)
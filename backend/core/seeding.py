@@ -0,0 +1,434 @@
+"""
+Synthetic data at production scale.
+
+``Seeder`` builds schools with buses, routes with geocoded stops, bus staff,
+students with their parents and route assignments, school days of
+attendance and GPS pings with the stop events they trigger. Every value is
+drawn from a ``random.Random(seed)``, so the same options and ``end`` date
+always produce the same data set. Rows are inserted with ``bulk_create``
+in batches, a million in a few minutes on SQLite.
+
+``seed_data`` is the command for local databases; ``perfcheck.seed_fixture``
+seeds the performance checks with it. Bulk inserts send no signals, so the
+route stops, search index, attendance summaries, caches and bus positions
+that signals keep in sync are refreshed here once everything is written.
+"""
+import math
+import random
+import time as clock
+from datetime import date, datetime, time, timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from .access import invalidate_access_scopes
+from .caching import invalidate_model_version
+from .eta import get_eta_engine
+from .geofence import get_geofence_engine
+from .models import (
+    AttendanceRecord, Bus, BusLocation, Route, RouteStop, StaffAssignment, StopEvent, Student,
+    StudentRouteAssignment,
+)
+from .positions import get_position_store, latest_locations
+from .rosters import invalidate_rosters
+from .search import update_index
+from .spatial import get_stop_index
+from .summaries import rebuild_summaries
+
+User = get_user_model()
+
+FIRST_NAMES = [
+    'Aarav', 'Aditi', 'Arjun', 'Diya', 'Ishaan', 'Kavya', 'Meera', 'Neel', 'Priya', 'Rahul',
+    'Riya', 'Rohan', 'Sara', 'Tara', 'Vihaan', 'Zoya', 'Anika', 'Dev', 'Kabir', 'Nisha',
+]
+LAST_NAMES = [
+    'Sharma', 'Iyer', 'Reddy', 'Nair', 'Patel', 'Gupta', 'Rao', 'Menon', 'Das', 'Singh',
+    'Kumar', 'Joshi', 'Pillai', 'Shetty', 'Verma', 'Bose',
+]
+# Share of each status in the generated attendance.
+STATUS_WEIGHTS = {'present': 90, 'absent': 5, 'late': 4, 'excused': 1}
+ORIGIN = (12.97, 77.59)
+KM_PER_DEGREE = 111.32
+MORNING_START = time(7, 0)
+AFTERNOON_START = time(15, 0)
+DWELL_SECONDS = 30
+EMAIL_DOMAIN = 'seed.tracko.com'
+# School days of attendance in a year.
+YEAR_DAYS = 200
+
+
+def school_days(end, count):
+    """
+    Return the ``count`` weekdays up to and including ``end``, oldest first.
+    """
+    days = []
+    day = end
+    while len(days) < count:
+        if day.weekday() < 5:
+            days.append(day)
+        day -= timedelta(days=1)
+    return days[::-1]
+
+
+def offset(point, north_km, east_km):
+    latitude, longitude = point
+    return (
+        latitude + north_km / KM_PER_DEGREE,
+        longitude + east_km / (KM_PER_DEGREE * math.cos(math.radians(latitude))),
+    )
+
+
+def distance_km(a, b):
+    north = (b[0] - a[0]) * KM_PER_DEGREE
+    east = (b[1] - a[1]) * KM_PER_DEGREE * math.cos(math.radians(a[0]))
+    return math.hypot(north, east)
+
+
+def bearing(a, b):
+    north = b[0] - a[0]
+    east = (b[1] - a[1]) * math.cos(math.radians(a[0]))
+    return math.degrees(math.atan2(east, north)) % 360
+
+
+class Seeder:
+    """
+    Generates one data set. ``buses`` and ``students`` are per school; a
+    share ``assigned`` of the students rides a bus, and attendance is
+    recorded for those. ``days`` school days of attendance and ``ping_days``
+    of pings (every ``ping_interval`` seconds during the morning and
+    afternoon trips) end on ``end``, yesterday by default.
+    """
+
+    def __init__(
+        self, schools=1, buses=10, routes_per_bus=1, stops=10, students=500, assigned=0.9, days=260,
+        ping_days=1, ping_interval=5, seed=0, end=None, password=None, batch_size=5000, log=None,
+    ):
+        self.schools = schools
+        self.buses = buses
+        self.routes_per_bus = routes_per_bus
+        self.stops = max(stops, 2)
+        self.students = students
+        self.assigned = assigned
+        self.ping_interval = ping_interval
+        self.batch_size = batch_size
+        self.password = password
+        self.log = log or (lambda message: None)
+        self.rng = random.Random(seed)
+        self.end = end or timezone.localdate() - timedelta(days=1)
+        self.days = school_days(self.end, days)
+        self.ping_days = self.days[len(self.days) - min(ping_days, days):] if ping_days else []
+        self.first_day = self.days[0] if self.days else self.end
+        self.counts = {}
+
+    def run(self):
+        """
+        Write the data set in one transaction and return the number of rows
+        per model.
+        """
+        with transaction.atomic():
+            password = make_password(self.password)
+            self.step('buses and routes', self.create_buses)
+            self.step('staff', self.create_staff, password)
+            self.step('students', self.create_students, password)
+            self.step('attendance', self.create_attendance)
+            self.step('pings and stop events', self.create_pings)
+            self.step('derived data', self.refresh_derived)
+        return self.counts
+
+    def step(self, name, function, *args):
+        started = clock.monotonic()
+        function(*args)
+        self.log(f"{name}: {clock.monotonic() - started:.1f}s")
+
+    def insert(self, model, rows, keep=True):
+        """
+        Bulk insert an iterable of unsaved instances in batches. Returns them
+        with their primary keys, or nothing for rows not needed afterwards.
+        """
+        saved = []
+        count = 0
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                self._insert_batch(model, batch, saved if keep else None)
+                count += len(batch)
+                batch = []
+        if batch:
+            self._insert_batch(model, batch, saved if keep else None)
+            count += len(batch)
+        self.counts[model._meta.label] = self.counts.get(model._meta.label, 0) + count
+        return saved if keep else None
+
+    def _insert_batch(self, model, batch, saved):
+        created = model.objects.bulk_create(batch)
+        if saved is not None:
+            saved.extend(created)
+
+    def name(self):
+        return self.rng.choice(FIRST_NAMES), self.rng.choice(LAST_NAMES)
+
+    def create_buses(self):
+        """
+        Each school sits on a grid around ``ORIGIN``; its routes leave it in
+        evenly spread directions, with stops from the far end to the school.
+        """
+        self.schools_at = [
+            offset(ORIGIN, (school // 4) * 15, (school % 4) * 15) for school in range(self.schools)
+        ]
+        self.buses_saved = self.insert(Bus, (
+            Bus(
+                bus_number=f'S{school + 1:02d}-{number + 1:03d}', capacity=self.rng.choice([40, 50, 60]),
+                driver_name=' '.join(self.name()), driver_contact=f'9{self.rng.randrange(10 ** 9):09d}',
+            )
+            for school in range(self.schools)
+            for number in range(self.buses)
+        ))
+        routes = []
+        schools = []
+        for index, bus in enumerate(self.buses_saved):
+            school = index // self.buses
+            for number in range(self.routes_per_bus):
+                heading = 2 * math.pi * (index % self.buses * self.routes_per_bus + number) / max(
+                    self.buses * self.routes_per_bus, 1
+                )
+                length = self.rng.uniform(4, 12)
+                school_at = self.schools_at[school]
+                points = [
+                    offset(
+                        school_at,
+                        math.cos(heading) * length * (1 - stop / (self.stops - 1)),
+                        math.sin(heading) * length * (1 - stop / (self.stops - 1)),
+                    )
+                    for stop in range(self.stops)
+                ]
+                stops = [
+                    {'name': f'S{school + 1:02d} R{index % self.buses + 1}.{number + 1} Stop {stop + 1}',
+                     'latitude': round(latitude, 6), 'longitude': round(longitude, 6)}
+                    for stop, (latitude, longitude) in enumerate(points[:-1])
+                ]
+                stops.append({
+                    'name': f'School {school + 1}', 'latitude': round(points[-1][0], 6),
+                    'longitude': round(points[-1][1], 6),
+                })
+                speed = self.rng.uniform(18, 30)
+                routes.append(Route(
+                    name=f'School {school + 1} Route {index % self.buses + 1}.{number + 1}', bus=bus,
+                    start_point=stops[0]['name'], end_point=stops[-1]['name'], stops=stops,
+                    distance=round(length, 2),
+                    estimated_duration=timedelta(
+                        minutes=round(length / speed * 60 + DWELL_SECONDS * self.stops / 60)
+                    ),
+                ))
+                schools.append(school)
+        self.routes = self.insert(Route, routes)
+        self.routes_of_school = [[] for _ in range(self.schools)]
+        for school, route in zip(schools, self.routes):
+            self.routes_of_school[school].append(route)
+        self.insert(RouteStop, (RouteStop(**stop) for route in self.routes for stop in route.parsed_stops()))
+        self.trips = {route.pk: self.trip(route) for route in self.routes}
+
+    def trip(self, route):
+        """
+        Plan the morning trip of a route: the bus stops ``DWELL_SECONDS`` at
+        every stop and drives between them at a steady speed. Returns the
+        seconds after departure of each arrival and the legs
+        ``(start, end, from, to, speed)``.
+        """
+        points = [(stop['latitude'], stop['longitude']) for stop in route.stops]
+        total = sum(distance_km(a, b) for a, b in zip(points, points[1:]))
+        driving = route.estimated_duration.total_seconds() - DWELL_SECONDS * len(points)
+        speed = total / max(driving, 1) * 3600
+        arrivals = []
+        legs = []
+        seconds = 0.0
+        for index, point in enumerate(points):
+            arrivals.append(seconds)
+            legs.append((seconds, seconds + DWELL_SECONDS, point, point, 0.0))
+            seconds += DWELL_SECONDS
+            if index + 1 < len(points):
+                duration = distance_km(point, points[index + 1]) / speed * 3600
+                legs.append((seconds, seconds + duration, point, points[index + 1], speed))
+                seconds += duration
+        return arrivals, legs, seconds
+
+    def create_staff(self, password):
+        """
+        One bus staff member per bus, assigned to it since the first day.
+        """
+        buses = self.buses_saved
+        staff = self.insert(User, (
+            User(
+                email=f'staff.{bus.bus_number.lower()}@{EMAIL_DOMAIN}', first_name=first, last_name=last,
+                role='bus_staff', password=password,
+            )
+            for bus in buses
+            for first, last in [self.name()]
+        ))
+        self.staff_of_bus = {bus.pk: user.pk for bus, user in zip(buses, staff)}
+        self.insert(StaffAssignment, (
+            StaffAssignment(staff=user, bus=bus, valid_from=self.first_day) for bus, user in zip(buses, staff)
+        ))
+
+    def create_students(self, password):
+        """
+        Students with one or two parents (a fifth of them share their
+        parents with a sibling), assigned to a random route of their school.
+        """
+        users = []
+        students = []
+        for school in range(self.schools):
+            for number in range(self.students):
+                first, last = self.name()
+                grade = 1 + self.rng.randrange(12)
+                users.append(User(
+                    email=f'student.{school + 1}.{number + 1}@{EMAIL_DOMAIN}', first_name=first,
+                    last_name=last, role='student', password=password,
+                ))
+                students.append(Student(
+                    student_id=f'S{school + 1:02d}{number + 1:06d}', grade=str(grade),
+                    date_of_birth=date(self.end.year - 5 - grade, 1, 1) + timedelta(days=self.rng.randrange(365)),
+                    address=f'{self.rng.randrange(1, 500)} {last} Street',
+                    emergency_contact=f'9{self.rng.randrange(10 ** 9):09d}',
+                ))
+        for user, student in zip(self.insert(User, users), students):
+            student.user_id = user.pk
+        self.students_saved = self.insert(Student, students)
+
+        parents = []
+        links = []
+        for index, student in enumerate(self.students_saved):
+            if parents and self.rng.random() < 0.2:
+                links.append((student, links[-1][1]))
+                continue
+            family = []
+            for _ in range(1 if self.rng.random() < 0.3 else 2):
+                first, _ = self.name()
+                parents.append(User(
+                    email=f'parent.{len(parents) + 1}@{EMAIL_DOMAIN}', first_name=first,
+                    last_name=LAST_NAMES[index % len(LAST_NAMES)], role='parent', password=password,
+                ))
+                family.append(len(parents) - 1)
+            links.append((student, family))
+        parents = self.insert(User, parents)
+        self.insert(Student.parents.through, (
+            Student.parents.through(student_id=student.pk, user_id=parents[parent].pk)
+            for student, family in links
+            for parent in family
+        ))
+
+        assignments = []
+        self.riders = []
+        for index, student in enumerate(self.students_saved):
+            if self.rng.random() >= self.assigned:
+                continue
+            route = self.rng.choice(self.routes_of_school[index // self.students])
+            arrivals = self.trips[route.pk][0]
+            stop = self.rng.randrange(len(route.stops) - 1)
+            pickup = datetime.combine(self.end, MORNING_START) + timedelta(seconds=arrivals[stop])
+            drop = datetime.combine(self.end, AFTERNOON_START) + timedelta(seconds=arrivals[-1] - arrivals[stop])
+            assignments.append(StudentRouteAssignment(
+                student=student, route=route, pickup_point=route.stops[stop]['name'],
+                pickup_time=pickup.time().replace(second=0, microsecond=0), drop_point=route.stops[stop]['name'],
+                drop_time=drop.time().replace(second=0, microsecond=0),
+            ))
+            self.riders.append((student.pk, route.pk, self.staff_of_bus[route.bus_id]))
+        self.insert(StudentRouteAssignment, assignments)
+
+    def create_attendance(self):
+        statuses = list(STATUS_WEIGHTS)
+        weights = list(STATUS_WEIGHTS.values())
+
+        def records():
+            for day in self.days:
+                drawn = self.rng.choices(statuses, weights, k=len(self.riders))
+                for (student_id, route_id, staff_id), status in zip(self.riders, drawn):
+                    yield AttendanceRecord(
+                        student_id=student_id, route_id=route_id, date=day, status=status, recorded_by_id=staff_id,
+                    )
+
+        self.insert(AttendanceRecord, records(), keep=False)
+
+    def create_pings(self):
+        """
+        Pings along the morning trip and its reverse in the afternoon, with
+        a few metres of GPS noise, plus an arrival and a departure event per
+        stop. Trips start up to five minutes late.
+        """
+        now = timezone.now()
+        pings = []
+        events = []
+        for day in self.ping_days:
+            for route in self.routes:
+                arrivals, legs, duration = self.trips[route.pk]
+                names = [stop['name'] for stop in route.stops]
+                for start, reverse in ((MORNING_START, False), (AFTERNOON_START, True)):
+                    departure = timezone.make_aware(datetime.combine(day, start)) + timedelta(
+                        seconds=self.rng.randrange(300)
+                    )
+                    pings.append(self.trip_pings(route.bus_id, departure, legs, duration, reverse, now))
+                    for sequence, arrival in enumerate(arrivals):
+                        if reverse:
+                            sequence = len(arrivals) - 1 - sequence
+                            arrival = duration - arrivals[sequence] - DWELL_SECONDS
+                        arrived = departure + timedelta(seconds=arrival)
+                        departed = arrived + timedelta(seconds=DWELL_SECONDS)
+                        for event_type, at in ((StopEvent.ARRIVAL, arrived), (StopEvent.DEPARTURE, departed)):
+                            if at <= now:
+                                events.append(StopEvent(
+                                    bus_id=route.bus_id, route_id=route.pk, stop_sequence=sequence,
+                                    stop_name=names[sequence], event_type=event_type, occurred_at=at, date=day,
+                                ))
+        self.insert(BusLocation, (ping for trip in pings for ping in trip), keep=False)
+        self.insert(StopEvent, events, keep=False)
+
+    def trip_pings(self, bus_id, departure, legs, duration, reverse, now):
+        if reverse:
+            legs = [
+                (duration - end, duration - start, to, from_, speed)
+                for start, end, from_, to, speed in reversed(legs)
+            ]
+        leg = 0
+        seconds = 0.0
+        while seconds <= duration:
+            while leg < len(legs) - 1 and seconds > legs[leg][1]:
+                leg += 1
+            start, end, from_, to, speed = legs[leg]
+            share = (seconds - start) / (end - start) if end > start else 0
+            latitude = from_[0] + (to[0] - from_[0]) * share + self.rng.gauss(0, 0.00003)
+            longitude = from_[1] + (to[1] - from_[1]) * share + self.rng.gauss(0, 0.00003)
+            recorded_at = departure + timedelta(seconds=seconds)
+            if recorded_at > now:
+                return
+            yield BusLocation(
+                bus_id=bus_id, latitude=round(latitude, 6), longitude=round(longitude, 6),
+                speed=round(speed, 1), heading=round(bearing(from_, to), 1) if speed else None,
+                recorded_at=recorded_at,
+            )
+            seconds += self.ping_interval
+
+    def refresh_derived(self):
+        """
+        Do what the signals of single saves would have done.
+        """
+        get_stop_index().replace_routes({route.pk: route.parsed_stops() for route in self.routes})
+        get_eta_engine().invalidate()
+        get_geofence_engine().invalidate()
+        documents = {
+            'bus': [bus.pk for bus in self.buses_saved],
+            'route': [route.pk for route in self.routes],
+            'student': [student.pk for student in self.students_saved],
+        }
+        for name, pks in documents.items():
+            for start in range(0, len(pks), self.batch_size):
+                update_index(name, pks[start:start + self.batch_size])
+        if self.days:
+            list(rebuild_summaries(start=self.first_day, end=self.end))
+        for model in (Bus, Route, User, Student, StudentRouteAssignment, StaffAssignment):
+            invalidate_model_version(model)
+        invalidate_rosters([route.pk for route in self.routes])
+        invalidate_access_scopes()
+        if self.ping_days:
+            get_position_store().update(latest_locations())
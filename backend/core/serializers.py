@@ -1,6 +1,12 @@
+import math
+
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
-from .models import Student, Bus, Route, StudentRouteAssignment, AttendanceRecord
+from .models import (
+    Student, Bus, BusLocation, Route, RouteStop, StopEvent, StudentRouteAssignment, StaffAssignment,
+    AttendanceRecord, RouteAttendanceDaily, GradeAttendanceDaily, StudentAttendanceMonthly, parse_coordinates
+)
+from .positions import get_position_store
 
 User = get_user_model()
 
@@ -11,7 +17,8 @@ class StudentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Student
         fields = '__all__'
-        read_only_fields = ('created_at', 'updated_at')
+        # Parent links decide what parents can see, so they are set in the admin.
+        read_only_fields = ('parents', 'created_at', 'updated_at')
 
     def get_user_details(self, obj):
         user = obj.user
@@ -22,29 +29,162 @@ class StudentSerializer(serializers.ModelSerializer):
             'phone_number': user.phone_number
         }
 
-class BusSerializer(serializers.ModelSerializer):
+class StudentImportRowSerializer(serializers.Serializer):
+    """
+    Validates one row of a student import without touching the database;
+    uniqueness and route ids are checked for the whole file at once. Rows
+    without a password get an unusable one.
+    """
+    email = serializers.EmailField()
+    first_name = serializers.CharField(max_length=150)
+    last_name = serializers.CharField(max_length=150)
+    password = serializers.CharField(required=False)
+    phone_number = serializers.CharField(max_length=15, required=False)
+    student_id = serializers.CharField(max_length=20)
+    grade = serializers.CharField(max_length=10)
+    date_of_birth = serializers.DateField()
+    address = serializers.CharField()
+    emergency_contact = serializers.CharField(max_length=15)
+    route = serializers.IntegerField(min_value=1, required=False)
+    pickup_point = serializers.CharField(max_length=255, required=False)
+    pickup_time = serializers.TimeField(required=False)
+    drop_point = serializers.CharField(max_length=255, required=False)
+    drop_time = serializers.TimeField(required=False)
+
+    def validate(self, data):
+        if data.get('route'):
+            missing = [
+                field for field in ('pickup_point', 'pickup_time', 'drop_point', 'drop_time')
+                if field not in data
+            ]
+            if missing:
+                raise serializers.ValidationError({field: ["Required when a route is given."] for field in missing})
+        return data
+
+class PositionListSerializer(serializers.ListSerializer):
+    """
+    Fetches the last known positions for a whole page of buses or routes in
+    one call to the position store before the items are serialized.
+    """
+
+    def to_representation(self, data):
+        items = data.all() if hasattr(data, 'all') else data
+        bus_ids = [self.child.get_position_bus_id(item) for item in items]
+        self.child.context['positions'] = get_position_store().get_many(
+            [bus_id for bus_id in bus_ids if bus_id is not None]
+        )
+        return [self.child.to_representation(item) for item in items]
+
+class PositionFieldMixin:
+    """
+    Reads bus positions from the last-known-position store, never from the database.
+    """
+
+    def get_position_bus_id(self, obj):
+        raise NotImplementedError
+
+    def get_position(self, obj):
+        bus_id = self.get_position_bus_id(obj)
+        if bus_id is None:
+            return None
+        positions = self.context.get('positions')
+        if positions is not None:
+            return positions.get(bus_id)
+        return get_position_store().get(bus_id)
+
+class BusSerializer(PositionFieldMixin, serializers.ModelSerializer):
+    last_position = serializers.SerializerMethodField()
+
     class Meta:
         model = Bus
         fields = '__all__'
         read_only_fields = ('created_at', 'updated_at')
+        list_serializer_class = PositionListSerializer
+
+    def get_position_bus_id(self, obj):
+        return obj.pk
 
-class RouteSerializer(serializers.ModelSerializer):
+    def get_last_position(self, obj):
+        return self.get_position(obj)
+
+def validate_finite(value):
+    if value is not None and not math.isfinite(value):
+        raise serializers.ValidationError("Must be a finite number.")
+
+
+class PingSerializer(serializers.Serializer):
+    """
+    Validates a single GPS ping without touching the database.
+
+    Bus ids are checked in one query for the whole batch by the ingestion
+    view, so this serializer deliberately uses a plain integer field.
+    """
+    bus = serializers.IntegerField(min_value=1)
+    latitude = serializers.FloatField(min_value=-90, max_value=90, validators=[validate_finite])
+    longitude = serializers.FloatField(min_value=-180, max_value=180, validators=[validate_finite])
+    speed = serializers.FloatField(min_value=0, required=False, allow_null=True, validators=[validate_finite])
+    heading = serializers.FloatField(
+        min_value=0, max_value=360, required=False, allow_null=True, validators=[validate_finite]
+    )
+    recorded_at = serializers.DateTimeField()
+
+class BusLocationSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = BusLocation
+        fields = ('id', 'bus', 'latitude', 'longitude', 'speed', 'heading', 'recorded_at')
+
+class RouteSerializer(PositionFieldMixin, serializers.ModelSerializer):
     bus_details = serializers.SerializerMethodField()
 
     class Meta:
         model = Route
         fields = '__all__'
         read_only_fields = ('created_at', 'updated_at')
+        list_serializer_class = PositionListSerializer
+
+    def get_position_bus_id(self, obj):
+        return obj.bus_id
+
+    def validate_stops(self, value):
+        if not isinstance(value, list):
+            raise serializers.ValidationError("Stops must be a list.")
+        for position, stop in enumerate(value, start=1):
+            if isinstance(stop, str):
+                continue
+            if not isinstance(stop, dict):
+                raise serializers.ValidationError(
+                    f"Stop {position} must be a name or an object with name, latitude and longitude."
+                )
+            latitude = stop.get('latitude', stop.get('lat'))
+            longitude = stop.get('longitude', stop.get('lon', stop.get('lng')))
+            if (latitude is None) != (longitude is None):
+                raise serializers.ValidationError(f"Stop {position} needs both latitude and longitude.")
+            if latitude is not None and parse_coordinates(latitude, longitude) is None:
+                raise serializers.ValidationError(
+                    f"Stop {position} needs numeric coordinates within range (latitude ±90, longitude ±180)."
+                )
+        return value
 
     def get_bus_details(self, obj):
         if obj.bus:
             return {
                 'bus_number': obj.bus.bus_number,
                 'driver_name': obj.bus.driver_name,
-                'driver_contact': obj.bus.driver_contact
+                'driver_contact': obj.bus.driver_contact,
+                'last_position': self.get_position(obj)
             }
         return None
 
+class RouteStopSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = RouteStop
+        fields = ('id', 'route', 'sequence', 'name', 'latitude', 'longitude')
+
+class StopEventSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = StopEvent
+        fields = '__all__'
+
 class StudentRouteAssignmentSerializer(serializers.ModelSerializer):
     student_details = serializers.SerializerMethodField()
     route_details = serializers.SerializerMethodField()
@@ -69,6 +209,37 @@ class StudentRouteAssignmentSerializer(serializers.ModelSerializer):
             'bus_number': obj.route.bus.bus_number if obj.route.bus else None
         }
 
+class StaffAssignmentSerializer(serializers.ModelSerializer):
+    staff = serializers.PrimaryKeyRelatedField(queryset=User.objects.filter(role='bus_staff'))
+
+    class Meta:
+        model = StaffAssignment
+        fields = '__all__'
+        read_only_fields = ('created_at', 'updated_at')
+
+    def validate(self, attrs):
+        def current(field):
+            return attrs.get(field, getattr(self.instance, field, None))
+
+        bus, route = current('bus'), current('route')
+        if route is not None and route.bus_id != bus.pk:
+            raise serializers.ValidationError({"route": ["Route is not served by this bus."]})
+        valid_from, valid_until = current('valid_from'), current('valid_until')
+        if valid_until is not None and valid_until < valid_from:
+            raise serializers.ValidationError({"valid_until": ["Must not be before valid_from."]})
+        return attrs
+
+class AttendanceEntrySerializer(serializers.Serializer):
+    """
+    Validates one row of a bulk attendance submission without touching the
+    database; student and route ids are checked for the whole batch at once.
+    """
+    student = serializers.IntegerField(min_value=1)
+    date = serializers.DateField()
+    status = serializers.ChoiceField(choices=AttendanceRecord.ATTENDANCE_CHOICES)
+    route = serializers.IntegerField(min_value=1, required=False, allow_null=True)
+    notes = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+
 class AttendanceRecordSerializer(serializers.ModelSerializer):
     student_details = serializers.SerializerMethodField()
     recorded_by_details = serializers.SerializerMethodField()
@@ -104,3 +275,28 @@ class AttendanceRecordSerializer(serializers.ModelSerializer):
                 'bus_number': obj.route.bus.bus_number if obj.route.bus else None
             }
         return None
+
+ATTENDANCE_COUNT_FIELDS = ('present', 'absent', 'late', 'excused', 'total', 'present_rate')
+
+class RouteAttendanceDailySerializer(serializers.ModelSerializer):
+    route_name = serializers.CharField(source='route.name', read_only=True)
+    present_rate = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = RouteAttendanceDaily
+        fields = ('id', 'route', 'route_name', 'date') + ATTENDANCE_COUNT_FIELDS
+
+class GradeAttendanceDailySerializer(serializers.ModelSerializer):
+    present_rate = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = GradeAttendanceDaily
+        fields = ('id', 'grade', 'date') + ATTENDANCE_COUNT_FIELDS
+
+class StudentAttendanceMonthlySerializer(serializers.ModelSerializer):
+    student_name = serializers.CharField(source='student.user.get_full_name', read_only=True)
+    present_rate = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = StudentAttendanceMonthly
+        fields = ('id', 'student', 'student_name', 'month') + ATTENDANCE_COUNT_FIELDS
@@ -0,0 +1,277 @@
+from django.contrib.auth import get_user_model
+from django.db.backends.signals import connection_created
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_migrate, post_save, pre_save
+from django.dispatch import Signal, receiver
+
+from .access import invalidate_access_scopes
+from .caching import invalidate_model_version
+from .eta import get_eta_engine
+from .geofence import get_geofence_engine
+from .live import publish_locations
+from .models import (
+    AttendanceRecord, Bus, Route, StaffAssignment, StopEvent, Student, StudentRouteAssignment
+)
+from .positions import get_position_store
+from .rosters import ROSTER_USER_FIELDS, invalidate_rosters, invalidate_student_rosters
+from .search import MODEL_DOCUMENTS, STUDENT_USER_FIELDS, create_indexes, remove_from_index, update_index
+from .spatial import get_stop_index
+from .summaries import SUMMARIES, record_row, refresh_summaries
+from .writer import configure_connection
+
+# Sent with ``locations`` (a list of unsaved BusLocation instances) as soon as
+# a batch of pings has been accepted, before it is written to the database.
+pings_received = Signal()
+
+User = get_user_model()
+
+
+@receiver(connection_created)
+def configure_sqlite_connection(sender, connection, **kwargs):
+    configure_connection(connection)
+
+
+@receiver(pings_received)
+def update_position_store(sender, locations, **kwargs):
+    """
+    Record the newest position of each bus in the last-known-position store.
+    """
+    get_position_store().update(locations)
+
+
+@receiver(pings_received)
+def detect_stop_events(sender, locations, **kwargs):
+    """
+    Record stop arrivals and departures caused by new positions.
+    """
+    events = get_geofence_engine().process(locations)
+    if events:
+        StopEvent.objects.bulk_create(events, ignore_conflicts=True)
+
+
+@receiver(pings_received)
+def update_eta_engine(sender, locations, **kwargs):
+    """
+    Feed new positions to the ETA engine, which recomputes affected routes.
+    """
+    get_eta_engine().observe(locations)
+
+
+@receiver(pings_received)
+def push_live_positions(sender, locations, **kwargs):
+    """
+    Fan the newest position of each bus out to WebSocket subscribers.
+    """
+    publish_locations(locations)
+
+
+@receiver(post_save, sender=Bus)
+def evict_inactive_bus_position(sender, instance, **kwargs):
+    """
+    Drop the cached position of a bus that has been taken out of service.
+    """
+    if not instance.is_active:
+        get_position_store().evict([instance.pk])
+
+
+@receiver(post_delete, sender=Bus)
+def evict_deleted_bus_position(sender, instance, **kwargs):
+    get_position_store().evict([instance.pk])
+
+
+@receiver(post_save, sender=Route)
+def sync_route_stops(sender, instance, **kwargs):
+    """
+    Mirror ``Route.stops`` into ``RouteStop`` rows and the stop index.
+    """
+    stops, _ = instance.sync_route_stops()
+
+    index = get_stop_index()
+    if instance.is_active:
+        index.replace_route(instance.pk, stops)
+    else:
+        index.remove_route(instance.pk)
+    get_eta_engine().invalidate()
+    get_geofence_engine().invalidate()
+
+
+@receiver(post_delete, sender=Route)
+def remove_route_stops(sender, instance, **kwargs):
+    get_stop_index().remove_route(instance.pk)
+    get_eta_engine().invalidate()
+    get_geofence_engine().invalidate()
+    invalidate_rosters([instance.pk])
+
+
+@receiver(pre_save, sender=AttendanceRecord)
+def remember_attendance_summary_row(sender, instance, raw=False, **kwargs):
+    """
+    Keep the summary keys of a record that is about to change, so the
+    summaries it leaves are refreshed too.
+    """
+    instance._previous_summary_rows = []
+    if instance.pk and not raw:
+        instance._previous_summary_rows = list(
+            AttendanceRecord.objects.filter(pk=instance.pk)
+            .annotate(grade=F('student__grade'))
+            .values('student_id', 'grade', 'route_id', 'date')
+        )
+
+
+@receiver(post_save, sender=AttendanceRecord)
+def update_attendance_summaries(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    refresh_summaries(getattr(instance, '_previous_summary_rows', []) + [record_row(instance)])
+
+
+@receiver(post_delete, sender=AttendanceRecord)
+def remove_from_attendance_summaries(sender, instance, **kwargs):
+    refresh_summaries([record_row(instance)])
+
+
+@receiver(pre_save, sender=Student)
+def remember_student_grade(sender, instance, raw=False, **kwargs):
+    instance._previous_grade = None
+    if instance.pk and not raw:
+        instance._previous_grade = Student.objects.filter(pk=instance.pk).values_list('grade', flat=True).first()
+
+
+@receiver(post_save, sender=Student)
+def move_grade_attendance(sender, instance, raw=False, **kwargs):
+    """
+    Re-count the student's attendance days under their new grade.
+    """
+    previous = getattr(instance, '_previous_grade', None)
+    if raw or previous is None or previous == instance.grade:
+        return
+    dates = set(AttendanceRecord.objects.filter(student=instance).values_list('date', flat=True))
+    SUMMARIES['grade-daily'].refresh(
+        {(grade, day) for grade in (previous, instance.grade) for day in dates}
+    )
+
+
+@receiver(pre_save, sender=StudentRouteAssignment)
+def remember_assignment_route(sender, instance, raw=False, **kwargs):
+    instance._previous_route_id = None
+    if instance.pk and not raw:
+        instance._previous_route_id = (
+            StudentRouteAssignment.objects.filter(pk=instance.pk).values_list('route_id', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=StudentRouteAssignment)
+@receiver(post_delete, sender=StudentRouteAssignment)
+def invalidate_assignment_rosters(sender, instance, **kwargs):
+    """
+    Drop the cached roster of the route an assignment is on, and was on.
+    """
+    invalidate_rosters([instance.route_id, getattr(instance, '_previous_route_id', None)])
+
+
+@receiver(post_save, sender=Student)
+def invalidate_student_rosters_on_save(sender, instance, created=False, **kwargs):
+    if not created:
+        invalidate_student_rosters(student_ids=[instance.pk])
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_rosters(sender, instance, created=False, update_fields=None, **kwargs):
+    if created:
+        return
+    if update_fields is not None and not ROSTER_USER_FIELDS.intersection(update_fields):
+        return
+    invalidate_student_rosters(user_ids=[instance.pk])
+
+
+@receiver(m2m_changed, sender=Student.parents.through)
+def invalidate_scopes_on_parent_change(sender, instance, action, reverse, pk_set=None, **kwargs):
+    """
+    Parent links change both the parents' scopes and the children's rosters.
+    """
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    invalidate_access_scopes()
+    if not reverse:
+        invalidate_student_rosters(student_ids=[instance.pk])
+    elif pk_set:
+        invalidate_student_rosters(student_ids=pk_set)
+    else:
+        invalidate_student_rosters(student_ids=list(instance.children.values_list('pk', flat=True)))
+
+
+@receiver(post_save, sender=StudentRouteAssignment)
+@receiver(post_delete, sender=StudentRouteAssignment)
+@receiver(post_delete, sender=Student)
+@receiver(post_save, sender=Route)
+@receiver(post_delete, sender=Route)
+@receiver(post_save, sender=StaffAssignment)
+@receiver(post_delete, sender=StaffAssignment)
+def invalidate_scopes(sender, **kwargs):
+    """
+    Drop cached access scopes when the links they are derived from change.
+    """
+    invalidate_access_scopes()
+
+
+@receiver(post_save, sender=Student)
+def invalidate_scopes_on_new_student(sender, instance, created, raw=False, **kwargs):
+    """
+    A student's own scope is empty until their profile exists.
+    """
+    if created and not raw:
+        invalidate_access_scopes()
+
+
+@receiver(post_migrate)
+def create_search_indexes(sender, **kwargs):
+    """
+    Create (and fill) the full-text search tables, which are not models.
+    """
+    if sender.name == 'core':
+        create_indexes()
+
+
+@receiver(post_save, sender=Student)
+@receiver(post_save, sender=Route)
+@receiver(post_save, sender=Bus)
+def update_search_index(sender, instance, **kwargs):
+    update_index(MODEL_DOCUMENTS[sender], [instance.pk])
+
+
+@receiver(post_delete, sender=Student)
+@receiver(post_delete, sender=Route)
+@receiver(post_delete, sender=Bus)
+def remove_from_search_index(sender, instance, **kwargs):
+    remove_from_index(MODEL_DOCUMENTS[sender], [instance.pk])
+
+
+@receiver(post_save, sender=User)
+def update_student_search_index(sender, instance, created=False, update_fields=None, **kwargs):
+    if created or (update_fields is not None and not STUDENT_USER_FIELDS.intersection(update_fields)):
+        return
+    update_index('student', list(Student.objects.filter(user=instance).values_list('pk', flat=True)))
+
+
+@receiver(post_save, sender=Bus)
+@receiver(post_delete, sender=Bus)
+@receiver(post_save, sender=Route)
+@receiver(post_delete, sender=Route)
+@receiver(post_save, sender=Student)
+@receiver(post_delete, sender=Student)
+@receiver(post_save, sender=StudentRouteAssignment)
+@receiver(post_delete, sender=StudentRouteAssignment)
+@receiver(post_save, sender=StaffAssignment)
+@receiver(post_delete, sender=StaffAssignment)
+@receiver(post_delete, sender=User)
+def invalidate_cached_responses(sender, **kwargs):
+    """
+    Change the ETags of the cached responses built from this model.
+    """
+    invalidate_model_version(sender)
+
+
+@receiver(post_save, sender=User)
+def invalidate_cached_responses_on_user_change(sender, instance, created=False, update_fields=None, **kwargs):
+    if update_fields is None or not set(update_fields) <= {'last_login'}:
+        invalidate_model_version(User)
@@ -0,0 +1,294 @@
+"""
+In-memory spatial index over route stops.
+
+Stops are bucketed into a fixed-size latitude/longitude grid. Nearest
+neighbour and radius queries only visit the cells around the query point,
+expanding ring by ring, so lookups stay well under a millisecond with tens
+of thousands of stops; a point far from every stop falls back to one linear
+pass over the candidates. The index is loaded from ``RouteStop`` per process
+and updated route by route when that process saves a ``Route``; it is
+reloaded every ``MAX_AGE`` seconds so that changes made by other processes
+show up too. Updates build a new grid and swap it in, so queries search a
+snapshot without holding the lock.
+"""
+import math
+import threading
+import time
+
+from django.conf import settings
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+DEFAULTS = {
+    'CELL_DEGREES': 0.01,
+    'MAX_AGE': 60,
+}
+
+
+def get_stop_index_settings():
+    return {**DEFAULTS, **getattr(settings, 'STOP_INDEX', {})}
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class GeoGrid:
+    """
+    Grid of ``cell_degrees`` wide cells mapping keys to points.
+    """
+
+    def __init__(self, cell_degrees=0.01):
+        self.cell_degrees = cell_degrees
+        self._cells = {}
+        self._points = {}
+        # Bounding box of every cell ever populated; never shrinks, which
+        # keeps it a safe upper bound for the ring search.
+        self._bounds = None
+
+    def __len__(self):
+        return len(self._points)
+
+    def _cell(self, latitude, longitude):
+        return (
+            math.floor(latitude / self.cell_degrees),
+            math.floor(longitude / self.cell_degrees),
+        )
+
+    def insert(self, key, latitude, longitude, payload=None):
+        self.remove(key)
+        cell = self._cell(latitude, longitude)
+        self._points[key] = (latitude, longitude, payload, cell)
+        self._cells.setdefault(cell, set()).add(key)
+        if self._bounds is None:
+            self._bounds = (cell[0], cell[0], cell[1], cell[1])
+        else:
+            min_row, max_row, min_col, max_col = self._bounds
+            self._bounds = (
+                min(min_row, cell[0]), max(max_row, cell[0]),
+                min(min_col, cell[1]), max(max_col, cell[1]),
+            )
+
+    def remove(self, key):
+        point = self._points.pop(key, None)
+        if point is None:
+            return
+        cell = point[3]
+        members = self._cells[cell]
+        members.discard(key)
+        if not members:
+            del self._cells[cell]
+
+    def copy(self):
+        grid = GeoGrid(self.cell_degrees)
+        grid._cells = {cell: set(keys) for cell, keys in self._cells.items()}
+        grid._points = dict(self._points)
+        grid._bounds = self._bounds
+        return grid
+
+    def _ring(self, center, radius):
+        row, col = center
+        if radius == 0:
+            yield center
+            return
+        for dc in range(-radius, radius + 1):
+            yield (row - radius, col + dc)
+            yield (row + radius, col + dc)
+        for dr in range(-radius + 1, radius):
+            yield (row + dr, col - radius)
+            yield (row + dr, col + radius)
+
+    def _ring_min_km(self, latitude, radius):
+        """
+        Lower bound on the distance from the query point to any point in
+        ring ``radius`` (or further out).
+        """
+        if radius <= 1:
+            return 0.0
+        degrees = (radius - 1) * self.cell_degrees
+        widest = min(89.9, abs(latitude) + degrees)
+        return degrees * KM_PER_DEGREE * math.cos(math.radians(widest))
+
+    def _max_ring(self, center):
+        """
+        Number of rings around ``center`` needed to reach every populated cell.
+        """
+        if self._bounds is None:
+            return -1
+        min_row, max_row, min_col, max_col = self._bounds
+        row, col = center
+        return max(abs(min_row - row), abs(max_row - row), abs(min_col - col), abs(max_col - col))
+
+    def nearest(self, latitude, longitude, limit=1, max_km=None, keys=None):
+        """
+        Return up to ``limit`` ``(distance_km, key, payload)`` tuples,
+        closest first, only among ``keys`` (a set) when given.
+
+        Rings are visited until the closest points are known or the cells
+        visited would outnumber the candidate points; from then on a linear
+        scan over the candidates is cheaper, and bounds the cost of a point
+        far from every stop.
+        """
+        candidates = len(self._points) if keys is None else len(keys)
+        center = self._cell(latitude, longitude)
+        found = []
+        max_ring = self._max_ring(center)
+        radius = 0
+        while radius <= max_ring:
+            bound = self._ring_min_km(latitude, radius)
+            if max_km is not None and bound > max_km:
+                break
+            if len(found) >= limit and bound > found[limit - 1][0]:
+                break
+            if (2 * radius + 1) ** 2 > candidates:
+                return self._scan(latitude, longitude, limit, max_km, keys)
+            for cell in self._ring(center, radius):
+                for key in self._cells.get(cell, ()):
+                    if keys is not None and key not in keys:
+                        continue
+                    lat, lon, payload, _ = self._points[key]
+                    distance = haversine_km(latitude, longitude, lat, lon)
+                    if max_km is None or distance <= max_km:
+                        found.append((distance, key, payload))
+            found.sort(key=lambda item: item[0])
+            radius += 1
+        return found[:limit]
+
+    def _scan(self, latitude, longitude, limit, max_km, keys):
+        found = []
+        for key in self._points if keys is None else keys:
+            point = self._points.get(key)
+            if point is None:
+                continue
+            lat, lon, payload, _ = point
+            distance = haversine_km(latitude, longitude, lat, lon)
+            if max_km is None or distance <= max_km:
+                found.append((distance, key, payload))
+        found.sort(key=lambda item: item[0])
+        return found[:limit]
+
+    def within(self, latitude, longitude, radius_km):
+        """
+        Return every ``(distance_km, key, payload)`` within ``radius_km``,
+        closest first.
+        """
+        return self.nearest(latitude, longitude, limit=len(self._points) or 1, max_km=radius_km)
+
+
+class StopIndex:
+    """
+    Spatial index of the geocoded stops of all active routes.
+    """
+
+    def __init__(self, cell_degrees=0.01, max_age=None):
+        self.grid = GeoGrid(cell_degrees)
+        self.max_age = max_age
+        self._route_keys = {}
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._loaded_at = 0.0
+
+    def load(self):
+        from .models import RouteStop
+
+        stops = (
+            RouteStop.objects.filter(route__is_active=True, latitude__isnull=False, longitude__isnull=False)
+            .values('route_id', 'sequence', 'name', 'latitude', 'longitude')
+        )
+        grid = GeoGrid(self.grid.cell_degrees)
+        route_keys = {}
+        for stop in stops:
+            self._insert(grid, route_keys, stop)
+        with self._lock:
+            self.grid = grid
+            self._route_keys = route_keys
+            self._loaded = True
+            self._loaded_at = time.monotonic()
+
+    def ensure_loaded(self):
+        if not self._loaded or (
+            self.max_age is not None and time.monotonic() - self._loaded_at > self.max_age
+        ):
+            self.load()
+
+    @staticmethod
+    def _insert(grid, route_keys, stop):
+        key = (stop['route_id'], stop['sequence'])
+        grid.insert(key, stop['latitude'], stop['longitude'], stop)
+        route_keys.setdefault(stop['route_id'], set()).add(key)
+
+    def replace_route(self, route_id, stops):
+        """
+        Swap the indexed stops of one route for ``stops`` (dicts as produced
+        by ``RouteStop.values()``).
+        """
+        self.replace_routes({route_id: stops})
+
+    def replace_routes(self, routes):
+        """
+        Swap the indexed stops of every route in ``routes``, a mapping of
+        route id to stops, in one update.
+        """
+        with self._lock:
+            if not self._loaded:
+                return
+            grid = self.grid.copy()
+            route_keys = dict(self._route_keys)
+            for route_id, stops in routes.items():
+                self._remove(grid, route_keys, route_id)
+                for stop in stops:
+                    if stop['latitude'] is not None and stop['longitude'] is not None:
+                        self._insert(grid, route_keys, stop)
+            self.grid = grid
+            self._route_keys = route_keys
+
+    def remove_route(self, route_id):
+        with self._lock:
+            if route_id not in self._route_keys:
+                return
+            grid = self.grid.copy()
+            route_keys = dict(self._route_keys)
+            self._remove(grid, route_keys, route_id)
+            self.grid = grid
+            self._route_keys = route_keys
+
+    @staticmethod
+    def _remove(grid, route_keys, route_id):
+        for key in route_keys.pop(route_id, ()):
+            grid.remove(key)
+
+    def nearest(self, latitude, longitude, limit=1, max_km=None, routes=None):
+        """
+        Return the stops closest to a point, only those of ``routes`` (a
+        set of route ids) when given.
+        """
+        self.ensure_loaded()
+        with self._lock:
+            grid, route_keys = self.grid, self._route_keys
+        keys = None
+        if routes is not None:
+            keys = set()
+            for route_id in routes:
+                keys.update(route_keys.get(route_id, ()))
+        results = grid.nearest(latitude, longitude, limit=limit, max_km=max_km, keys=keys)
+        return [{**stop, 'distance_km': round(distance, 4)} for distance, _, stop in results]
+
+
+_stop_index = None
+_stop_index_lock = threading.Lock()
+
+
+def get_stop_index():
+    global _stop_index
+    if _stop_index is None:
+        with _stop_index_lock:
+            if _stop_index is None:
+                config = get_stop_index_settings()
+                _stop_index = StopIndex(cell_degrees=config['CELL_DEGREES'], max_age=config['MAX_AGE'])
+    return _stop_index
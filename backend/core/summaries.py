@@ -0,0 +1,179 @@
+"""
+Materialized attendance summaries.
+
+Each summary table holds per-status counts of ``AttendanceRecord`` rows for
+one group key: (route, day), (grade, day) and (student, month). Writers
+call ``refresh_summaries`` with the records they touched; only those keys
+are re-aggregated from the raw rows, which is a handful of indexed queries
+however large the history is. ``rebuild_summaries`` regenerates a table
+from scratch for a date range.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, Q
+from django.db.models.functions import TruncMonth
+
+from .models import AttendanceRecord, GradeAttendanceDaily, RouteAttendanceDaily, StudentAttendanceMonthly
+
+STATUSES = [status for status, _ in AttendanceRecord.ATTENDANCE_CHOICES]
+COUNT_FIELDS = STATUSES + ['total']
+
+
+def count_annotations():
+    counts = {status: Count('id', filter=Q(status=status)) for status in STATUSES}
+    counts['total'] = Count('id')
+    return counts
+
+
+def month_of(day):
+    return day.replace(day=1)
+
+
+class Summary:
+    """
+    How one summary table groups attendance records.
+
+    ``columns`` maps the table's key fields to lookups on ``AttendanceRecord``
+    (after ``annotations``); ``key`` builds the same key from a touched row.
+    """
+
+    def __init__(self, model, columns, key, annotations=None, exclude=None, period='date'):
+        self.model = model
+        self.columns = columns
+        self.key = key
+        self.annotations = annotations or {}
+        self.exclude = exclude or {}
+        self.period = period
+
+    @property
+    def key_fields(self):
+        return list(self.columns)
+
+    def records(self):
+        return AttendanceRecord.objects.annotate(**self.annotations).exclude(**self.exclude)
+
+    def aggregate(self, records):
+        return (
+            records.values(*self.columns.values())
+            .annotate(**count_annotations())
+            .order_by(*self.columns.values())
+        )
+
+    def build(self, row):
+        values = {field: row[source] for field, source in self.columns.items()}
+        values.update({field: row[field] for field in COUNT_FIELDS})
+        return self.model(**values)
+
+    def refresh(self, keys, batch_size=500):
+        """
+        Recompute the rows of ``keys`` from the raw records, deleting the
+        ones that no longer have any record.
+        """
+        if not keys:
+            return 0
+        records = self.records()
+        for position, source in enumerate(self.columns.values()):
+            records = records.filter(**{f'{source}__in': {key[position] for key in keys}})
+        rows = [
+            self.build(row) for row in self.aggregate(records)
+            if tuple(row[source] for source in self.columns.values()) in keys
+        ]
+        self.model.objects.bulk_create(
+            rows,
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=self.key_fields,
+            update_fields=COUNT_FIELDS,
+        )
+        found = {tuple(getattr(row, field) for field in self.key_fields) for row in rows}
+        stale = Q()
+        for key in keys - found:
+            stale |= Q(**dict(zip(self.key_fields, key)))
+        if stale:
+            self.model.objects.filter(stale).delete()
+        return len(rows)
+
+    def rebuild(self, start=None, end=None, batch_size=1000):
+        """
+        Regenerate the table, or the part of it covering [start, end].
+        """
+        records = self.records()
+        rows = self.model.objects.all()
+        if self.period == 'month':
+            start = start and month_of(start)
+            end = end and month_of(month_of(end) + timedelta(days=31)) - timedelta(days=1)
+        if start:
+            records = records.filter(date__gte=start)
+            rows = rows.filter(**{f'{self.period}__gte': start})
+        if end:
+            records = records.filter(date__lte=end)
+            rows = rows.filter(**{f'{self.period}__lte': end})
+        written = 0
+        with transaction.atomic():
+            rows.delete()
+            batch = []
+            for row in self.aggregate(records).iterator(chunk_size=batch_size):
+                batch.append(self.build(row))
+                if len(batch) >= batch_size:
+                    self.model.objects.bulk_create(batch)
+                    written += len(batch)
+                    batch = []
+            self.model.objects.bulk_create(batch)
+            written += len(batch)
+        return written
+
+
+SUMMARIES = {
+    'route-daily': Summary(
+        RouteAttendanceDaily,
+        columns={'route_id': 'route_id', 'date': 'date'},
+        key=lambda row: (row['route_id'], row['date']) if row['route_id'] is not None else None,
+        exclude={'route__isnull': True},
+    ),
+    'grade-daily': Summary(
+        GradeAttendanceDaily,
+        columns={'grade': 'student__grade', 'date': 'date'},
+        key=lambda row: (row['grade'], row['date']),
+    ),
+    'student-monthly': Summary(
+        StudentAttendanceMonthly,
+        columns={'student_id': 'student_id', 'month': 'month_start'},
+        key=lambda row: (row['student_id'], month_of(row['date'])),
+        annotations={'month_start': TruncMonth('date')},
+        period='month',
+    ),
+}
+
+
+def refresh_summaries(rows, batch_size=500):
+    """
+    Bring every summary up to date for the touched ``rows``: dicts with
+    ``student_id``, ``grade``, ``route_id`` and ``date``, holding the values
+    of records before and after the change.
+    """
+    for summary in SUMMARIES.values():
+        keys = {summary.key(row) for row in rows}
+        keys.discard(None)
+        summary.refresh(keys, batch_size=batch_size)
+
+
+def record_row(record, grade=None):
+    """
+    The summary row of an ``AttendanceRecord`` instance.
+    """
+    return {
+        'student_id': record.student_id,
+        'grade': grade if grade is not None else record.student.grade,
+        'route_id': record.route_id,
+        'date': record.date,
+    }
+
+
+def rebuild_summaries(names=None, start=None, end=None, batch_size=1000):
+    """
+    Regenerate the named summaries (all by default) from the raw records.
+    Yields ``(name, rows_written)`` per summary.
+    """
+    for name in names or SUMMARIES:
+        yield name, SUMMARIES[name].rebuild(start=start, end=end, batch_size=batch_size)
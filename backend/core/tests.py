@@ -0,0 +1,1046 @@
+import csv
+import json
+import random
+import threading
+from datetime import date, timedelta
+from io import StringIO
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from users.authentication import ClaimsRefreshToken
+from users.middleware import JWTAuthMiddleware
+from users.models import User
+from . import replicas
+from .access import AccessScope, compute_access_scope, get_access_scope
+from .caching import clear_response_caches
+from .eta import ETAEngine
+from .exports import HEADER, export_attendance
+from .geofence import GeofenceEngine
+from .importer import hash_passwords, import_students
+from .ingestion import LocationBuffer, ingest
+from .live import publish_locations
+from .models import (
+    AttendanceRecord, Bus, BusLocation, BusLocationMinute, BusTrip, GradeAttendanceDaily, Route,
+    RouteAttendanceDaily, RouteStop, StaffAssignment, StopEvent, Student, StudentRouteAssignment,
+)
+from .perfcheck import api_client, seed_fixture
+from .positions import CachePositionBackend, LocalPositionBackend, PositionStore, get_position_store
+from .retention import compact_locations
+from .rosters import roster_key
+from .routing import websocket_urlpatterns
+from .seeding import Seeder
+from .spatial import GeoGrid, StopIndex, get_stop_index, haversine_km
+from .summaries import SUMMARIES, rebuild_summaries
+from .writer import SingleWriter, WriteTimeout
+
+
+class FixtureTestCase(TestCase):
+    """
+    Seeds the performance-check fixture and picks a parent and a bus staff
+    member assigned to one route.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cache.clear()
+        cls.admin = seed_fixture(students=20, days=2)
+        cls.parent = User.objects.filter(role='parent', children__route_assignments__is_active=True).first()
+        cls.route = Route.objects.filter(student_assignments__is_active=True).exclude(bus=None).first()
+        cls.other_route = Route.objects.exclude(pk=cls.route.pk).first()
+        cls.staff = User.objects.create_user(email='staff@example.com', password=None, role='bus_staff')
+        StaffAssignment.objects.create(
+            staff=cls.staff, bus=cls.route.bus, route=cls.route, valid_from=timezone.localdate()
+        )
+
+    def setUp(self):
+        cache.clear()
+
+
+class IngestionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.bus = Bus.objects.create(bus_number='1', capacity=40, driver_name='Driver', driver_contact='1')
+        self.other_bus = Bus.objects.create(bus_number='2', capacity=40, driver_name='Driver', driver_contact='2')
+        self.client = api_client(User.objects.create_user(email='admin@example.com', password=None, role='admin'))
+        self.now = timezone.now()
+
+    def ping(self, bus, **fields):
+        return {
+            'bus': bus.pk, 'latitude': 12.97, 'longitude': 77.59, 'speed': 30, 'heading': 90,
+            'recorded_at': self.now.isoformat(), **fields,
+        }
+
+    @override_settings(LOCATION_BUFFER={'WRITE_BEHIND': False})
+    def test_batch_is_written_and_mirrored_onto_the_bus(self):
+        response = self.client.post('/api/v1/pings/', [
+            self.ping(self.bus, latitude=12.5, recorded_at=(self.now - timedelta(seconds=10)).isoformat()),
+            self.ping(self.bus, latitude=12.6),
+            self.ping(self.other_bus),
+        ], format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['accepted'], 3)
+        self.assertEqual(BusLocation.objects.count(), 3)
+        self.bus.refresh_from_db()
+        self.assertEqual(self.bus.current_location, '12.600000,77.590000')
+
+    def test_non_finite_values_are_rejected(self):
+        for field, value in (('latitude', 'nan'), ('longitude', 'nan'), ('speed', 'inf'), ('heading', 'nan')):
+            response = self.client.post('/api/v1/pings/', [self.ping(self.bus, **{field: value})], format='json')
+            self.assertEqual(response.status_code, 400, field)
+            self.assertIn(field, response.data[0])
+        self.assertFalse(BusLocation.objects.exists())
+
+    def test_unknown_bus_is_rejected(self):
+        response = self.client.post('/api/v1/pings/', [{**self.ping(self.bus), 'bus': 999}], format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_flush_drops_only_the_rows_that_cannot_be_written(self):
+        buffer = LocationBuffer(max_pending=100)
+        locations = [
+            BusLocation(bus=bus, latitude=12.9, longitude=77.5, recorded_at=self.now + timedelta(seconds=second))
+            for second, bus in enumerate([self.bus, self.other_bus] * 4)
+        ]
+        locations[3].latitude = None
+        buffer.add(locations)
+        with self.assertLogs('core.ingestion', 'ERROR'):
+            self.assertEqual(buffer.flush(), 7)
+        self.assertEqual(BusLocation.objects.count(), 7)
+        self.assertEqual(len(buffer), 0)
+
+    def test_eta_ignores_non_finite_positions(self):
+        Route.objects.create(
+            name='Route', bus=self.bus, start_point='A', end_point='B', distance=5,
+            estimated_duration=timedelta(minutes=20),
+            stops=[
+                {'name': 'A', 'latitude': 12.9, 'longitude': 77.5},
+                {'name': 'B', 'latitude': 12.95, 'longitude': 77.55},
+            ],
+        )
+        engine = ETAEngine(history_days=0)
+        engine.observe([BusLocation(bus=self.bus, latitude=float('nan'), longitude=77.5, recorded_at=self.now)])
+        route = Route.objects.get()
+        self.assertEqual(engine.get(route.pk)['stops'], [])
+        engine.observe([BusLocation(bus=self.bus, latitude=12.9, longitude=77.5, speed=30, recorded_at=self.now)])
+        self.assertEqual([stop['name'] for stop in engine.get(route.pk)['stops']], ['A', 'B'])
+
+
+class PerformanceCheckTests(TestCase):
+    """
+    Runs the performance checks of the management commands on the test
+    database, so a regression fails the test suite.
+    """
+
+    def setUp(self):
+        cache.clear()
+
+    def run_check(self, name):
+        output = StringIO()
+        try:
+            call_command(name, current_database=True, stdout=output)
+        except CommandError as error:
+            self.fail(f"{error}\n{output.getvalue()}")
+
+    def test_query_budget(self):
+        self.run_check('check_query_budget')
+
+    def test_query_plans(self):
+        self.run_check('check_query_plans')
+
+
+class StudentImportTests(TestCase):
+    header = (
+        'email,first_name,last_name,password,student_id,grade,date_of_birth,address,emergency_contact,'
+        'route,pickup_point,pickup_time,drop_point,drop_time'
+    )
+
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_user(email='admin@example.com', password=None, role='admin', is_staff=True)
+        bus = Bus.objects.create(bus_number='1', capacity=40, driver_name='Driver', driver_contact='1')
+        self.route = Route.objects.create(
+            name='Route', bus=bus, start_point='A', end_point='B', stops=['A', 'B'], distance=5,
+            estimated_duration=timedelta(minutes=20),
+        )
+
+    def row(self, number, **fields):
+        return {
+            'email': f'student{number}@example.com', 'first_name': 'S', 'last_name': str(number),
+            'student_id': f'S{number}', 'grade': '5', 'date_of_birth': '2015-01-01', 'address': 'Street',
+            'emergency_contact': '123', **fields,
+        }
+
+    def csv(self, rows):
+        lines = [self.header] + [
+            ','.join(row.get(column, '') for column in self.header.split(',')) for row in rows
+        ]
+        return SimpleUploadedFile('students.csv', '\n'.join(lines).encode(), content_type='text/csv')
+
+    def test_valid_rows_are_imported_and_invalid_ones_reported(self):
+        User.objects.create_user(email='student9@example.com', password=None, role='parent')
+        rows = [
+            self.row(1, password='Secret-pass-1', route=str(self.route.pk), pickup_point='A', pickup_time='07:30',
+                     drop_point='B', drop_time='15:00'),
+            self.row(2),
+            self.row(3, email='not-an-email'),
+            self.row(4, student_id='S1'),
+            self.row(9),
+            self.row(5, route='999', pickup_point='A', pickup_time='07:30', drop_point='B', drop_time='15:00'),
+            self.row(6, route=str(self.route.pk)),
+        ]
+        result = import_students(rows)
+        self.assertEqual((result['rows'], result['imported'], result['failed']), (7, 2, 5))
+        self.assertEqual(
+            {error['row']: sorted(error['errors']) for error in result['errors']},
+            {3: ['email'], 4: ['student_id'], 5: ['email'], 6: ['route'],
+             7: ['drop_point', 'drop_time', 'pickup_point', 'pickup_time']},
+        )
+        first = Student.objects.select_related('user').get(student_id='S1')
+        self.assertEqual(first.user.role, 'student')
+        self.assertTrue(first.user.check_password('Secret-pass-1'))
+        self.assertFalse(Student.objects.get(student_id='S2').user.has_usable_password())
+        self.assertEqual(
+            list(StudentRouteAssignment.objects.values_list('student', 'route')), [(first.pk, self.route.pk)]
+        )
+
+    def test_dry_run_writes_nothing(self):
+        result = import_students([self.row(1)], dry_run=True)
+        self.assertEqual((result['imported'], result['failed']), (0, 0))
+        self.assertFalse(Student.objects.exists())
+
+    def test_hashes_keep_their_order_on_threads(self):
+        passwords = ['first-secret', None, 'second-secret', 'third-secret']
+        hashes = hash_passwords(passwords, workers=2, threads=True)
+        self.assertEqual(len(hashes), 4)
+        user = User(email='x@example.com')
+        for password, hashed in zip(passwords, hashes):
+            user.password = hashed
+            self.assertTrue(user.check_password(password) if password else not user.has_usable_password())
+
+    def test_upload_hashes_on_threads_and_limits_passwords(self):
+        client = api_client(self.admin)
+        with mock.patch('core.importer.ProcessPoolExecutor') as process_pool:
+            response = client.post('/api/v1/students/import/', {
+                'file': self.csv([self.row(1, password='Secret-pass-1'), self.row(2, password='Secret-pass-2')]),
+            }, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['imported'], 2)
+        process_pool.assert_not_called()
+        with self.settings(STUDENT_IMPORT={'MAX_UPLOAD_PASSWORDS': 1}):
+            response = client.post('/api/v1/students/import/', {
+                'file': self.csv([self.row(3, password='a-b-c-d-e'), self.row(4, password='a-b-c-d-e')]),
+            }, format='multipart')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Student.objects.filter(student_id='S3').exists())
+
+    def test_parents_cannot_be_set_through_the_api(self):
+        import_students([self.row(1)])
+        student = Student.objects.get()
+        parent = User.objects.create_user(email='parent@example.com', password=None, role='parent')
+        response = api_client(self.admin).patch(
+            f'/api/v1/students/{student.pk}/', {'parents': [parent.pk]}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(student.parents.exists())
+
+
+class AccessScopeTests(FixtureTestCase):
+    def test_allows_object_checks_every_restricted_dimension(self):
+        scope = AccessScope(frozenset({1}), frozenset({10}), frozenset({100}))
+        self.assertTrue(scope.allows_object(student=1, route=10))
+        self.assertFalse(scope.allows_object(student=1, route=11))
+        self.assertFalse(scope.allows_object(student=2, route=10))
+        self.assertFalse(scope.allows_object())
+        self.assertTrue(AccessScope.unrestricted().allows_object(student=2, route=11))
+
+    def test_unknown_role_sees_nothing(self):
+        user = User.objects.create_user(email='driver@example.com', password=None, role='driver')
+        self.assertFalse(compute_access_scope(user).is_unrestricted)
+        client = api_client(user)
+        for url in ('/api/v1/students/', '/api/v1/buses/', '/api/v1/attendance-records/'):
+            self.assertEqual(client.get(url).data['results'], [], url)
+
+    def test_teacher_is_unrestricted(self):
+        teacher = User.objects.create_user(email='teacher@example.com', password=None, role='teacher')
+        self.assertTrue(compute_access_scope(teacher).is_unrestricted)
+
+    def test_student_sees_only_themselves(self):
+        student = Student.objects.filter(route_assignments__is_active=True).select_related('user').first()
+        response = api_client(student.user).get('/api/v1/students/')
+        self.assertEqual([row['id'] for row in response.data['results']], [student.pk])
+
+    def test_parent_lists_are_scoped(self):
+        scope = get_access_scope(self.parent)
+        client = api_client(self.parent)
+        students = {row['id'] for row in client.get('/api/v1/students/').data['results']}
+        self.assertEqual(students, set(scope.ids['student']))
+        routes = {row['id'] for row in client.get('/api/v1/routes/').data['results']}
+        self.assertEqual(routes, set(scope.ids['route']))
+
+    def test_grade_report_is_hidden_from_scoped_users(self):
+        self.assertTrue(GradeAttendanceDaily.objects.exists())
+        response = api_client(self.parent).get('/api/v1/reports/grade-daily/')
+        self.assertEqual(response.data['results'], [])
+        response = api_client(self.admin).get('/api/v1/reports/grade-daily/')
+        self.assertEqual(response.data['count'], GradeAttendanceDaily.objects.count())
+
+    def test_saving_a_user_keeps_other_scopes_cached(self):
+        get_access_scope(self.parent)
+        self.staff.last_login = timezone.now()
+        self.staff.save(update_fields=['last_login'])
+        self.staff.first_name = 'Renamed'
+        self.staff.save()
+        with self.assertNumQueries(0):
+            get_access_scope(self.parent)
+
+    def test_role_change_takes_effect(self):
+        self.assertFalse(get_access_scope(self.parent).is_unrestricted)
+        self.parent.role = 'teacher'
+        self.parent.save()
+        self.assertTrue(get_access_scope(self.parent).is_unrestricted)
+
+    def test_nearest_stops_are_scoped(self):
+        get_stop_index().load()
+        routes = get_access_scope(self.parent).ids['route']
+        stop = RouteStop.objects.exclude(route_id__in=routes).first()
+        response = api_client(self.parent).get(
+            '/api/v1/stops/nearest/', {'lat': stop.latitude, 'lon': stop.longitude, 'limit': 100}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue({row['route_id'] for row in response.data} <= routes)
+
+
+class PositionStoreTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        get_position_store().clear()
+        self.bus = Bus.objects.create(bus_number='1', capacity=40, driver_name='Driver', driver_contact='1')
+        self.now = timezone.now()
+
+    def location(self, seconds_ago, latitude=12.9):
+        return BusLocation(
+            bus=self.bus, latitude=latitude, longitude=77.5, recorded_at=self.now - timedelta(seconds=seconds_ago)
+        )
+
+    def test_newest_fix_wins_in_every_backend(self):
+        for backend in (LocalPositionBackend(), CachePositionBackend()):
+            store = PositionStore(backend, stale_after=60)
+            store.clear()
+            store.update([self.location(30, latitude=1), self.location(10, latitude=2)])
+            store.update([self.location(20, latitude=3)])
+            position = store.get(self.bus.pk)
+            self.assertEqual(position['latitude'], 2, backend)
+            self.assertFalse(position['stale'])
+            store.update([self.location(-50, latitude=4)])
+            self.assertEqual(store.get(self.bus.pk)['latitude'], 4, backend)
+            store.evict([self.bus.pk])
+            self.assertIsNone(store.get(self.bus.pk))
+
+    def test_old_fixes_are_stale(self):
+        store = PositionStore(LocalPositionBackend(), stale_after=60)
+        store.clear()
+        store.update([self.location(120)])
+        self.assertTrue(store.get(self.bus.pk)['stale'])
+
+    def test_warm_loads_the_newest_stored_location_of_active_buses(self):
+        BusLocation.objects.bulk_create([self.location(20, latitude=1), self.location(10, latitude=2)])
+        retired = Bus.objects.create(bus_number='2', capacity=40, driver_name='D', driver_contact='2', is_active=False)
+        BusLocation.objects.create(bus=retired, latitude=1, longitude=1, recorded_at=self.now)
+        store = PositionStore(LocalPositionBackend())
+        self.assertEqual(set(store.all()), {self.bus.pk})
+        self.assertEqual(store.get(self.bus.pk)['latitude'], 2)
+
+    def test_positions_endpoint_reads_no_database(self):
+        get_position_store().update([self.location(5)])
+        client = api_client(User.objects.create_user(email='admin@example.com', password=None, role='admin'))
+        client.get('/api/v1/buses/positions/')
+        with self.assertNumQueries(0):
+            response = client.get('/api/v1/buses/positions/', {'bus': self.bus.pk})
+        self.assertEqual([position['bus'] for position in response.data], [self.bus.pk])
+
+    def test_deactivating_a_bus_evicts_its_position(self):
+        get_position_store().update([self.location(5)])
+        self.bus.is_active = False
+        self.bus.save()
+        self.assertIsNone(get_position_store().get(self.bus.pk))
+
+
+class ETAEngineTests(TestCase):
+    stops = [
+        {'name': 'A', 'latitude': 12.90, 'longitude': 77.50},
+        {'name': 'B', 'latitude': 12.92, 'longitude': 77.50},
+        {'name': 'C', 'latitude': 12.94, 'longitude': 77.50},
+    ]
+
+    def setUp(self):
+        cache.clear()
+        self.bus = Bus.objects.create(bus_number='1', capacity=40, driver_name='Driver', driver_contact='1')
+        # 15 km/h nominal speed.
+        self.route = Route.objects.create(
+            name='Route', bus=self.bus, start_point='A', end_point='C', distance=5,
+            estimated_duration=timedelta(minutes=20), stops=self.stops,
+        )
+        self.now = timezone.now()
+
+    def observe(self, engine, latitude, speed):
+        engine.observe([
+            BusLocation(bus=self.bus, latitude=latitude, longitude=77.5, speed=speed, recorded_at=self.now)
+        ])
+        return {stop['name']: stop['eta_seconds'] for stop in engine.get(self.route.pk)['stops']}
+
+    def segment_seconds(self, start, end, speed):
+        start, end = self.stops[start], self.stops[end]
+        return haversine_km(start['latitude'], start['longitude'], end['latitude'], end['longitude']) / speed * 3600
+
+    def test_moving_bus_uses_its_speed_then_the_route_speed(self):
+        etas = self.observe(ETAEngine(history_days=0), 12.90, speed=30)
+        self.assertEqual(list(etas), ['A', 'B', 'C'])
+        self.assertAlmostEqual(etas['A'], 0, delta=0.1)
+        self.assertAlmostEqual(etas['B'], self.segment_seconds(0, 1, 15), delta=0.1)
+        self.assertAlmostEqual(etas['C'], etas['B'] + self.segment_seconds(1, 2, 15), delta=0.1)
+
+    def test_first_leg_uses_the_bus_speed(self):
+        etas = self.observe(ETAEngine(history_days=0), 12.91, speed=30)
+        self.assertEqual(list(etas), ['B', 'C'])
+        self.assertAlmostEqual(etas['B'], self.segment_seconds(0, 1, 30) / 2, delta=0.1)
+
+    def test_stopped_bus_uses_the_route_speed(self):
+        etas = self.observe(ETAEngine(history_days=0), 12.91, speed=0)
+        self.assertAlmostEqual(etas['B'], self.segment_seconds(0, 1, 15) / 2, delta=0.1)
+
+    def test_observed_segment_times_are_blended_in(self):
+        engine = ETAEngine(history_days=0, smoothing=0.5)
+        nominal = self.observe(engine, 12.92, speed=30)['C']
+        engine.observe_segment(self.route.pk, 2, nominal * 3)
+        self.now += timedelta(seconds=1)
+        self.assertAlmostEqual(self.observe(engine, 12.92, speed=30)['C'], nominal * 2, delta=0.1)
+
+    def test_estimates_are_shared_through_the_cache(self):
+        self.observe(ETAEngine(history_days=0, cache='default'), 12.91, speed=30)
+        other = ETAEngine(history_days=0, cache='default')
+        self.assertEqual([stop['name'] for stop in other.get(self.route.pk)['stops']], ['B', 'C'])
+
+
+class GeofenceTests(TestCase):
+    def setUp(self):
+        self.bus = Bus.objects.create(bus_number='1', capacity=40, driver_name='Driver', driver_contact='1')
+        self.route = Route.objects.create(
+            name='Route', bus=self.bus, start_point='A', end_point='B', distance=5,
+            estimated_duration=timedelta(minutes=20),
+            stops=[
+                {'name': 'A', 'latitude': 12.90, 'longitude': 77.5},
+                {'name': 'B', 'latitude': 12.92, 'longitude': 77.5},
+            ],
+        )
+        self.start = timezone.now()
+        # Away, at A, at A, between the stops, at B.
+        self.track = [
+            self.location(0, 12.89), self.location(60, 12.9), self.location(90, 12.9001),
+            self.location(300, 12.91), self.location(600, 12.92),
+        ]
+
+    def location(self, seconds, latitude):
+        return BusLocation(
+            bus=self.bus, latitude=latitude, longitude=77.5, recorded_at=self.start + timedelta(seconds=seconds)
+        )
+
+    def summary(self, events):
+        return [(event.event_type, event.stop_name, (event.occurred_at - self.start).seconds) for event in events]
+
+    def test_transitions_become_events(self):
+        events = GeofenceEngine(radius_m=50, feed_eta=False).process(self.track)
+        self.assertEqual(self.summary(events), [('arrival', 'A', 60), ('departure', 'A', 300), ('arrival', 'B', 600)])
+        self.assertEqual({event.route_id for event in events}, {self.route.pk})
+
+    def test_batches_continue_where_the_previous_one_stopped(self):
+        engine = GeofenceEngine(radius_m=50, feed_eta=False)
+        events = engine.process(self.track[:2]) + engine.process(self.track[1:3]) + engine.process(self.track[3:])
+        self.assertEqual(self.summary(events), [('arrival', 'A', 60), ('departure', 'A', 300), ('arrival', 'B', 600)])
+
+    def test_consecutive_arrivals_teach_the_eta_engine(self):
+        with mock.patch('core.geofence.get_eta_engine') as get_eta_engine:
+            GeofenceEngine(radius_m=50).process(self.track)
+        get_eta_engine.return_value.observe_segment.assert_called_once_with(self.route.pk, 1, 540)
+
+    @override_settings(LOCATION_BUFFER={'WRITE_BEHIND': False})
+    def test_ingested_pings_record_stop_events(self):
+        with mock.patch('core.signals.get_geofence_engine', return_value=GeofenceEngine(radius_m=50, feed_eta=False)):
+            ingest(self.track)
+            ingest([self.location(600, 12.92)])
+        self.assertEqual(
+            list(StopEvent.objects.values_list('event_type', 'stop_sequence')),
+            [('arrival', 0), ('departure', 0), ('arrival', 1)],
+        )
+
+
+class StopIndexTests(TestCase):
+    def setUp(self):
+        rng = random.Random(4)
+        self.index = StopIndex()
+        self.index._loaded = True
+        self.index.replace_routes({
+            route_id: [
+                {'route_id': route_id, 'sequence': sequence, 'name': f'{route_id}-{sequence}',
+                 'latitude': 12.9 + rng.random() * 0.2, 'longitude': 77.5 + rng.random() * 0.2}
+                for sequence in range(10)
+            ]
+            for route_id in range(1, 6)
+        })
+        self.stops = [point[2] for point in self.index.grid._points.values()]
+
+    def expected(self, latitude, longitude, limit, routes=None):
+        stops = [stop for stop in self.stops if routes is None or stop['route_id'] in routes]
+        stops.sort(key=lambda stop: haversine_km(latitude, longitude, stop['latitude'], stop['longitude']))
+        return [stop['name'] for stop in stops[:limit]]
+
+    def test_nearby_point_matches_a_linear_scan(self):
+        names = [stop['name'] for stop in self.index.nearest(12.95, 77.55, limit=5)]
+        self.assertEqual(names, self.expected(12.95, 77.55, 5))
+
+    def test_far_away_point_stops_walking_rings(self):
+        with mock.patch.object(GeoGrid, '_ring', autospec=True, side_effect=GeoGrid._ring) as ring:
+            names = [stop['name'] for stop in self.index.nearest(0, 0, limit=5)]
+        self.assertEqual(names, self.expected(0, 0, 5))
+        self.assertLessEqual(ring.call_count, 4)
+
+    def test_scope_smaller_than_limit(self):
+        with mock.patch.object(GeoGrid, '_ring', autospec=True, side_effect=GeoGrid._ring) as ring:
+            stops = self.index.nearest(12.95, 77.55, limit=100, routes={2, 99})
+        self.assertEqual([stop['name'] for stop in stops], self.expected(12.95, 77.55, 100, {2}))
+        self.assertLessEqual(ring.call_count, 2)
+        self.assertEqual(self.index.nearest(12.95, 77.55, limit=5, routes=set()), [])
+
+    def test_queries_keep_the_snapshot_they_started_with(self):
+        grid = self.index.grid
+        self.index.remove_route(1)
+        self.assertEqual(len(grid), 50)
+        self.assertEqual(len(self.index.grid), 40)
+        self.assertNotIn(1, {stop['route_id'] for stop in self.index.nearest(12.95, 77.55, limit=50)})
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class PositionConsumerTests(FixtureTestCase):
+    application = JWTAuthMiddleware(URLRouter(websocket_urlpatterns))
+
+    def setUp(self):
+        super().setUp()
+        self.token = str(ClaimsRefreshToken.for_user(self.staff).access_token)
+        self.other_bus = Bus.objects.exclude(pk=self.route.bus_id).first()
+
+    def communicator(self, path, token=None):
+        if token is not None:
+            path = f'{path}?token={token}'
+        return WebsocketCommunicator(self.application, path)
+
+    async def test_anonymous_connections_are_refused(self):
+        connected, code = await self.communicator(f'/ws/routes/{self.route.pk}/positions/').connect()
+        self.assertFalse(connected)
+        self.assertEqual(code, 4401)
+
+    async def test_routes_and_buses_outside_the_scope_are_refused(self):
+        for path in (f'/ws/routes/{self.other_route.pk}/positions/', f'/ws/buses/{self.other_bus.pk}/positions/'):
+            connected, code = await self.communicator(path, self.token).connect()
+            self.assertFalse(connected, path)
+            self.assertEqual(code, 4403)
+
+    async def test_subscribers_receive_positions_of_their_route(self):
+        communicator = self.communicator(f'/ws/routes/{self.route.pk}/positions/', self.token)
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        location = BusLocation(bus_id=self.route.bus_id, latitude=12.9, longitude=77.5, recorded_at=timezone.now())
+        await sync_to_async(publish_locations)([location])
+        message = await communicator.receive_json_from()
+        self.assertEqual((message['bus'], message['latitude']), (self.route.bus_id, 12.9))
+        await communicator.disconnect()
+
+
+class RouteRosterTests(FixtureTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = api_client(self.admin)
+        self.url = f'/api/v1/routes/{self.route.pk}/students/'
+
+    def etag(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return response['ETag']
+
+    def test_roster_lists_active_assignments_and_answers_conditional_gets(self):
+        response = self.client.get(self.url)
+        expected = StudentRouteAssignment.objects.filter(route=self.route, is_active=True)
+        self.assertEqual(
+            sorted(student['id'] for student in response.data), sorted(expected.values_list('student_id', flat=True))
+        )
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_assignment_changes_replace_the_roster(self):
+        etag = self.etag()
+        assignment = StudentRouteAssignment.objects.filter(route=self.route, is_active=True).first()
+        assignment.is_active = False
+        assignment.save()
+        self.assertNotEqual(self.etag(), etag)
+        self.assertNotIn(assignment.student_id, [student['id'] for student in self.client.get(self.url).data])
+
+    def test_student_name_changes_replace_the_roster(self):
+        etag = self.etag()
+        user = Student.objects.filter(route_assignments__route=self.route).first().user
+        user.first_name = 'Renamed'
+        user.save()
+        self.assertNotEqual(self.etag(), etag)
+
+    def test_logins_keep_the_cached_roster(self):
+        self.etag()
+        user = Student.objects.filter(route_assignments__route=self.route).first().user
+        user.last_login = timezone.now()
+        user.save(update_fields=['last_login'])
+        self.assertIsNotNone(cache.get(roster_key(self.route.pk)))
+
+
+class AttendanceScopeTests(FixtureTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = api_client(self.staff)
+        self.student = StudentRouteAssignment.objects.filter(route=self.route, is_active=True).first().student_id
+        self.day = (timezone.localdate() + timedelta(days=30)).isoformat()
+
+    def test_staff_cannot_record_on_a_route_they_do_not_staff(self):
+        response = self.client.post('/api/v1/attendance-records/', {
+            'student': self.student, 'route': self.other_route.pk, 'date': self.day, 'status': 'present',
+        }, format='json')
+        self.assertEqual(response.status_code, 403)
+
+    def test_bulk_upsert_checks_the_scope_of_every_row(self):
+        outsider = Student.objects.exclude(route_assignments__route=self.route).first()
+        response = self.client.post('/api/v1/attendance-records/bulk_create/', [
+            {'student': self.student, 'route': self.route.pk, 'date': self.day, 'status': 'present'},
+            {'student': self.student, 'route': self.other_route.pk, 'date': self.day, 'status': 'late'},
+            {'student': outsider.pk, 'date': self.day, 'status': 'present'},
+        ], format='json')
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual([row['status'] for row in response.data['results']], ['created', 'failed', 'failed'])
+        self.assertEqual(AttendanceRecord.objects.get(student_id=self.student, date=self.day).status, 'present')
+
+
+class AttendanceSummaryTests(FixtureTestCase):
+    def assertSummariesMatchRecords(self):
+        for name, summary in SUMMARIES.items():
+            fields = summary.key_fields + ['present', 'absent', 'late', 'excused', 'total']
+            stored = set(summary.model.objects.values_list(*fields))
+            expected = {
+                tuple(row[source] for source in summary.columns.values())
+                + tuple(row[field] for field in fields[len(summary.columns):])
+                for row in summary.aggregate(summary.records())
+            }
+            self.assertEqual(stored, expected, name)
+
+    def test_single_record_writes_keep_summaries_current(self):
+        client = api_client(self.admin)
+        record = AttendanceRecord.objects.filter(route__isnull=False).first()
+        response = client.patch(f'/api/v1/attendance-records/{record.pk}/', {
+            'status': 'excused', 'route': self.other_route.pk,
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertSummariesMatchRecords()
+        self.assertEqual(client.delete(f'/api/v1/attendance-records/{record.pk}/').status_code, 204)
+        self.assertSummariesMatchRecords()
+
+    def test_roll_calls_keep_summaries_current(self):
+        day = (timezone.localdate() + timedelta(days=1)).isoformat()
+        students = StudentRouteAssignment.objects.filter(route=self.route, is_active=True)
+        rows = [
+            {'student': assignment.student_id, 'route': self.route.pk, 'date': day, 'status': status}
+            for assignment, status in zip(students, ['present', 'absent', 'late'])
+        ]
+        client = api_client(self.admin)
+        self.assertEqual(client.post('/api/v1/attendance-records/bulk_create/', rows, format='json').status_code, 201)
+        rows[0]['status'] = 'late'
+        self.assertEqual(client.post('/api/v1/attendance-records/bulk_create/', rows, format='json').status_code, 201)
+        self.assertSummariesMatchRecords()
+        self.assertEqual(RouteAttendanceDaily.objects.get(route=self.route, date=day).late, 2)
+
+    def test_rebuild_repairs_summaries_after_raw_writes(self):
+        AttendanceRecord.objects.filter(status='present').update(status='absent')
+        dict(rebuild_summaries())
+        self.assertSummariesMatchRecords()
+
+
+class AttendanceExportTests(FixtureTestCase):
+    def export(self, user, **params):
+        response = api_client(user).get('/api/v1/attendance-records/export/', params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_has_every_record_in_date_order(self):
+        rows = list(csv.DictReader(self.export(self.admin).splitlines()))
+        records = AttendanceRecord.objects.order_by('date', 'id').select_related('student__user', 'route__bus')
+        self.assertEqual([int(row['id']) for row in rows], [record.pk for record in records])
+        first, record = rows[0], records[0]
+        self.assertEqual(
+            (first['date'], first['status'], first['student_id'], first['first_name'], first['grade']),
+            (record.date.isoformat(), record.status, record.student.student_id, record.student.user.first_name,
+             record.student.grade),
+        )
+
+    def test_ndjson_honours_the_date_range_and_scope(self):
+        day = AttendanceRecord.objects.order_by('-date').values_list('date', flat=True).first()
+        lines = self.export(self.parent, output='ndjson', start=day.isoformat(), end=day.isoformat()).splitlines()
+        rows = [json.loads(line) for line in lines]
+        expected = AttendanceRecord.objects.filter(date=day, student__parents=self.parent)
+        self.assertEqual(sorted(row['id'] for row in rows), sorted(expected.values_list('pk', flat=True)))
+        self.assertTrue(rows)
+        self.assertEqual(set(rows[0]), set(HEADER))
+
+    def test_chunk_boundaries_do_not_change_the_output(self):
+        records = AttendanceRecord.objects.all()
+        for output in ('csv', 'ndjson'):
+            self.assertEqual(
+                ''.join(export_attendance(records, output=output, chunk_size=3)),
+                ''.join(export_attendance(records, output=output)),
+            )
+
+    def test_invalid_parameters_are_rejected(self):
+        client = api_client(self.admin)
+        self.assertEqual(client.get('/api/v1/attendance-records/export/', {'output': 'xml'}).status_code, 400)
+        self.assertEqual(client.get('/api/v1/attendance-records/export/', {'start': 'yesterday'}).status_code, 400)
+
+
+class PaginationTests(FixtureTestCase):
+    def test_attendance_cursor_walks_every_record_once(self):
+        client = api_client(self.admin)
+        url = '/api/v1/attendance-records/?page_size=7'
+        seen = []
+        while url:
+            response = client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('page=', url)
+            seen += [row['id'] for row in response.data['results']]
+            url = response.data['next']
+        expected = list(AttendanceRecord.objects.order_by('-date', '-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_attendance_counts_by_default_and_rejects_page_numbers(self):
+        client = api_client(self.admin)
+        response = client.get('/api/v1/attendance-records/')
+        self.assertEqual(response.data['count'], AttendanceRecord.objects.count())
+        self.assertNotIn('count', client.get('/api/v1/attendance-records/?count=false').data)
+        self.assertEqual(client.get('/api/v1/attendance-records/?page=2').status_code, 400)
+
+    def test_invalid_cursor(self):
+        response = api_client(self.admin).get('/api/v1/attendance-records/?cursor=garbage')
+        self.assertEqual(response.status_code, 404)
+
+    def test_other_lists_use_page_numbers(self):
+        client = api_client(self.admin)
+        response = client.get('/api/v1/students/?page_size=5')
+        self.assertEqual(response.data['count'], Student.objects.count())
+        self.assertIn('page=2', response.data['next'])
+        following = client.get(response.data['next'])
+        self.assertTrue(
+            {row['id'] for row in following.data['results']}.isdisjoint(row['id'] for row in response.data['results'])
+        )
+
+
+class ReplayTests(FixtureTestCase):
+    def test_every_must_be_a_positive_finite_number(self):
+        client = api_client(self.admin)
+        bus = Bus.objects.first()
+        for value in ('inf', 'nan', '-5', '0', '1e300', 'x'):
+            response = client.get(f'/api/v1/buses/{bus.pk}/replay/', {'date': '2024-01-02', 'every': value})
+            self.assertEqual(response.status_code, 400, value)
+        response = client.get(f'/api/v1/buses/{bus.pk}/replay/', {'date': '2024-01-02', 'every': '30'})
+        self.assertEqual(response.status_code, 200)
+
+
+class CompactionTests(TestCase):
+    def test_late_pings_merge_into_a_compacted_minute(self):
+        bus = Bus.objects.create(bus_number='1', capacity=40, driver_name='Driver', driver_contact='1')
+        minute = (timezone.now() - timedelta(days=30)).replace(second=0, microsecond=0)
+        BusLocation.objects.bulk_create([
+            BusLocation(bus=bus, latitude=10, longitude=20, speed=10, recorded_at=minute + timedelta(seconds=second))
+            for second in (0, 10, 20)
+        ])
+        list(compact_locations(window_minutes=30))
+        BusLocation.objects.create(
+            bus=bus, latitude=14, longitude=24, speed=50, recorded_at=minute + timedelta(seconds=40)
+        )
+        list(compact_locations(window_minutes=30, trip_gap_minutes=0))
+
+        row = BusLocationMinute.objects.get()
+        self.assertEqual(row.ping_count, 4)
+        self.assertAlmostEqual(row.latitude, 11)
+        self.assertAlmostEqual(row.longitude, 21)
+        self.assertAlmostEqual(row.avg_speed, 20)
+        self.assertEqual(row.max_speed, 50)
+
+    def test_late_pings_extend_the_trip_of_a_compacted_window(self):
+        bus = Bus.objects.create(bus_number='1', capacity=40, driver_name='Driver', driver_contact='1')
+        start = (timezone.now() - timedelta(days=30)).replace(minute=0, second=0, microsecond=0)
+
+        def ping(minute, latitude):
+            return BusLocation(
+                bus=bus, latitude=latitude, longitude=77.5, speed=minute, recorded_at=start + timedelta(minutes=minute)
+            )
+
+        BusLocation.objects.bulk_create([ping(10, 12.91), ping(20, 12.92), ping(50, 12.95)])
+        list(compact_locations(window_minutes=60, trip_gap_minutes=15))
+        self.assertEqual(BusTrip.objects.count(), 2)
+
+        # Late pings inside the first trip, after its end and bridging the gap to the second.
+        BusLocation.objects.bulk_create([ping(5, 12.905), ping(15, 12.915), ping(35, 12.935)])
+        list(compact_locations(window_minutes=60, trip_gap_minutes=15))
+
+        trip = BusTrip.objects.get()
+        self.assertEqual(trip.started_at, start + timedelta(minutes=5))
+        self.assertEqual(trip.ended_at, start + timedelta(minutes=50))
+        self.assertEqual(trip.ping_count, 6)
+        self.assertEqual(trip.max_speed, 50)
+        self.assertAlmostEqual(trip.distance_km, haversine_km(12.905, 77.5, 12.95, 77.5), places=6)
+
+
+class SearchTests(FixtureTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = api_client(self.admin)
+        self.student = Student.objects.select_related('user').first()
+        self.student.user.first_name, self.student.user.last_name = 'Zebedee', 'Quartermaine'
+        self.student.user.save()
+
+    def search(self, url, terms):
+        response = self.client.get(url, {'search': terms})
+        self.assertEqual(response.status_code, 200)
+        return [row['id'] for row in response.data['results']]
+
+    def test_terms_match_as_prefixes_of_indexed_fields(self):
+        self.assertEqual(self.search('/api/v1/students/', 'zeb quart'), [self.student.pk])
+        self.assertEqual(self.search('/api/v1/students/', 'zeb nobody'), [])
+
+    def test_index_follows_saves_and_deletes(self):
+        self.student.user.last_name = 'Fairweather'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.student.user.save(update_fields=['last_name'])
+        self.assertEqual(self.search('/api/v1/students/', 'quart'), [])
+        self.assertEqual(self.search('/api/v1/students/', 'fairw'), [self.student.pk])
+
+        route = Route.objects.create(
+            name='Xylophone Lane', start_point='Depot', end_point='School', stops=[], distance=5,
+            estimated_duration=timedelta(minutes=20),
+        )
+        self.assertEqual(self.search('/api/v1/routes/', 'xylo'), [route.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            route.delete()
+        self.assertEqual(self.search('/api/v1/routes/', 'xylo'), [])
+
+    def test_related_views_search_through_the_index(self):
+        records = AttendanceRecord.objects.filter(student=self.student)
+        self.assertTrue(records.exists())
+        self.assertEqual(
+            sorted(self.search('/api/v1/attendance-records/', 'zebedee')), sorted(records.values_list('pk', flat=True))
+        )
+
+
+class ResponseCacheTests(FixtureTestCase):
+    def setUp(self):
+        super().setUp()
+        clear_response_caches()
+        self.client = api_client(self.admin)
+
+    def test_matching_etag_is_answered_without_queries(self):
+        response = self.client.get('/api/v1/buses/')
+        self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/v1/buses/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_saving_a_model_changes_the_etag_of_its_endpoints(self):
+        bus = self.client.get('/api/v1/buses/')
+        route = self.client.get('/api/v1/routes/')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(f'/api/v1/buses/{self.route.bus_id}/', {'driver_name': 'New Driver'})
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get('/api/v1/buses/', HTTP_IF_NONE_MATCH=bus['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('New Driver', {row['driver_name'] for row in response.data['results']})
+        self.assertEqual(self.client.get('/api/v1/routes/', HTTP_IF_NONE_MATCH=route['ETag']).status_code, 200)
+
+    def test_login_does_not_change_the_etag(self):
+        response = self.client.get('/api/v1/student-route-assignments/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.parent.last_login = timezone.now()
+            self.parent.save(update_fields=['last_login'])
+        response = self.client.get('/api/v1/student-route-assignments/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_scoped_users_get_their_own_entries(self):
+        self.client.get('/api/v1/routes/')
+        response = api_client(self.parent).get('/api/v1/routes/')
+        self.assertEqual(
+            {row['id'] for row in response.data['results']}, set(get_access_scope(self.parent).ids['route'])
+        )
+
+
+@override_settings(READ_REPLICAS={'DATABASES': ['replica1'], 'STICKY_SECONDS': 10})
+class ReplicaRoutingTests(FixtureTestCase):
+    """
+    Runs with a pretend replica: reads routed to it are recorded and served
+    by the test database.
+    """
+
+    def request(self, user, method, url, data=None):
+        aliases = []
+
+        def db_for_read(router, model, **hints):
+            aliases.append(replicas._read_alias.get())
+            return 'default' if aliases[-1] else None
+
+        with mock.patch('core.replicas.get_replicas', return_value=['replica1']):
+            with mock.patch.object(replicas.ReplicaRouter, 'db_for_read', db_for_read):
+                response = getattr(api_client(user), method)(url, data)
+        return response, 'replica1' in aliases
+
+    def test_safe_requests_read_from_a_replica(self):
+        response, replica = self.request(self.admin, 'get', '/api/v1/students/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(replica)
+
+    def test_writer_reads_from_the_primary_for_a_while(self):
+        student = Student.objects.first()
+        response, replica = self.request(self.admin, 'patch', f'/api/v1/students/{student.pk}/', {'grade': '5'})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(replica)
+        self.assertFalse(self.request(self.admin, 'get', '/api/v1/students/')[1])
+        self.assertTrue(self.request(self.parent, 'get', '/api/v1/students/')[1])
+
+    def test_failed_write_does_not_stick(self):
+        student = Student.objects.first()
+        response, _ = self.request(self.admin, 'patch', f'/api/v1/students/{student.pk}/', {'grade': 'x' * 11})
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(self.request(self.admin, 'get', '/api/v1/students/')[1])
+
+    def test_pinned_endpoints_read_from_the_primary(self):
+        with override_settings(READ_REPLICAS={'DATABASES': ['replica1'], 'PRIMARY_ENDPOINTS': ['student-list']}):
+            self.assertFalse(self.request(self.admin, 'get', '/api/v1/students/')[1])
+            self.assertTrue(self.request(self.admin, 'get', '/api/v1/attendance-records/')[1])
+
+
+class SingleWriterTests(TransactionTestCase):
+    """
+    Writes here touch no tables: the writer thread has its own connection,
+    outside the transaction of a ``TestCase``.
+    """
+
+    def writer(self, **options):
+        writer = SingleWriter(**options)
+        self.addCleanup(writer.stop)
+        return writer
+
+    def block(self, writer):
+        """
+        Occupy the writer thread until the returned event is set.
+        """
+        started, release = threading.Event(), threading.Event()
+
+        def blocking():
+            started.set()
+            release.wait(5)
+
+        self.addCleanup(release.set)
+        future = writer.submit(blocking)
+        started.wait(5)
+        return future, release
+
+    def test_queued_writes_commit_together(self):
+        writer = self.writer()
+        _, release = self.block(writer)
+        futures = [writer.submit(lambda value=value: value * 2) for value in range(5)]
+        release.set()
+        self.assertEqual([future.result(5) for future in futures], [0, 2, 4, 6, 8])
+        self.assertEqual((writer.batches, writer.writes), (2, 6))
+
+    def test_failing_write_fails_alone(self):
+        writer = self.writer()
+        _, release = self.block(writer)
+        futures = [writer.submit(lambda: 1), writer.submit(lambda: 1 / 0), writer.submit(lambda: 3)]
+        release.set()
+        self.assertEqual(futures[0].result(5), 1)
+        self.assertRaises(ZeroDivisionError, futures[1].result, 5)
+        self.assertEqual(futures[2].result(5), 3)
+
+    def test_write_not_started_in_time_is_cancelled(self):
+        writer = self.writer(timeout=0.05)
+        first, release = self.block(writer)
+        ran = []
+        with self.assertRaises(WriteTimeout) as context:
+            writer.run(ran.append, 1)
+        self.assertTrue(context.exception.cancelled)
+        release.set()
+        first.result(5)
+        writer.stop()
+        self.assertEqual(ran, [])
+
+    def test_write_started_but_not_committed_in_time_may_still_commit(self):
+        writer = self.writer(timeout=0.05)
+        release = threading.Event()
+        self.addCleanup(release.set)
+        with self.assertRaises(WriteTimeout) as context:
+            writer.run(release.wait, 5)
+        self.assertFalse(context.exception.cancelled)
+
+    def test_timeout_is_answered_with_retry_after(self):
+        client = api_client(User.objects.create_user(email='admin@example.com', password=None, role='admin'))
+        with mock.patch('core.views.write', side_effect=WriteTimeout(cancelled=True, wait=5)):
+            response = client.post('/api/v1/attendance-records/bulk_create/', [], format='json')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '5')
+
+
+class SeederTests(TestCase):
+    options = {'buses': 2, 'stops': 4, 'students': 12, 'days': 3, 'ping_interval': 60, 'end': date(2024, 3, 15)}
+
+    def setUp(self):
+        cache.clear()
+
+    def seed(self, **options):
+        """
+        Seed, snapshot the generated rows without their primary keys and
+        roll everything back.
+        """
+        with transaction.atomic():
+            counts = Seeder(**{**self.options, **options}).run()
+            snapshot = {
+                'users': list(User.objects.order_by('email').values_list('email', 'first_name', 'last_name', 'role')),
+                'routes': list(Route.objects.order_by('name').values_list('name', 'stops', 'distance')),
+                'attendance': list(AttendanceRecord.objects.order_by('student__student_id', 'date').values_list(
+                    'student__student_id', 'date', 'status'
+                )),
+                'pings': list(BusLocation.objects.order_by('bus__bus_number', 'recorded_at').values_list(
+                    'bus__bus_number', 'latitude', 'longitude', 'recorded_at'
+                )),
+            }
+            transaction.set_rollback(True)
+        return counts, snapshot
+
+    def test_same_seed_gives_the_same_data(self):
+        counts, snapshot = self.seed(seed=1)
+        self.assertTrue(all(snapshot.values()))
+        self.assertEqual(self.seed(seed=1), (counts, snapshot))
+        self.assertNotEqual(self.seed(seed=2)[1], snapshot)
+
+    def test_attendance_covers_the_school_days_up_to_end(self):
+        _, snapshot = self.seed()
+        days = sorted({day for _, day, _ in snapshot['attendance']})
+        self.assertEqual(days, [date(2024, 3, 13), date(2024, 3, 14), date(2024, 3, 15)])
+
+    def test_command_refuses_to_seed_twice(self):
+        arguments = ['--buses', '1', '--students', '5', '--years', '0.01', '--ping-days', '0', '--end', '2024-03-15']
+        call_command('seed_data', *arguments, stdout=StringIO())
+        with self.assertRaises(CommandError):
+            call_command('seed_data', *arguments, stdout=StringIO())
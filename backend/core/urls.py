@@ -7,14 +7,22 @@ router = DefaultRouter()
 router.register(r'students', views.StudentViewSet, basename='student')
 router.register(r'buses', views.BusViewSet, basename='bus')
 router.register(r'routes', views.RouteViewSet, basename='route')
+router.register(r'stops', views.RouteStopViewSet, basename='routestop')
+router.register(r'stop-events', views.StopEventViewSet, basename='stopevent')
 router.register(r'student-route-assignments', views.StudentRouteAssignmentViewSet, 
                 basename='studentrouteassignment')
+router.register(r'staff-assignments', views.StaffAssignmentViewSet, basename='staffassignment')
 router.register(r'attendance-records', views.AttendanceRecordViewSet, 
                 basename='attendancerecord')
+router.register(r'reports/route-daily', views.RouteAttendanceDailyViewSet, basename='routeattendancedaily')
+router.register(r'reports/grade-daily', views.GradeAttendanceDailyViewSet, basename='gradeattendancedaily')
+router.register(r'reports/student-monthly', views.StudentAttendanceMonthlyViewSet,
+                basename='studentattendancemonthly')
 
 urlpatterns = [
     # Include all the router URLs
     path('', include(router.urls)),
+    path('pings/', views.PingIngestView.as_view(), name='ping-ingest'),
     
     # Additional custom endpoints can be added here
     # Example:
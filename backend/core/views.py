@@ -1,58 +1,165 @@
+import csv
+import math
+from datetime import timedelta
+
 from rest_framework import viewsets, status, filters
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.decorators import action
+from rest_framework.exceptions import PermissionDenied, ValidationError
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
+from rest_framework.views import APIView
+from django.contrib.auth import get_user_model
+from django.http import StreamingHttpResponse
+from django.utils.cache import patch_cache_control
+from django.utils.dateparse import parse_date
+from django.utils.http import parse_etags
 from django_filters.rest_framework import DjangoFilterBackend
 
-from .models import Student, Bus, Route, StudentRouteAssignment, AttendanceRecord
+from .access import ScopedQuerysetMixin, get_access_scope
+from .attendance import CREATED, FAILED, UPDATED, upsert_attendance
+from .caching import CachedResponseMixin, overlay_positions
+from .eta import get_eta_engine
+from .exports import FORMATS, export_attendance, filter_attendance
+from .importer import get_import_settings, import_students, read_csv
+from .ingestion import ingest
+from .models import (
+    Student, Bus, BusLocation, Route, RouteStop, StopEvent, StudentRouteAssignment, StaffAssignment,
+    AttendanceRecord, RouteAttendanceDaily, GradeAttendanceDaily, StudentAttendanceMonthly
+)
+from .pagination import KeysetPagination
+from .permissions import IsBusStaffOrAdmin
+from .positions import get_position_store
+from .replicas import ReplicaReadMixin
+from .replay import MAX_RANGE, parse_moment, replay_lines
+from .rosters import get_roster
+from .search import FullTextSearchFilter
 from .serializers import (
-    StudentSerializer, BusSerializer, RouteSerializer,
-    StudentRouteAssignmentSerializer, AttendanceRecordSerializer
+    StudentSerializer, BusSerializer, RouteSerializer, RouteStopSerializer, StopEventSerializer,
+    StudentRouteAssignmentSerializer, StaffAssignmentSerializer, AttendanceRecordSerializer, PingSerializer,
+    RouteAttendanceDailySerializer, GradeAttendanceDailySerializer, StudentAttendanceMonthlySerializer
 )
+from .spatial import get_stop_index, haversine_km
+from .writer import write
+
+User = get_user_model()
+
 
-class StudentViewSet(viewsets.ModelViewSet):
+def get_point_params(request, default_radius_km=None):
+    """
+    Parse ``lat``, ``lon`` and the optional ``radius_km`` query parameters.
+    """
+    params = request.query_params
+    try:
+        latitude = float(params['lat'])
+        longitude = float(params['lon'])
+    except KeyError:
+        raise ValidationError({"error": "The lat and lon query parameters are required"})
+    except ValueError:
+        raise ValidationError({"error": "lat and lon must be numbers"})
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise ValidationError({"error": "lat/lon out of range"})
+    radius_km = params.get('radius_km', default_radius_km)
+    if radius_km is not None:
+        try:
+            radius_km = float(radius_km)
+        except ValueError:
+            raise ValidationError({"radius_km": ["Must be a number"]})
+        if radius_km <= 0:
+            raise ValidationError({"radius_km": ["Must be positive"]})
+    return latitude, longitude, radius_km
+
+class StudentViewSet(ReplicaReadMixin, ScopedQuerysetMixin, viewsets.ModelViewSet):
     """
     API endpoint for managing students.
     """
-    queryset = Student.objects.all()
+    queryset = Student.objects.select_related('user').prefetch_related('parents').order_by('student_id')
     serializer_class = StudentSerializer
     permission_classes = [IsAuthenticated]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter, filters.OrderingFilter]
     search_fields = ['student_id', 'user__first_name', 'user__last_name', 'grade']
-    filterset_fields = ['grade', 'is_active']
+    search_index = 'student'
+    filterset_fields = ['grade', 'user__is_active']
     ordering_fields = ['student_id', 'user__last_name', 'grade']
+    scope_fields = {'student': 'pk'}
 
     def get_permissions(self):
         """
         Instantiates and returns the list of permissions that this view requires.
         """
-        if self.action in ['create', 'update', 'partial_update', 'destroy']:
+        if self.action in ['create', 'update', 'partial_update', 'destroy', 'import_csv']:
             permission_classes = [IsAdminUser]
         else:
             permission_classes = [IsAuthenticated]
         return [permission() for permission in permission_classes]
 
+    @action(detail=False, methods=['post'], url_path='import', parser_classes=[MultiPartParser])
+    def import_csv(self, request):
+        """
+        Import students from an uploaded CSV file (form field ``file``) with
+        the columns email, first_name, last_name, student_id, grade,
+        date_of_birth, address, emergency_contact and optionally password,
+        phone_number, route, pickup_point, pickup_time, drop_point and
+        drop_time. Pass ?dry_run=true to only validate the file.
+        """
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({"error": "Upload a CSV file in the 'file' field"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            rows = list(read_csv(upload.read()))
+        except (UnicodeDecodeError, csv.Error):
+            return Response({"error": "The file is not a UTF-8 CSV file"}, status=status.HTTP_400_BAD_REQUEST)
+        config = get_import_settings()
+        if len(rows) > config['MAX_UPLOAD_ROWS']:
+            return Response(
+                {"error": f"At most {config['MAX_UPLOAD_ROWS']} rows can be uploaded at once; "
+                          "use the import_students command"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        passwords = sum(1 for row in rows if row.get('password'))
+        if passwords > config['MAX_UPLOAD_PASSWORDS']:
+            return Response(
+                {"error": f"At most {config['MAX_UPLOAD_PASSWORDS']} rows with a password can be uploaded at once; "
+                          "leave passwords out or use the import_students command"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        dry_run = request.query_params.get('dry_run', '').lower() in ('1', 'true', 'yes')
+        result = import_students(rows, workers=config['UPLOAD_WORKERS'], threads=True, dry_run=dry_run)
+        if not result['failed']:
+            response_status = status.HTTP_200_OK if dry_run else status.HTTP_201_CREATED
+        elif result['failed'] == result['rows']:
+            response_status = status.HTTP_400_BAD_REQUEST
+        else:
+            response_status = status.HTTP_207_MULTI_STATUS
+        return Response(result, status=response_status)
+
     @action(detail=True, methods=['get'])
     def attendance(self, request, pk=None):
         """
         Get attendance records for a specific student.
         """
         student = self.get_object()
-        attendance_records = AttendanceRecord.objects.filter(student=student)
+        attendance_records = AttendanceRecord.objects.filter(student=student).select_related(
+            'student__user', 'route__bus', 'recorded_by'
+        )
         serializer = AttendanceRecordSerializer(attendance_records, many=True)
         return Response(serializer.data)
 
-class BusViewSet(viewsets.ModelViewSet):
+class BusViewSet(ReplicaReadMixin, CachedResponseMixin, ScopedQuerysetMixin, viewsets.ModelViewSet):
     """
     API endpoint for managing buses.
     """
-    queryset = Bus.objects.all()
+    queryset = Bus.objects.order_by('bus_number')
     serializer_class = BusSerializer
     permission_classes = [IsAuthenticated]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter, filters.OrderingFilter]
     search_fields = ['bus_number', 'driver_name']
+    search_index = 'bus'
     filterset_fields = ['is_active']
     ordering_fields = ['bus_number', 'capacity']
+    scope_fields = {'bus': 'pk'}
+    cache_models = (Bus,)
 
     def get_permissions(self):
         """
@@ -64,17 +171,108 @@ class BusViewSet(viewsets.ModelViewSet):
             permission_classes = [IsAuthenticated]
         return [permission() for permission in permission_classes]
 
-class RouteViewSet(viewsets.ModelViewSet):
+    def overlay_cached_data(self, data):
+        def with_position(bus, position):
+            bus = {**bus, 'last_position': position}
+            if position is not None:
+                bus['current_location'] = f"{position['latitude']:.6f},{position['longitude']:.6f}"
+            return bus
+
+        return overlay_positions(data, lambda bus: bus['id'], with_position)
+
+    @action(detail=False, methods=['get'])
+    def positions(self, request):
+        """
+        Get the last known position of every active bus, or of the buses
+        given as ?bus=1&bus=2, straight from the position store.
+        """
+        store = get_position_store()
+        bus_ids = request.query_params.getlist('bus')
+        if bus_ids:
+            try:
+                positions = store.get_many([int(bus_id) for bus_id in bus_ids])
+            except ValueError:
+                return Response(
+                    {"bus": ["Bus ids must be integers"]},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        else:
+            positions = store.all()
+        scope = self.get_access_scope()
+        return Response([position for bus_id, position in positions.items() if scope.allows('bus', bus_id)])
+
+    @action(detail=False, methods=['get'])
+    def nearby(self, request):
+        """
+        Get buses whose last known position is within radius_km (default 2)
+        of ?lat=&lon=, closest first.
+        """
+        latitude, longitude, radius_km = get_point_params(request, default_radius_km=2)
+        scope = self.get_access_scope()
+        nearby = []
+        for bus_id, position in get_position_store().all().items():
+            if not scope.allows('bus', bus_id):
+                continue
+            distance = haversine_km(latitude, longitude, position['latitude'], position['longitude'])
+            if distance <= radius_km:
+                nearby.append({**position, 'distance_km': round(distance, 4)})
+        nearby.sort(key=lambda position: position['distance_km'])
+        return Response(nearby)
+
+    @action(detail=True, methods=['get'])
+    def replay(self, request, pk=None):
+        """
+        Stream this bus's pings as NDJSON, oldest first.
+        Use ?date=2023-01-01 for a whole day or ?start=&end= (ISO dates or
+        datetimes; an end date includes that whole day), and ?every=<seconds>
+        to keep at most one ping per interval.
+        """
+        bus = self.get_object()
+        params = request.query_params
+        if 'date' in params:
+            start = parse_moment(params['date'])
+            end = parse_moment(params['date'], end_of_day=True)
+        elif 'start' in params and 'end' in params:
+            start = parse_moment(params['start'])
+            end = parse_moment(params['end'], end_of_day=True)
+        else:
+            raise ValidationError({"error": "Provide ?date= or both ?start= and ?end="})
+        if start is None or end is None:
+            raise ValidationError({"error": "Dates must be ISO 8601 dates or datetimes"})
+        if end <= start or end - start > MAX_RANGE:
+            raise ValidationError({"error": f"The range must be positive and at most {MAX_RANGE.days} days"})
+
+        every = None
+        if 'every' in params:
+            try:
+                seconds = float(params['every'])
+                if not math.isfinite(seconds) or seconds <= 0:
+                    raise ValueError(seconds)
+                every = timedelta(seconds=seconds)
+            except (ValueError, OverflowError):
+                raise ValidationError({"every": ["Must be a positive number of seconds"]})
+
+        response = StreamingHttpResponse(
+            replay_lines(bus.pk, start, end, every=every),
+            content_type='application/x-ndjson'
+        )
+        response['Content-Disposition'] = f'inline; filename="bus-{bus.bus_number}-replay.ndjson"'
+        return response
+
+class RouteViewSet(ReplicaReadMixin, CachedResponseMixin, ScopedQuerysetMixin, viewsets.ModelViewSet):
     """
     API endpoint for managing routes.
     """
-    queryset = Route.objects.all()
+    queryset = Route.objects.select_related('bus').order_by('name', 'id')
     serializer_class = RouteSerializer
     permission_classes = [IsAuthenticated]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter, filters.OrderingFilter]
     search_fields = ['name', 'start_point', 'end_point']
+    search_index = 'route'
     filterset_fields = ['is_active']
     ordering_fields = ['name', 'distance']
+    scope_fields = {'route': 'pk'}
+    cache_models = (Route, Bus)
 
     def get_permissions(self):
         """
@@ -86,27 +284,140 @@ class RouteViewSet(viewsets.ModelViewSet):
             permission_classes = [IsAuthenticated]
         return [permission() for permission in permission_classes]
 
+    def overlay_cached_data(self, data):
+        def with_position(route, position):
+            if route['bus_details'] is None:
+                return route
+            return {**route, 'bus_details': {**route['bus_details'], 'last_position': position}}
+
+        return overlay_positions(data, lambda route: route['bus'], with_position)
+
     @action(detail=True, methods=['get'])
     def students(self, request, pk=None):
         """
         Get all students assigned to this route.
+        Supports If-None-Match: an unchanged roster is answered with 304.
         """
         route = self.get_object()
-        assignments = StudentRouteAssignment.objects.filter(route=route, is_active=True)
-        students = [assignment.student for assignment in assignments]
-        serializer = StudentSerializer(students, many=True)
-        return Response(serializer.data)
+        roster = get_roster(route.pk)
+        if roster['etag'] in parse_etags(request.headers.get('If-None-Match', '')):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(roster['data'])
+        response['ETag'] = roster['etag']
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    @action(detail=True, methods=['get'])
+    def eta(self, request, pk=None):
+        """
+        Get the estimated arrival time at every remaining stop of this route,
+        or only at ?stop=<sequence>. Estimates are recomputed as pings arrive.
+        """
+        route = self.get_object()
+        result = get_eta_engine().get(route.pk)
+        if result is None:
+            return Response(
+                {"detail": "No estimate available until the route's bus reports its position."},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        stop = request.query_params.get('stop')
+        if stop is not None:
+            try:
+                stop = int(stop)
+            except ValueError:
+                raise ValidationError({"stop": ["Must be a stop sequence number"]})
+            result = {**result, 'stops': [item for item in result['stops'] if item['sequence'] == stop]}
+        return Response(result)
 
-class StudentRouteAssignmentViewSet(viewsets.ModelViewSet):
+class RouteStopViewSet(ReplicaReadMixin, ScopedQuerysetMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    API endpoint for the geocoded stops of every route.
+    Stops are edited through the route's `stops` field.
+    """
+    queryset = RouteStop.objects.all()
+    serializer_class = RouteStopSerializer
+    permission_classes = [IsAuthenticated]
+    filter_backends = [DjangoFilterBackend, filters.SearchFilter]
+    filterset_fields = ['route']
+    search_fields = ['name']
+    scope_fields = {'route': 'route_id'}
+
+    @action(detail=False, methods=['get'])
+    def nearest(self, request):
+        """
+        Get the stops of active routes in the user's scope closest to
+        ?lat=&lon=, optionally limited to ?radius_km= and ?limit= results
+        (default 5, max 100).
+        """
+        latitude, longitude, radius_km = get_point_params(request)
+        try:
+            limit = min(max(int(request.query_params.get('limit', 5)), 1), 100)
+        except ValueError:
+            raise ValidationError({"limit": ["Must be an integer"]})
+        routes = self.get_access_scope().ids['route']
+        stops = get_stop_index().nearest(latitude, longitude, limit=limit, max_km=radius_km, routes=routes)
+        return Response(stops)
+
+class StopEventViewSet(ReplicaReadMixin, ScopedQuerysetMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    API endpoint for stop arrival and departure events detected from pings.
+    Filter with ?route=&date= for a route's day.
+    """
+    queryset = StopEvent.objects.all()
+    serializer_class = StopEventSerializer
+    permission_classes = [IsAuthenticated]
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
+    filterset_fields = ['route', 'bus', 'date', 'event_type', 'stop_sequence']
+    ordering_fields = ['occurred_at', 'stop_sequence']
+    keyset_ordering = ('-occurred_at', '-id')
+    pagination_class = KeysetPagination
+    scope_fields = {'route': 'route_id', 'bus': 'bus_id'}
+
+class StudentRouteAssignmentViewSet(
+    ReplicaReadMixin, CachedResponseMixin, ScopedQuerysetMixin, viewsets.ModelViewSet
+):
     """
     API endpoint for managing student route assignments.
     """
-    queryset = StudentRouteAssignment.objects.all()
+    queryset = StudentRouteAssignment.objects.select_related('student__user', 'route__bus').order_by('id')
     serializer_class = StudentRouteAssignmentSerializer
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['is_active', 'route', 'student']
     ordering_fields = ['assigned_date']
+    scope_fields = {'student': 'student_id', 'route': 'route_id'}
+    cache_models = (StudentRouteAssignment, Student, User, Route, Bus)
+
+    def get_permissions(self):
+        """
+        Instantiates and returns the list of permissions that this view requires.
+        """
+        if self.action in ['create', 'update', 'partial_update', 'destroy']:
+            permission_classes = [IsAdminUser]
+        else:
+            permission_classes = [IsAuthenticated]
+        return [permission() for permission in permission_classes]
+
+class StaffAssignmentViewSet(ReplicaReadMixin, CachedResponseMixin, viewsets.ModelViewSet):
+    """
+    API endpoint for managing staff assignments to buses and routes.
+    Bus staff only see their own assignments.
+    """
+    queryset = StaffAssignment.objects.select_related('staff', 'bus', 'route')
+    serializer_class = StaffAssignmentSerializer
+    permission_classes = [IsAuthenticated]
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
+    filterset_fields = ['staff', 'bus', 'route']
+    ordering_fields = ['valid_from', 'valid_until']
+    cache_models = (StaffAssignment,)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        user = self.request.user
+        if user.is_staff or user.role == 'admin':
+            return queryset
+        return queryset.filter(staff=user)
 
     def get_permissions(self):
         """
@@ -118,51 +429,82 @@ class StudentRouteAssignmentViewSet(viewsets.ModelViewSet):
             permission_classes = [IsAuthenticated]
         return [permission() for permission in permission_classes]
 
-class AttendanceRecordViewSet(viewsets.ModelViewSet):
+class AttendanceRecordViewSet(ReplicaReadMixin, ScopedQuerysetMixin, viewsets.ModelViewSet):
     """
     API endpoint for managing attendance records.
     """
-    queryset = AttendanceRecord.objects.all()
+    queryset = AttendanceRecord.objects.select_related('student__user', 'route__bus', 'recorded_by')
+    serializer_class = AttendanceRecordSerializer
     permission_classes = [IsAuthenticated]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter, filters.OrderingFilter]
     filterset_fields = ['student', 'route', 'status', 'date']
     search_fields = ['student__user__first_name', 'student__user__last_name', 'student__student_id']
-    ordering_fields = ['-date', 'student__user__last_name']
+    search_index = 'student'
+    search_lookup = 'student_id'
+    ordering_fields = ['date', 'student__user__last_name']
+    keyset_ordering = ('-date', '-id')
+    pagination_class = KeysetPagination
+    scope_fields = {'student': 'student_id', 'route': 'route_id'}
+    max_bulk_size = 1000
+
+    def check_scope(self, serializer):
+        data = serializer.validated_data
+        student = data.get('student', getattr(serializer.instance, 'student', None))
+        route = data.get('route', getattr(serializer.instance, 'route', None))
+        allowed = self.get_access_scope().allows_object(
+            student=student.pk if student else None, route=route.pk if route else None
+        )
+        if not allowed:
+            raise PermissionDenied("You are not assigned to this student or route.")
 
     def perform_create(self, serializer):
         """
         Set the recorded_by field to the current user when creating a new record.
         """
+        self.check_scope(serializer)
         serializer.save(recorded_by=self.request.user)
 
-    def get_queryset(self):
+    def perform_update(self, serializer):
+        self.check_scope(serializer)
+        serializer.save()
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
         """
-        Filter queryset based on user role.
+        Stream attendance records as CSV (default) or NDJSON (?output=ndjson),
+        oldest day first. Accepts the list filters plus ?start=&end= (ISO
+        dates, inclusive) and ?grade=.
         """
-        queryset = super().get_queryset()
-        user = self.request.user
-        
-        # If user is a bus staff, only show records for their assigned routes
-        if user.role == 'bus_staff':
-            # Get all routes assigned to this bus staff
-            # This assumes you have a way to associate bus staff with routes
-            # You'll need to implement this based on your requirements
-            assigned_routes = Route.objects.filter(bus__driver_name__icontains=user.get_full_name())
-            queryset = queryset.filter(route__in=assigned_routes)
-        # If user is a parent, only show records for their children
-        elif user.role == 'parent':
-            # This assumes you have a way to associate parents with students
-            # You'll need to implement this based on your requirements
-            student_ids = Student.objects.filter(parent=user).values_list('id', flat=True)
-            queryset = queryset.filter(student_id__in=student_ids)
-        
-        return queryset
+        params = request.query_params
+        output = params.get('output', 'csv')
+        if output not in FORMATS:
+            raise ValidationError({"output": [f"Must be one of: {', '.join(FORMATS)}"]})
+        start = end = None
+        try:
+            if 'start' in params:
+                start = parse_date(params['start'])
+            if 'end' in params:
+                end = parse_date(params['end'])
+        except ValueError:
+            start = end = None
+        if ('start' in params and start is None) or ('end' in params and end is None):
+            raise ValidationError({"error": "start and end must be ISO 8601 dates"})
+
+        records = filter_attendance(
+            self.filter_queryset(self.get_queryset()), start=start, end=end, grade=params.get('grade')
+        )
+        response = StreamingHttpResponse(export_attendance(records, output=output), content_type=FORMATS[output])
+        filename = f"attendance-{start or 'all'}-{end or 'all'}.{output}"
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
 
     @action(detail=False, methods=['post'])
     def bulk_create(self, request):
         """
-        Create multiple attendance records at once.
+        Create or update multiple attendance records at once, keyed on
+        (student, date), so a roll call can be resubmitted.
         Expected payload: [{"student": 1, "date": "2023-01-01", "status": "present", "route": 1}, ...]
+        Returns one outcome per row: created, updated or failed with its errors.
         """
         data = request.data
         if not isinstance(data, list):
@@ -170,9 +512,115 @@ class AttendanceRecordViewSet(viewsets.ModelViewSet):
                 {"error": "Expected a list of attendance records"},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        
-        serializer = self.get_serializer(data=data, many=True)
-        if serializer.is_valid():
-            serializer.save(recorded_by=request.user)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        if len(data) > self.max_bulk_size:
+            return Response(
+                {"error": f"At most {self.max_bulk_size} records can be sent per request"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        outcomes = write(upsert_attendance, data, recorded_by=request.user, scope=self.get_access_scope())
+        counts = {outcome: 0 for outcome in (CREATED, UPDATED, FAILED)}
+        for outcome in outcomes:
+            counts[outcome['status']] += 1
+        if not counts[FAILED]:
+            response_status = status.HTTP_201_CREATED
+        elif counts[FAILED] == len(outcomes):
+            response_status = status.HTTP_400_BAD_REQUEST
+        else:
+            response_status = status.HTTP_207_MULTI_STATUS
+        return Response({**counts, 'results': outcomes}, status=response_status)
+
+class RouteAttendanceDailyViewSet(ReplicaReadMixin, ScopedQuerysetMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    API endpoint for daily attendance counts per route, e.g.
+    ?route=1&date__gte=2023-01-01&date__lte=2023-01-31.
+    """
+    queryset = RouteAttendanceDaily.objects.select_related('route')
+    serializer_class = RouteAttendanceDailySerializer
+    permission_classes = [IsAuthenticated]
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = {'route': ['exact'], 'date': ['exact', 'gte', 'lte']}
+    scope_fields = {'route': 'route_id'}
+
+class GradeAttendanceDailyViewSet(ReplicaReadMixin, ScopedQuerysetMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    API endpoint for daily attendance counts per grade. The counts span
+    every student of a grade, so only unrestricted users see them.
+    """
+    queryset = GradeAttendanceDaily.objects.all()
+    serializer_class = GradeAttendanceDailySerializer
+    permission_classes = [IsAuthenticated]
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = {'grade': ['exact'], 'date': ['exact', 'gte', 'lte']}
+    scope_fields = {}
+
+class StudentAttendanceMonthlyViewSet(ReplicaReadMixin, ScopedQuerysetMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    API endpoint for monthly attendance counts per student; ``month`` is the
+    first day of the month.
+    """
+    queryset = StudentAttendanceMonthly.objects.select_related('student__user')
+    serializer_class = StudentAttendanceMonthlySerializer
+    permission_classes = [IsAuthenticated]
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = {'student': ['exact'], 'month': ['exact', 'gte', 'lte']}
+    scope_fields = {'student': 'student_id'}
+
+class PingIngestView(APIView):
+    """
+    API endpoint for bus GPS pings.
+    Accepts a single ping or a batch: [{"bus": 1, "latitude": 12.97, "longitude": 77.59,
+    "speed": 32.5, "heading": 90, "recorded_at": "2023-01-01T08:00:00+05:30"}, ...]
+    """
+    permission_classes = [IsBusStaffOrAdmin]
+    max_batch_size = 5000
+
+    def post(self, request):
+        data = request.data
+        if isinstance(data, dict):
+            data = data.get('pings', [data])
+        if not isinstance(data, list) or not data:
+            return Response(
+                {"error": "Expected a ping or a non-empty list of pings"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(data) > self.max_batch_size:
+            return Response(
+                {"error": f"At most {self.max_batch_size} pings can be sent per request"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        serializer = PingSerializer(data=data, many=True)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        pings = serializer.validated_data
+        bus_ids = {ping['bus'] for ping in pings}
+        known = set(Bus.objects.filter(pk__in=bus_ids, is_active=True).values_list('pk', flat=True))
+        unknown = sorted(bus_ids - known)
+        if unknown:
+            return Response(
+                {"bus": [f"Unknown or inactive bus ids: {unknown}"]},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        scope = get_access_scope(request.user)
+        unassigned = sorted(bus_id for bus_id in bus_ids if not scope.allows('bus', bus_id))
+        if unassigned:
+            return Response(
+                {"bus": [f"Not assigned to bus ids: {unassigned}"]},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        locations = [
+            BusLocation(
+                bus_id=ping['bus'],
+                latitude=ping['latitude'],
+                longitude=ping['longitude'],
+                speed=ping.get('speed'),
+                heading=ping.get('heading'),
+                recorded_at=ping['recorded_at'],
+            )
+            for ping in pings
+        ]
+        accepted = ingest(locations, sender=self.__class__)
+        return Response({"accepted": accepted}, status=status.HTTP_202_ACCEPTED)
@@ -0,0 +1,248 @@
+"""
+Write concurrency for SQLite.
+
+SQLite allows one writer at a time. Under the default rollback journal,
+writers also block readers, and every transaction pays for its own fsync,
+so concurrent roll calls and pings end in "database is locked".
+
+``configure_connection`` (run for every new connection) switches SQLite to
+WAL, so readers never wait for the writer, relaxes ``synchronous`` to
+``NORMAL``, which is still durable across application crashes in WAL mode,
+and makes a busy connection wait ``busy_timeout`` ms instead of failing.
+
+``SingleWriter`` funnels the high-volume writes of a process (ping batches,
+attendance bulk posts) through one thread. That thread commits whatever
+has queued up meanwhile in a single transaction, so N concurrent writes
+cost one commit instead of N contending ones.
+``bench_writes`` measures the difference. A write that is not committed
+within ``TIMEOUT`` seconds raises ``WriteTimeout`` (503 with Retry-After); it
+is cancelled if the writer has not started it yet.
+"""
+import atexit
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+DEFAULTS = {
+    'PRAGMAS': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,
+    },
+    'SINGLE_WRITER': True,
+    'MAX_BATCH': 64,
+    'MAX_WAIT': 0,
+    'TIMEOUT': 30,
+    'RETRY_AFTER': 5,
+}
+
+
+def get_writer_settings():
+    return {**DEFAULTS, **getattr(settings, 'SQLITE_WRITES', {})}
+
+
+def configure_connection(connection):
+    """
+    Apply the configured pragmas to a new SQLite connection.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in get_writer_settings()['PRAGMAS'].items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+class WriteTimeout(APIException):
+    """
+    The writer did not commit a write in time. ``cancelled`` tells whether
+    the write was dropped before it started; otherwise it may still commit.
+    """
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_code = 'write_timeout'
+
+    def __init__(self, cancelled, wait):
+        if cancelled:
+            detail = "The database is busy and the write was not saved; retry later."
+        else:
+            detail = "The database is busy; the write may still be saved, retry later."
+        super().__init__(detail)
+        self.cancelled = cancelled
+        self.wait = wait
+
+
+class WriteTask:
+    def __init__(self, function, args, kwargs):
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+
+
+class SingleWriter:
+    """
+    A thread that runs queued write functions, committing up to
+    ``max_batch`` of them at once. It waits at most ``max_wait`` seconds
+    for more writes to join a batch.
+    """
+
+    def __init__(self, using=DEFAULT_DB_ALIAS, max_batch=64, max_wait=0, timeout=30, retry_after=5):
+        self.using = using
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.batches = 0
+        self.writes = 0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def is_writer_thread(self):
+        return threading.current_thread() is self._thread
+
+    def should_queue(self):
+        """
+        Whether the calling thread should hand its write over. Writes made
+        inside a transaction (including test cases) or by the writer itself
+        run inline, in that transaction.
+        """
+        connection = connections[self.using]
+        return (
+            connection.vendor == 'sqlite'
+            and not connection.in_atomic_block
+            and not self.is_writer_thread()
+        )
+
+    def submit(self, function, *args, **kwargs):
+        """
+        Queue ``function(*args, **kwargs)`` and return a ``Future`` that
+        completes once the write is committed.
+        """
+        task = WriteTask(function, args, kwargs)
+        self._ensure_worker()
+        self._queue.put(task)
+        return task.future
+
+    def run(self, function, *args, **kwargs):
+        """
+        Run a write through the writer thread and return its result once
+        committed, or run it inline when it should not be queued. Raises
+        ``WriteTimeout`` if it is not committed within ``timeout`` seconds.
+        """
+        if not self.should_queue():
+            return function(*args, **kwargs)
+        future = self.submit(function, *args, **kwargs)
+        try:
+            return future.result(self.timeout)
+        except FutureTimeoutError:
+            if future.cancel():
+                raise WriteTimeout(cancelled=True, wait=self.retry_after)
+            if future.done():
+                return future.result()
+            raise WriteTimeout(cancelled=False, wait=self.retry_after)
+
+    def _ensure_worker(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='single-writer', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        try:
+            stopping = False
+            while not stopping:
+                task = self._queue.get()
+                if task is None:
+                    break
+                batch = [task]
+                deadline = time.monotonic() + self.max_wait
+                while len(batch) < self.max_batch:
+                    try:
+                        task = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                    except queue.Empty:
+                        break
+                    if task is None:
+                        stopping = True
+                        break
+                    batch.append(task)
+                self._commit(batch)
+        finally:
+            connections[self.using].close()
+
+    def _commit(self, batch):
+        """
+        Run a batch in one transaction. If a write fails, the batch is rolled
+        back and each write retried in a transaction of its own, so write
+        functions must only change the database.
+        """
+        batch = [task for task in batch if task.future.set_running_or_notify_cancel()]
+        try:
+            with transaction.atomic(using=self.using):
+                results = [task.function(*task.args, **task.kwargs) for task in batch]
+        except Exception as error:
+            # The connection is kept between batches; replace it if it broke.
+            connections[self.using].close_if_unusable_or_obsolete()
+            if len(batch) > 1:
+                for task in batch:
+                    self._commit_alone(task)
+                return
+            batch[0].future.set_exception(error)
+            return
+        self.batches += 1
+        self.writes += len(batch)
+        # Callers are released only after the commit, so they read their writes.
+        for task, result in zip(batch, results):
+            task.future.set_result(result)
+
+    def _commit_alone(self, task):
+        try:
+            with transaction.atomic(using=self.using):
+                result = task.function(*task.args, **task.kwargs)
+        except Exception as error:
+            task.future.set_exception(error)
+            return
+        self.batches += 1
+        self.writes += 1
+        task.future.set_result(result)
+
+    def stop(self):
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(self.timeout)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                config = get_writer_settings()
+                _writer = SingleWriter(
+                    max_batch=config['MAX_BATCH'], max_wait=config['MAX_WAIT'], timeout=config['TIMEOUT'],
+                    retry_after=config['RETRY_AFTER'],
+                )
+                atexit.register(_writer.stop)
+    return _writer
+
+
+def write(function, *args, **kwargs):
+    """
+    Run a write through the single writer if it is enabled, otherwise
+    inline.
+    """
+    if not get_writer_settings()['SINGLE_WRITER']:
+        return function(*args, **kwargs)
+    return get_writer().run(function, *args, **kwargs)
@@ -1,8 +1,9 @@
 import os
+import sys
 import django
 
-def setup_database():
-    """Set up the database and create a superuser."""
+def setup_database(seed_args=None):
+    """Set up the database, create a superuser and optionally generate data."""
     # Set up Django environment
     os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
     django.setup()
@@ -27,5 +28,14 @@ def setup_database():
     else:
         print("Superuser already exists.")
 
+    # Generate a synthetic data set, see `python manage.py seed_data --help`
+    if seed_args is not None:
+        from django.core.management import call_command
+
+        print("Generating data...")
+        call_command('seed_data', *seed_args)
+
 if __name__ == "__main__":
-    setup_database()
+    # python setup_db.py [--seed [seed_data options]]
+    args = sys.argv[1:]
+    setup_database(args[1:] if args[:1] == ['--seed'] else None)
@@ -0,0 +1,201 @@
+"""
+JWT authentication without a user query per request.
+
+Tokens carry the claims permission checks and access scopes need (role,
+``is_active``, ``is_staff``, ``is_superuser``) and the user's
+``token_version``. The request user is built from those signed claims, so
+the only lookup left is the user's current version, which lives in the
+Django cache for ``VERSION_TIMEOUT`` seconds and falls back to a small
+in-process LRU/TTL cache of user rows. The cache has to be shared between
+worker processes for a revocation to reach all of them at once (see
+``core.checks``); the timeout bounds how long a stale version can linger.
+Changing a user's password, email, role or flags bumps the version (see
+``users.signals``), which revokes every token issued before.
+
+Tokens issued without these claims are still accepted and resolved through
+the same user cache.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import F
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .models import User
+
+DEFAULTS = {
+    'CACHE': 'default',
+    'VERSION_TIMEOUT': 300,
+    'USER_CACHE_SIZE': 1024,
+    'USER_CACHE_TTL': 60,  # seconds a cached user row is trusted
+}
+
+CLAIM_FIELDS = ('email', 'role', 'is_active', 'is_staff', 'is_superuser')
+VERSION_CLAIM = 'ver'
+
+# Saves touching any of these revoke the user's tokens.
+TOKEN_FIELDS = CLAIM_FIELDS + ('password',)
+
+
+def get_token_auth_settings():
+    return {**DEFAULTS, **getattr(settings, 'TOKEN_AUTH', {})}
+
+
+def get_cache():
+    return caches[get_token_auth_settings()['CACHE']]
+
+
+def version_key(user_id):
+    return f'token-version:{user_id}'
+
+
+class UserCache:
+    """
+    A thread-safe, size-bounded cache of user rows that expire after ``ttl``
+    seconds.
+    """
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, user_id):
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is not None and entry[0] > now:
+                self.entries.move_to_end(user_id)
+                return entry[1]
+        user = User.objects.filter(pk=user_id).first()
+        if user is not None:
+            self.put(user)
+        return user
+
+    def put(self, user):
+        with self.lock:
+            self.entries[user.pk] = (time.monotonic() + self.ttl, user)
+            self.entries.move_to_end(user.pk)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def discard(self, user_id):
+        with self.lock:
+            self.entries.pop(user_id, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+_user_cache = None
+_user_cache_lock = threading.Lock()
+
+
+def get_user_cache():
+    global _user_cache
+    if _user_cache is None:
+        with _user_cache_lock:
+            if _user_cache is None:
+                config = get_token_auth_settings()
+                _user_cache = UserCache(config['USER_CACHE_SIZE'], config['USER_CACHE_TTL'])
+    return _user_cache
+
+
+def get_token_version(user_id):
+    """
+    Return the current token version of a user, or ``None`` if the user
+    does not exist.
+    """
+    cache = get_cache()
+    version = cache.get(version_key(user_id))
+    if version is None:
+        user = get_user_cache().get(user_id)
+        if user is None:
+            return None
+        version = user.token_version
+        cache.add(version_key(user_id), version, get_token_auth_settings()['VERSION_TIMEOUT'])
+    return version
+
+
+def remember_token_version(user):
+    get_cache().set(version_key(user.pk), user.token_version, get_token_auth_settings()['VERSION_TIMEOUT'])
+    get_user_cache().discard(user.pk)
+
+
+def revoke_tokens(user):
+    """
+    Invalidate every token issued to ``user`` so far.
+    """
+    User.objects.filter(pk=user.pk).update(token_version=F('token_version') + 1)
+    user.token_version = User.objects.filter(pk=user.pk).values_list('token_version', flat=True).get()
+    remember_token_version(user)
+
+
+def add_claims(token, user):
+    for field in CLAIM_FIELDS:
+        token[field] = getattr(user, field)
+    token[VERSION_CLAIM] = user.token_version
+    return token
+
+
+def user_from_claims(token):
+    """
+    Build an unsaved-looking ``User`` from a token's claims. It carries the
+    primary key and the claimed fields only, so views that update the user
+    must load the row first.
+    """
+    user = User(
+        pk=token[api_settings.USER_ID_CLAIM],
+        token_version=token[VERSION_CLAIM],
+        **{field: token[field] for field in CLAIM_FIELDS},
+    )
+    user._state.adding = False
+    return user
+
+
+class ClaimsRefreshToken(RefreshToken):
+    """
+    Refresh token whose access tokens carry the user's claims and version.
+    """
+
+    @classmethod
+    def for_user(cls, user):
+        return add_claims(super().for_user(user), user)
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    ``JWTAuthentication`` that trusts the token's claims instead of loading
+    the user row, once the token's version is confirmed to be current.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise AuthenticationFailed(_("Token contained no recognizable user identification"))
+
+        version = get_token_version(user_id)
+        if version is None:
+            raise AuthenticationFailed(_("User not found"), code='user_not_found')
+        if validated_token.get(VERSION_CLAIM, 0) != version:
+            raise AuthenticationFailed(_("Token has been revoked"), code='token_revoked')
+
+        if all(claim in validated_token for claim in CLAIM_FIELDS + (VERSION_CLAIM,)):
+            user = user_from_claims(validated_token)
+        else:
+            user = get_user_cache().get(user_id)
+        if user is None:
+            raise AuthenticationFailed(_("User not found"), code='user_not_found')
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code='user_inactive')
+        return user
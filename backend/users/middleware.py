@@ -0,0 +1,35 @@
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+from django.contrib.auth.models import AnonymousUser
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+
+from .authentication import ClaimsJWTAuthentication
+
+
+@database_sync_to_async
+def get_user_for_token(raw_token):
+    authentication = ClaimsJWTAuthentication()
+    try:
+        validated_token = authentication.get_validated_token(raw_token)
+        return authentication.get_user(validated_token)
+    except (InvalidToken, AuthenticationFailed):
+        return AnonymousUser()
+
+
+class JWTAuthMiddleware(BaseMiddleware):
+    """
+    Populates ``scope['user']`` for WebSocket connections from a JWT access
+    token passed as the ``token`` query string parameter, since browsers
+    cannot set an Authorization header on WebSocket requests.
+    """
+
+    async def __call__(self, scope, receive, send):
+        query = parse_qs(scope.get('query_string', b'').decode())
+        tokens = query.get('token')
+        if tokens:
+            scope['user'] = await get_user_for_token(tokens[0])
+        else:
+            scope['user'] = AnonymousUser()
+        return await super().__call__(scope, receive, send)
@@ -43,6 +43,7 @@ class User(AbstractUser):
         ('bus_staff', 'Bus Staff'),
         ('teacher', 'Teacher'),
         ('parent', 'Parent'),
+        ('student', 'Student'),
     ]
     
     username = None
@@ -52,6 +53,9 @@ class User(AbstractUser):
     address = models.TextField(blank=True, null=True)
     profile_picture = models.ImageField(upload_to='profile_pics/', null=True, blank=True)
     is_verified = models.BooleanField(default=False)
+    token_version = models.PositiveIntegerField(
+        default=0, editable=False, help_text="Bumped to revoke every token issued to the user"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -60,6 +64,13 @@ class User(AbstractUser):
 
     objects = UserManager()
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # Keep the loaded values so saves can tell what changed without a query.
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
     def __str__(self):
         return self.email
 
@@ -0,0 +1,161 @@
+"""
+In-memory revocation checks for refresh tokens.
+
+Every refresh rotates the token and blacklists the old one, and simplejwt
+then checks the blacklist with a query on each use. Here the blacklisted,
+unexpired token ids are loaded into a set the first time a process checks
+one, and kept current as tokens are revoked, so replayed revoked tokens are
+refused without a query. Tokens revoked by another process are seen through
+a short-lived marker in the Django cache or, failing that, by a lookup in
+the blacklist table, so a revocation holds even when the cache is private to
+each process. The tables themselves stay the durable record, and
+``prune_tokens`` deletes expired rows from them in batches.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+from .authentication import ClaimsRefreshToken
+
+DEFAULTS = {
+    'CACHE': 'default',
+    'PRUNE_INTERVAL': 300,  # seconds between dropping expired ids from memory
+    'PRUNE_BATCH_SIZE': 1000,
+}
+
+
+def get_revocation_settings():
+    return {**DEFAULTS, **getattr(settings, 'TOKEN_REVOCATION', {})}
+
+
+def get_cache():
+    return caches[get_revocation_settings()['CACHE']]
+
+
+def revoked_key(jti):
+    return f'revoked-token:{jti}'
+
+
+class RevocationStore:
+    """
+    The ids of revoked tokens that have not expired yet, with their expiry
+    as a unix timestamp.
+    """
+
+    def __init__(self, prune_interval):
+        self.prune_interval = prune_interval
+        self.expiries = None
+        self.pruned_at = 0.0
+        self.lock = threading.Lock()
+
+    def load(self):
+        rows = BlacklistedToken.objects.filter(token__expires_at__gt=timezone.now()).values_list(
+            'token__jti', 'token__expires_at'
+        )
+        return {jti: expires_at.timestamp() for jti, expires_at in rows}
+
+    def ensure_loaded(self):
+        if self.expiries is None:
+            expiries = self.load()
+            with self.lock:
+                if self.expiries is None:
+                    self.expiries = expiries
+                    self.pruned_at = time.time()
+
+    def is_revoked(self, jti):
+        self.ensure_loaded()
+        if jti in self.expiries:
+            return True
+        if get_cache().get(revoked_key(jti)):
+            return True
+        expires_at = BlacklistedToken.objects.filter(token__jti=jti).values_list(
+            'token__expires_at', flat=True
+        ).first()
+        if expires_at is None:
+            return False
+        with self.lock:
+            self.expiries[jti] = expires_at.timestamp()
+        return True
+
+    def add(self, jti, exp):
+        self.ensure_loaded()
+        now = time.time()
+        with self.lock:
+            self.expiries[jti] = exp
+            if now - self.pruned_at > self.prune_interval:
+                self.expiries = {jti: exp for jti, exp in self.expiries.items() if exp > now}
+                self.pruned_at = now
+        get_cache().set(revoked_key(jti), True, max(1, int(exp - now)))
+
+    def clear(self):
+        with self.lock:
+            self.expiries = None
+
+    def __len__(self):
+        self.ensure_loaded()
+        return len(self.expiries)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_revocation_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = RevocationStore(get_revocation_settings()['PRUNE_INTERVAL'])
+    return _store
+
+
+def blacklist_token(jti, exp, token):
+    """
+    Record a token as outstanding and blacklisted, without the savepoints
+    and extra lookups of ``get_or_create``.
+    """
+    OutstandingToken.objects.bulk_create(
+        [OutstandingToken(jti=jti, token=token, expires_at=datetime_from_epoch(exp))], ignore_conflicts=True
+    )
+    token_id = OutstandingToken.objects.filter(jti=jti).values_list('pk', flat=True).get()
+    BlacklistedToken.objects.bulk_create([BlacklistedToken(token_id=token_id)], ignore_conflicts=True)
+    get_revocation_store().add(jti, exp)
+
+
+class RevocableRefreshToken(ClaimsRefreshToken):
+    """
+    Refresh token checked against the in-memory revocation store.
+    """
+
+    def check_blacklist(self):
+        if get_revocation_store().is_revoked(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError(_("Token is blacklisted"))
+
+    def blacklist(self):
+        blacklist_token(self.payload[api_settings.JTI_CLAIM], self.payload['exp'], str(self))
+
+
+def prune_tokens(batch_size=None, now=None):
+    """
+    Delete expired outstanding tokens and their blacklist entries in
+    batches, so no single statement holds the database for long. Returns
+    the number of outstanding tokens deleted.
+    """
+    batch_size = batch_size or get_revocation_settings()['PRUNE_BATCH_SIZE']
+    now = now or timezone.now()
+    deleted = 0
+    while True:
+        ids = list(OutstandingToken.objects.filter(expires_at__lte=now).values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        BlacklistedToken.objects.filter(token_id__in=ids).delete()
+        OutstandingToken.objects.filter(pk__in=ids).delete()
+        deleted += len(ids)
@@ -1,8 +1,12 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
 from rest_framework.validators import UniqueValidator
 from django.contrib.auth.password_validation import validate_password
+from .authentication import VERSION_CLAIM, get_token_version
+from .revocation import RevocableRefreshToken
 
 User = get_user_model()
 
@@ -31,6 +35,11 @@ class RegisterSerializer(serializers.ModelSerializer):
             'role': {'required': True}
         }
 
+    def validate_role(self, value):
+        if value == 'student':
+            raise serializers.ValidationError("Student accounts are created through the student import.")
+        return value
+
     def validate(self, attrs):
         if attrs['password'] != attrs['password2']:
             raise serializers.ValidationError(
@@ -53,6 +62,8 @@ class RegisterSerializer(serializers.ModelSerializer):
         return user
 
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = RevocableRefreshToken
+
     def validate(self, attrs):
         data = super().validate(attrs)
         refresh = self.get_token(self.user)
@@ -69,3 +80,16 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
             'is_verified': self.user.is_verified,
         }
         return data
+
+class CustomTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Refuses refresh tokens issued before the user's tokens were revoked,
+    since the access tokens they mint would carry stale claims.
+    """
+    token_class = RevocableRefreshToken
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        if refresh.get(VERSION_CLAIM, 0) != get_token_version(refresh[api_settings.USER_ID_CLAIM]):
+            raise InvalidToken("Token has been revoked")
+        return super().validate(attrs)
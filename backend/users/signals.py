@@ -1,7 +1,8 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, pre_save
 from django.dispatch import receiver
 from django.contrib.auth import get_user_model
 from core.models import Student
+from .authentication import TOKEN_FIELDS, revoke_tokens
 
 User = get_user_model()
 
@@ -16,3 +17,30 @@ def create_or_update_user_profile(sender, instance, created, **kwargs):
         else:
             # Ensure the student profile exists
             Student.objects.get_or_create(user=instance)
+
+@receiver(pre_save, sender=User)
+def remember_token_fields(sender, instance, raw=False, update_fields=None, **kwargs):
+    """
+    Remember the token fields as stored, from the values the instance was
+    loaded or last saved with when it has them and from the database otherwise.
+    """
+    instance._previous_token_fields = None
+    if instance.pk and not raw and (update_fields is None or set(update_fields) & set(TOKEN_FIELDS)):
+        loaded = getattr(instance, '_loaded_values', {})
+        if all(field in loaded for field in TOKEN_FIELDS):
+            instance._previous_token_fields = {field: loaded[field] for field in TOKEN_FIELDS}
+        else:
+            instance._previous_token_fields = User.objects.filter(pk=instance.pk).values(*TOKEN_FIELDS).first()
+
+@receiver(post_save, sender=User)
+def revoke_tokens_on_credential_change(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Revoke the user's tokens when a field their claims are built from, or
+    their password, changes.
+    """
+    previous = getattr(instance, '_previous_token_fields', None)
+    if previous and any(previous[field] != getattr(instance, field) for field in TOKEN_FIELDS):
+        revoke_tokens(instance)
+    if hasattr(instance, '_loaded_values'):
+        saved = TOKEN_FIELDS if update_fields is None else set(TOKEN_FIELDS) & set(update_fields)
+        instance._loaded_values.update((field, getattr(instance, field)) for field in saved)
@@ -0,0 +1,75 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+from .authentication import ClaimsRefreshToken
+from .models import User
+from .revocation import RevocableRefreshToken, get_revocation_store
+
+
+class TokenRevocationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        get_revocation_store().clear()
+        self.user = User.objects.create_user(
+            email='parent@example.com', password='Secret-pass-123', first_name='P', last_name='One', role='parent'
+        )
+
+    def refresh(self, token):
+        return APIClient().post('/api/auth/refresh/', {'refresh': str(token)}, format='json')
+
+    def test_refresh_rotates_and_blacklists_the_old_token(self):
+        token = RevocableRefreshToken.for_user(self.user)
+        response = self.refresh(token)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(BlacklistedToken.objects.filter(token__jti=token['jti']).exists())
+        self.assertEqual(self.refresh(token).status_code, 401)
+
+    def test_token_revoked_by_another_worker_is_refused(self):
+        token = RevocableRefreshToken.for_user(self.user)
+        token.blacklist()
+        # Another worker has neither the id in memory nor a shared cache marker.
+        get_revocation_store().clear()
+        cache.clear()
+        self.assertTrue(get_revocation_store().is_revoked(token['jti']))
+        self.assertEqual(self.refresh(token).status_code, 401)
+
+    def test_unrevoked_token_is_accepted_after_a_database_check(self):
+        token = RevocableRefreshToken.for_user(self.user)
+        self.assertFalse(get_revocation_store().is_revoked(token['jti']))
+
+    def test_password_change_revokes_access_tokens(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {ClaimsRefreshToken.for_user(self.user).access_token}')
+        self.assertEqual(client.get('/api/users/me/').status_code, 200)
+        self.user.set_password('Another-pass-456')
+        self.user.save()
+        response = client.get('/api/users/me/')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.data['code'], 'token_revoked')
+
+    def test_saving_a_loaded_user_compares_without_a_query(self):
+        user = User.objects.get(pk=self.user.pk)
+        version = user.token_version
+        with CaptureQueriesContext(connection) as queries:
+            user.save()
+        self.assertFalse([query for query in queries if query['sql'].startswith('SELECT "users_user"')])
+        self.assertEqual(user.token_version, version)
+        user.set_password('Another-pass-456')
+        user.save()
+        user.set_password('Third-pass-789')
+        user.save()
+        self.assertEqual(user.token_version, version + 2)
+
+
+class RegistrationTests(TestCase):
+    def test_students_cannot_register_themselves(self):
+        response = APIClient().post('/api/auth/register/', {
+            'email': 'student@example.com', 'password': 'Secret-pass-123', 'password2': 'Secret-pass-123',
+            'first_name': 'S', 'last_name': 'One', 'role': 'student',
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('role', response.data)
@@ -2,14 +2,16 @@ from rest_framework import generics, status
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.views import APIView
-from rest_framework_simplejwt.views import TokenObtainPairView
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+
+from .revocation import RevocableRefreshToken
 
 from .models import User
 from .serializers import (
     UserSerializer,
     RegisterSerializer,
-    CustomTokenObtainPairSerializer
+    CustomTokenObtainPairSerializer,
+    CustomTokenRefreshSerializer
 )
 
 class UserRegistrationView(generics.CreateAPIView):
@@ -26,7 +28,7 @@ class UserRegistrationView(generics.CreateAPIView):
         user = serializer.save()
         
         # Generate tokens for the new user
-        refresh = RefreshToken.for_user(user)
+        refresh = RevocableRefreshToken.for_user(user)
         tokens = {
             'refresh': str(refresh),
             'access': str(refresh.access_token),
@@ -43,6 +45,12 @@ class CustomTokenObtainPairView(TokenObtainPairView):
     """
     serializer_class = CustomTokenObtainPairSerializer
 
+class CustomTokenRefreshView(TokenRefreshView):
+    """
+    Token refresh view that rejects refresh tokens of revoked users.
+    """
+    serializer_class = CustomTokenRefreshSerializer
+
 class UserProfileView(generics.RetrieveUpdateAPIView):
     """
     View to retrieve or update the current user's profile.
@@ -51,7 +59,8 @@ class UserProfileView(generics.RetrieveUpdateAPIView):
     permission_classes = [IsAuthenticated]
 
     def get_object(self):
-        return self.request.user
+        # request.user only carries the token's claims; load the full row.
+        return User.objects.get(pk=self.request.user.pk)
 
 class LogoutView(APIView):
     """
@@ -62,7 +71,7 @@ class LogoutView(APIView):
     def post(self, request):
         try:
             refresh_token = request.data["refresh"]
-            token = RefreshToken(refresh_token)
+            token = RevocableRefreshToken(refresh_token)
             token.blacklist()
             return Response(status=status.HTTP_205_RESET_CONTENT)
         except Exception as e:
@@ -77,7 +86,7 @@ class ChangePasswordView(generics.UpdateAPIView):
     model = User
 
     def get_object(self, queryset=None):
-        return self.request.user
+        return User.objects.get(pk=self.request.user.pk)
 
     def update(self, request, *args, **kwargs):
         self.object = self.get_object()